@@ -1,10 +1,84 @@
+import os
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from models.schemas import EventInput
 from services.pipeline import run_pipeline
+from services.retriever import warmup
 from modules.wbs.router import router as wbs_router
-from modules.wbs.chat_router import router as chat_router
+from modules.wbs.chat_router import router as chat_router, chat_processor
+from services.session_store import run_eviction_loop
+
+
+# Startup state reported by /ready
+startup_state = {
+    "ready": False,
+    "phase": "starting",
+    "degraded": False,
+    "timings": {},
+    "error": None,
+}
+
+WARMUP_RETRIES = int(os.getenv("WARMUP_RETRIES", "2"))
+WARMUP_RETRY_SECS = float(os.getenv("WARMUP_RETRY_SECS", "5"))
+
+
+async def _warmup_retriever():
+    """
+    Preload embedder + vector index in a worker thread, then flip the service to ready.
 
-app = FastAPI(title="Event WBS Generator API", version="2.0.0")
+    The retriever is optional (chat and WBS endpoints work without it): after
+    WARMUP_RETRIES failed retries the service still becomes ready, flagged
+    ``degraded``, and retrieval loads lazily on first use.
+    """
+    t0 = time.perf_counter()
+    startup_state["phase"] = "warming_retriever"
+    for attempt in range(WARMUP_RETRIES + 1):
+        try:
+            timings = await asyncio.to_thread(warmup)
+            startup_state["timings"] = {k: round(v, 4) for k, v in timings.items()}
+            startup_state["phase"] = "ready"
+            startup_state["degraded"] = False
+            startup_state["error"] = None
+            break
+        except Exception as e:
+            startup_state["error"] = str(e)
+            print(f"⚠️ Retriever warm-up failed (attempt {attempt + 1}/{WARMUP_RETRIES + 1}): {e}")
+            if attempt < WARMUP_RETRIES:
+                await asyncio.sleep(WARMUP_RETRY_SECS * (attempt + 1))
+    else:
+        startup_state["phase"] = "degraded"
+        startup_state["degraded"] = True
+    startup_state["ready"] = True
+    startup_state["timings"]["startup_total"] = round(time.perf_counter() - t0, 4)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = None
+    if os.getenv("WARMUP_ON_STARTUP", "1") == "1":
+        # Warm up in the background so /ready can answer (503) while loading
+        task = asyncio.create_task(_warmup_retriever())
+    else:
+        startup_state["ready"] = True
+        startup_state["phase"] = "ready"
+    # Idle chat sessions are evicted in the background, off the request path
+    evictor = asyncio.create_task(
+        run_eviction_loop(chat_processor.sessions, locks=chat_processor.session_locks)
+    )
+    yield
+    evictor.cancel()
+    chat_processor.sessions.close()
+    if chat_processor.speculator:
+        chat_processor.speculator.close()
+    if task and not task.done():
+        task.cancel()
+
+
+app = FastAPI(title="Event WBS Generator API", version="2.0.0", lifespan=lifespan)
 
 # Register routers
 app.include_router(wbs_router)
@@ -17,6 +91,15 @@ def generate_wbs_endpoint(payload: EventInput):
     return run_pipeline(data)
 
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 503 while the embedder and vector index warm up, then 200
+    (``"degraded": true`` if warm-up kept failing; retrieval is then lazy)
+    """
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=startup_state)
+
+
 @app.get("/")
 def root():
     return {
@@ -30,6 +113,7 @@ def root():
         "endpoints": {
             "traditional": "/api/wbs/generate",
             "chat": "/api/chat/message",
+            "ready": "/ready",
             "docs": "/docs"
         }
     }
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator
+from datetime import datetime
+import json
 import uuid
+import asyncio
 
 from services.chat_processor import ChatProcessor
+from services.session_store import SessionConflict
 
 router = APIRouter(prefix="/api/chat", tags=["Chat WBS"])
 
@@ -11,12 +17,81 @@ router = APIRouter(prefix="/api/chat", tags=["Chat WBS"])
 class ChatInput(BaseModel):
     message: str
     session_id: Optional[str] = None
+    # ETag of the WBS the client already holds: an identical plan is not resent
+    wbs_etag: Optional[str] = None
 
 
 # Global chat processor instance
 chat_processor = ChatProcessor()
 
 
+async def _in_session(session_id: str, func, *args, **kwargs):
+    """
+    Run a blocking processor call in the threadpool, one per session at a time
+
+    Turns queued behind a busy session wait on the event loop, not in a pool
+    thread: a burst on one session cannot exhaust the threadpool limiter.
+    """
+    async with chat_processor.session_locks.hold_async(session_id):
+        return await run_in_threadpool(func, *args, **kwargs)
+
+
+def _build_response(result: Dict[str, Any], session_id: str, wbs_etag: Optional[str] = None) -> Dict[str, Any]:
+    """Response body of a processed message (POST /message and the final stream event)"""
+    # Determine state based on result content (backward compatible)
+    state = result.get("state")
+    if not state:
+        # Check for full WBS with departments containing tasks
+        has_wbs = "departments" in result and any(result.get("departments", {}).values())
+        if has_wbs:
+            state = "planning_complete"
+        elif "extracted_info" in result:
+            state = "planning_partial"
+        else:
+            state = "conversation"
+    
+    # Build base response
+    response = {
+        "session_id": session_id,
+        "state": state,
+        "message": result.get("message", ""),
+    }
+    
+    # Add extracted info if available (both partial and complete states)
+    if "extracted_info" in result and state != "conversation":
+        response["extracted_info"] = result["extracted_info"]
+    
+    # Reference to the stored WBS; fetch it with GET /sessions/{session_id}/wbs
+    wbs_ref = result.get("wbs_ref")
+    if wbs_ref:
+        response["wbs_ref"] = wbs_ref
+    
+    if state == "planning_complete" and wbs_ref and wbs_etag == wbs_ref["etag"]:
+        # Client already has this exact plan
+        response["wbs_unchanged"] = True
+    # Add full WBS data ONLY when planning is complete
+    elif state == "planning_complete":
+        # Ensure all WBS components are present
+        if all(key in result for key in ["epics_task", "departments", "risks"]):
+            response["wbs"] = {
+                "epics_task": result["epics_task"],
+                "departments": result["departments"],  # Contains full task info
+                "risks": result["risks"],
+            }
+            
+            # Optional: Add RAG insights if available
+            if "rag_insights" in result:
+                response["rag_insights"] = result["rag_insights"]
+        elif "wbs" in result and isinstance(result["wbs"], dict):
+            # Some versions return a nested wbs object directly
+            response["wbs"] = result["wbs"]
+        else:
+            # Incomplete WBS - should not happen, but handle gracefully
+            response["state"] = "error"
+            response["error"] = "WBS generation incomplete"
+    return response
+
+
 @router.post("/message")
 async def send_message(chat_input: ChatInput) -> Dict[str, Any]:
     """
@@ -29,98 +104,207 @@ async def send_message(chat_input: ChatInput) -> Dict[str, Any]:
     - message: AI response text
     - extracted_info: Extracted event info (if state != "conversation")
     - wbs: Full WBS data with 'departments' containing full tasks (only if state == "planning_complete")
+    - wbs_ref: {event_id, version, etag} of the stored WBS (planning_complete and event queries)
+    - wbs_unchanged: true instead of 'wbs' when the plan matches chat_input.wbs_etag
     """
     try:
         # Generate session_id if not provided
         session_id = chat_input.session_id or str(uuid.uuid4())
         
-        # Process message
-        result = chat_processor.process_message(
+        # Process message in the threadpool (LLM / pipeline calls are blocking);
+        # turns of the same session are serialized before taking a thread
+        result = await _in_session(
+            session_id,
+            chat_processor.process_message,
             message=chat_input.message,
             session_id=session_id
         )
         
-        # Determine state based on result content (backward compatible)
-        state = result.get("state")
-        if not state:
-            # Check for full WBS with departments containing tasks
-            has_wbs = "departments" in result and any(result.get("departments", {}).values())
-            if has_wbs:
-                state = "planning_complete"
-            elif "extracted_info" in result:
-                state = "planning_partial"
-            else:
-                state = "conversation"
-        
-        # Build base response
-        response = {
-            "session_id": session_id,
-            "state": state,
-            "message": result.get("message", ""),
-        }
-        
-        # Add extracted info if available (both partial and complete states)
-        if "extracted_info" in result and state != "conversation":
-            response["extracted_info"] = result["extracted_info"]
-        
-        # Add full WBS data ONLY when planning is complete
-        if state == "planning_complete":
-            # Ensure all WBS components are present
-            if all(key in result for key in ["epics_task", "departments", "risks"]):
-                response["wbs"] = {
-                    "epics_task": result["epics_task"],
-                    "departments": result["departments"],  # Contains full task info
-                    "risks": result["risks"],
-                }
-                
-                # Optional: Add RAG insights if available
-                if "rag_insights" in result:
-                    response["rag_insights"] = result["rag_insights"]
-            elif "wbs" in result and isinstance(result["wbs"], dict):
-                # Some versions return a nested wbs object directly
-                response["wbs"] = result["wbs"]
-            else:
-                # Incomplete WBS - should not happen, but handle gracefully
-                response["state"] = "error"
-                response["error"] = "WBS generation incomplete"
-        
-        return response
-        
+        return _build_response(result, session_id, chat_input.wbs_etag)
+
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=f"Session đang được cập nhật, vui lòng gửi lại: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý: {str(e)}")
 
 
+# ====== Streaming (SSE / WebSocket) ======
+_STREAM_END = object()
+
+
+async def _chat_events(message: str, session_id: str, wbs_etag: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Events of one message, as they happen:
+    ack -> intent -> extracted_info -> wbs_section* -> token* -> done (same body as POST /message)
+
+    The message is processed in the threadpool (one thread per message, once
+    earlier turns of the session are done) and its emit hook feeds an asyncio
+    queue, so the first event goes out before any work starts. If the client
+    goes away the generator is closed: events stop being queued, and the turn
+    still completes and is saved (history).
+    """
+    yield {"event": "ack", "data": {"session_id": session_id, "received_at": datetime.now().isoformat()}}
+
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Any]" = asyncio.Queue()
+    closed = False
+
+    def emit(event: str, data: Any) -> None:
+        if closed:
+            return
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, {"event": event, "data": data})
+        except RuntimeError:
+            pass  # loop already closed (shutdown)
+
+    task = asyncio.ensure_future(_in_session(session_id, chat_processor.process_message, message, session_id, emit=emit))
+    task.add_done_callback(lambda _: events.put_nowait(_STREAM_END))
+    try:
+        while True:
+            event = await events.get()
+            if event is _STREAM_END:
+                break
+            yield event
+    finally:
+        closed = True
+
+    try:
+        result = task.result()
+    except Exception as e:
+        yield {"event": "error", "data": {"detail": f"Lỗi xử lý: {e}"}}
+        return
+    yield {"event": "done", "data": _build_response(result, session_id, wbs_etag)}
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    data = json.dumps(event["data"], ensure_ascii=False, default=str)
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+
+@router.post("/stream")
+async def stream_message(chat_input: ChatInput):
+    """
+    Same as POST /message, streamed as Server-Sent Events
+
+    Events: ack, intent, extracted_info, wbs_section ({section, data}),
+    token (LLM text delta), then done (POST /message body) or error.
+    """
+    session_id = chat_input.session_id or str(uuid.uuid4())
+    # Starlette stops iterating (closing the generator) when the client disconnects
+    return StreamingResponse(
+        (_sse(event) async for event in _chat_events(chat_input.message, session_id, chat_input.wbs_etag)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Persistent chat session over WebSocket
+
+    Send {"message": ..., "wbs_etag": optional}; receive the same events as
+    POST /stream as JSON frames {"event", "data"}. The session (query param
+    ``session_id`` or a new one, announced in a "session" frame) stays the
+    same for the whole connection.
+    """
+    await websocket.accept()
+    session_id = session_id or str(uuid.uuid4())
+    await websocket.send_json({"event": "session", "data": {"session_id": session_id}})
+    try:
+        while True:
+            try:
+                payload = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({"event": "error", "data": {"detail": "Invalid JSON"}})
+                continue
+            message = payload.get("message") if isinstance(payload, dict) else None
+            if not message:
+                await websocket.send_json({"event": "error", "data": {"detail": "Missing 'message'"}})
+                continue
+            async for event in _chat_events(message, session_id, payload.get("wbs_etag")):
+                await websocket.send_text(json.dumps(event, ensure_ascii=False, default=str))
+    except WebSocketDisconnect:
+        return
+
+
 @router.get("/sessions/{session_id}/history")
-async def get_conversation_history(session_id: str):
-    """Get conversation history for a session"""
+async def get_conversation_history(session_id: str, before: Optional[int] = None, limit: Optional[int] = None):
+    """
+    Get conversation history for a session, newest page first
+
+    - history: up to ``limit`` messages (default CHAT_HISTORY_PAGE), each with its ``seq``
+    - next_before: pass as ``before`` to load the previous page (null when none is left)
+    - summary: recap of older turns folded out of the verbatim history
+    """
     try:
-        history = chat_processor.get_session_history(session_id)
-        return {
-            "session_id": session_id,
-            "history": history,
-            "total_messages": len(history)
-        }
+        # Waits for an in-flight turn of this session on the event loop, then reads in the threadpool
+        page = await _in_session(session_id, chat_processor.get_session_history, session_id, before, limit)
+        return {"session_id": session_id, **page}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/sessions/{session_id}/wbs")
+async def get_event_wbs(
+    session_id: str,
+    response: Response,
+    event_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Stored WBS of an event (current event by default); 304 if If-None-Match matches its ETag"""
+    try:
+        stored = await _in_session(session_id, chat_processor.get_event_wbs, session_id, event_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    etag = f'"{stored["etag"]}"'
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return stored
 
 
 @router.delete("/sessions/{session_id}")
 async def clear_session(session_id: str):
     """Clear conversation history for a session"""
     try:
-        chat_processor.clear_session(session_id)
+        await _in_session(session_id, chat_processor.clear_session, session_id)
         return {"message": f"Session {session_id} đã được xóa"}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.get("/sessions")
-async def list_active_sessions():
-    """List all active sessions"""
-    sessions = chat_processor.list_active_sessions()
+async def list_active_sessions(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+):
+    """
+    List active sessions, most recently active first
+
+    - limit: page size; next_cursor (null on the last page) is passed back as ``cursor``
+    - updated_after / updated_before: ISO datetimes filtering by last activity
+    - total: sessions matching the filters (all pages)
+    """
+    try:
+        return await run_in_threadpool(
+            chat_processor.list_active_sessions, limit, cursor, updated_after, updated_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/metrics")
+async def session_metrics():
+    """Session store metrics (resident sessions/bytes, evictions) + intent path, lock and speculation counters"""
+    speculator = chat_processor.speculator
     return {
-        "sessions": sessions,
-        "total": len(sessions)
+        **chat_processor.sessions.metrics(),
+        "processor": dict(chat_processor.stats),
+        "session_locks": chat_processor.session_locks.metrics(),
+        "speculation": speculator.metrics() if speculator else None,
     }
 
 
@@ -0,0 +1,124 @@
+"""
+Benchmark: LLM round trips and latency per chat message, separate vs unified calls
+
+Usage:
+    python scripts/bench_chat_round_trips.py [--corpus kb/chat/messages.jsonl] [--latency-ms 250] [--jitter-ms 80]
+    python scripts/bench_chat_round_trips.py --no-local-model   # keyword rules only, no intent model
+
+Runs every corpus message through ChatProcessor twice against a local stub of
+the OpenAI client (fixed seeded latency per call, answers derived from the
+regex rules), so only the number of calls and the local work differ:
+- separate : intent classification, then extraction / general-chat / query calls
+- unified  : regex + local-model pre-filter, then at most one JSON-mode call
+Each message runs in a fresh copy of a session that already has an event
+with a WBS, so planning updates and WBS queries are both exercised.
+No request reaches the OpenAI API (OPENAI_API_KEY is ignored).
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import statistics
+from types import SimpleNamespace
+
+os.environ.pop("OPENAI_API_KEY", None)  # pipeline LLM stays off, the stub is the only "LLM"
+if "--no-local-model" in sys.argv:
+    os.environ["INTENT_MODEL_FILE"] = ""  # read at import by services/intent_classifier.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chat_processor import ChatProcessor
+from services.session_store import InMemorySessionStore
+
+
+# Answers of the stub come from the regex path of a client-less processor
+RULES = ChatProcessor(sessions=InMemorySessionStore(max_sessions=1))
+SEED_MESSAGE = "Tổ chức concert khai giảng ngày 25/12/2026 tại sảnh tòa học với 80 người, ban hậu cần, marketing, tài chính"
+
+
+# ====== Stub OpenAI client ======
+class StubLLM:
+    """chat.completions.create with a simulated network + generation delay"""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages, **kwargs):
+        self.calls += 1
+        time.sleep(max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+        system, user = messages[0]["content"], messages[-1]["content"]
+        if kwargs.get("response_format"):
+            fields = RULES._extract_with_regex(user, {})
+            if '"reply"' in system:
+                intent = ChatProcessor._classify_with_rules(user, {"current_event": "EVT-stub"})
+                content = {"intent": intent, "fields": fields, "reply": "Tôi có thể giúp bạn lập kế hoạch sự kiện."}
+            else:
+                content = fields
+            text = json.dumps(content, ensure_ascii=False)
+        else:
+            text = "Stub answer."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run(messages, unified: bool, latency_ms: float, jitter_ms: float):
+    stub = StubLLM(latency_ms, jitter_ms)
+    processor = ChatProcessor(sessions=InMemorySessionStore(max_sessions=len(messages) + 8), client=stub, unified=unified)
+    processor.process_message(SEED_MESSAGE, "seed")
+    seed = processor.sessions.get("seed")
+    stub.calls = 0
+
+    latencies, calls = [], []
+    for i, message in enumerate(messages):
+        sid = f"bench-{i}"
+        processor.sessions.save(sid, copy.deepcopy(seed))
+        before = stub.calls
+        t0 = time.perf_counter()
+        processor.process_message(message, sid)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        calls.append(stub.calls - before)
+    return latencies, calls, dict(processor.stats)
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=os.path.join(root, "kb", "chat", "messages.jsonl"))
+    parser.add_argument("--latency-ms", type=float, default=250.0, help="thời gian mỗi call của stub")
+    parser.add_argument("--jitter-ms", type=float, default=80.0)
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--no-local-model", action="store_true", help="bỏ qua kb/chat/intent_model.joblib")
+    args = parser.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        messages = [json.loads(line)["text"] for line in f if line.strip()]
+    if args.limit:
+        messages = messages[: args.limit]
+    print(f"Corpus: {len(messages)} messages, stub latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms/call")
+    print(f"Local intent model: {'off' if args.no_local_model else 'on (if trained)'}")
+
+    print(f"\n{'path':>9} | {'calls':>5} | {'calls/msg':>9} | {'0-call msgs':>11} | {'p50 ms':>8} | {'p95 ms':>8}")
+    print("-" * 66)
+    for name, unified in (("separate", False), ("unified", True)):
+        latencies, calls, stats = run(messages, unified, args.latency_ms, args.jitter_ms)
+        print(
+            f"{name:>9} | {sum(calls):>5} | {sum(calls) / len(calls):>9.2f} | {calls.count(0):>11} | "
+            f"{statistics.median(latencies):>8.1f} | {percentile(latencies, 0.95):>8.1f}"
+        )
+        print(f"{'':>9}   stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
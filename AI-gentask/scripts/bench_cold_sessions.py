@@ -0,0 +1,91 @@
+"""
+Benchmark: memory saved by cold session storage and rehydration latency
+
+Usage:
+    python scripts/bench_cold_sessions.py [--sessions 2000] [--codec zlib|zstd] [--level 3] [--dir /tmp/cold]
+
+Builds one planning session with a full WBS through ChatProcessor (templates,
+no LLM), copies it into ``--sessions`` independent sessions, then:
+- measures the Python heap held by the live sessions (tracemalloc)
+- freezes them all (InMemorySessionStore.freeze_idle) and measures again
+- rehydrates every session with get() and reports latency percentiles
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+import statistics
+import tracemalloc
+
+os.environ.pop("OPENAI_API_KEY", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chat_processor import ChatProcessor
+from services.cold_storage import ColdTier
+from services.session_store import InMemorySessionStore
+
+
+SEED_MESSAGES = [
+    "Xin chào",
+    "Tổ chức concert khai giảng ngày 25/12/2026 tại sảnh tòa học với 80 người, ban hậu cần, marketing, tài chính",
+    "có bao nhiêu task?",
+]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--codec", default="zlib")
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--dir", default="", help="thư mục lưu blob (mặc định: trong bộ nhớ)")
+    args = parser.parse_args()
+
+    processor = ChatProcessor(sessions=InMemorySessionStore(max_sessions=1, cold_after_secs=0))
+    for message in SEED_MESSAGES:
+        processor.process_message(message, "seed")
+    seed = processor.sessions.get("seed")
+
+    cold = ColdTier(codec=args.codec, level=args.level, directory=args.dir)
+    store = InMemorySessionStore(max_sessions=0, ttl_secs=0, cold_after_secs=1e-9, cold=cold)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(args.sessions):
+        store.save(f"s{i}", copy.deepcopy(seed))
+    live = tracemalloc.get_traced_memory()[0] - base
+
+    t0 = time.perf_counter()
+    frozen = store.freeze_idle()
+    freeze_secs = time.perf_counter() - t0
+    frozen_heap = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    metrics = store.metrics()
+
+    latencies = []
+    for i in range(args.sessions):
+        t0 = time.perf_counter()
+        session = store.get(f"s{i}")
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert session is not None and session["artifacts"]
+    assert session == seed
+
+    n = args.sessions
+    print(f"Sessions: {n} (codec {cold.codec} level {args.level}, blobs {'on disk' if cold.directory else 'in memory'})")
+    print(f"Live heap:          {live / n / 1024:8.1f} KB/session ({live / 2**20:.1f} MB)")
+    print(f"After freezing:     {frozen_heap / n / 1024:8.1f} KB/session ({frozen_heap / 2**20:.1f} MB, {frozen} frozen)")
+    print(f"Blob size:          {metrics['cold_bytes'] / n / 1024:8.1f} KB/session")
+    print(f"Heap saved:         {(1 - frozen_heap / live) * 100:8.1f} %")
+    print(f"Freeze:             {freeze_secs / n * 1000:8.3f} ms/session")
+    print(f"Rehydrate (get):    p50 {statistics.median(latencies):.3f} ms | p95 {percentile(latencies, 0.95):.3f} ms | max {max(latencies):.3f} ms")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
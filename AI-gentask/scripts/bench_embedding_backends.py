@@ -0,0 +1,127 @@
+"""
+Benchmark: embedding backends (torch / onnx / onnx-int8)
+
+Usage:
+    python scripts/bench_embedding_backends.py [--backends torch,onnx,onnx-int8] [--repeat 20]
+
+Each backend runs in its own subprocess so that peak RSS is measured in isolation.
+Reports single-query latency, batch throughput over the KB texts, peak RSS and
+the mean cosine similarity to the torch vectors (compatibility with the index).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = os.path.join(ROOT, "kb", "global")
+
+QUERIES = [
+    "Concert Khai Giảng concert_opening",
+    "Hội nghị AI conference",
+    "Festival Ẩm thực food_festival",
+    "Giải đấu bóng đá sport_competition",
+    "Ngày hội việc làm career_fair",
+]
+
+
+def load_kb_texts():
+    texts = []
+    for file in sorted(os.listdir(DATA_DIR)):
+        if not file.endswith(".json"):
+            continue
+        with open(os.path.join(DATA_DIR, file), "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        for t in doc.get("baseline_tasks", []):
+            texts.append(f"{t['name']} ({t['owner_department']}): {t.get('description') or t.get('notes') or ''}")
+    return texts
+
+
+def run_worker(backend: str, repeat: int, out_path: str):
+    from services.embeddings import load_embedder
+
+    t0 = time.perf_counter()
+    embedder = load_embedder(backend=backend)
+    load_s = time.perf_counter() - t0
+    embedder.encode(["warmup"])
+
+    latencies = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        embedder.encode([QUERIES[i % len(QUERIES)]])
+        latencies.append(time.perf_counter() - t)
+
+    texts = load_kb_texts() * 4
+    t = time.perf_counter()
+    embs = embedder.encode(texts, batch_size=32)
+    batch_s = time.perf_counter() - t
+
+    np.save(out_path, np.asarray(embedder.encode(QUERIES), dtype=np.float32))
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_s,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000,
+        "docs_per_s": len(texts) / batch_s if batch_s else 0.0,
+        "dimension": int(np.asarray(embs).shape[1]),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def cosine_mean(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.mean(np.sum(a * b, axis=1)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.repeat, args.out)
+        return
+
+    tmp = tempfile.mkdtemp(prefix="embed-bench-")
+    results = []
+    for backend in args.backends.split(","):
+        out = os.path.join(tmp, f"{backend}.npy")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", backend, "--repeat", str(args.repeat), "--out", out],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+            continue
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        res["vectors"] = np.load(out)
+        results.append(res)
+
+    reference = next((r["vectors"] for r in results if r["backend"] == "torch"), None)
+    print(f"{'backend':>10} | {'load s':>7} | {'p50 ms':>7} | {'p95 ms':>7} | {'docs/s':>8} | {'RSS MB':>7} | {'cos vs torch':>12}")
+    print("-" * 80)
+    for r in results:
+        cos = cosine_mean(r["vectors"], reference) if reference is not None else float("nan")
+        print(
+            f"{r['backend']:>10} | {r['load_s']:>7.2f} | {r['p50_ms']:>7.2f} | {r['p95_ms']:>7.2f} | "
+            f"{r['docs_per_s']:>8.1f} | {r['peak_rss_mb']:>7.1f} | {cos:>12.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: lexical (BM25) vs vector retrieval for keyword queries
+
+Usage:
+    python scripts/bench_lexical_index.py [--top-k 5] [--repeat 200] [--no-vector]
+
+Builds the BM25 index from kb/global in memory (same text as ingestion), then
+reports per-query latency (p50/p95) of the lexical path, the vector path
+(encode + index query) and hybrid, plus top-k overlap between lexical and vector.
+The vector path needs an ingested chroma_db and the embedding model.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest_global_chroma import iter_kb_docs
+from services.lexical_index import BM25Index
+from services import retriever
+
+
+QUERIES = [
+    "giấy phép công an",
+    "giay phep cong an",
+    "technical rider",
+    "âm thanh ánh sáng",
+    "kế hoạch truyền thông",
+    "nhà tài trợ",
+    "thiết kế key visual",
+    "an ninh bảo vệ",
+    "check-in khách mời",
+    "trọng tài giải đấu",
+]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def time_path(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            fn(q)
+            samples.append(time.perf_counter() - t0)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--no-vector", action="store_true", help="chỉ đo BM25 (không nạp model)")
+    args = parser.parse_args()
+
+    docs, metas = {}, {}
+    for doc_id, text, meta, _, _ in iter_kb_docs(workers=1):
+        docs[doc_id], metas[doc_id] = text, meta
+    t0 = time.perf_counter()
+    index = BM25Index.build(docs, metas)
+    build_ms = (time.perf_counter() - t0) * 1000
+    print(f"BM25 index: {len(index)} docs, {len(index.postings)} terms, built in {build_ms:.2f}ms")
+
+    # Dùng index vừa build thay cho file trong chroma_db
+    retriever._lexical = index
+    retriever._lexical_checked_at = float("inf")
+
+    k = args.top_k
+    results = {}
+    p50, p95 = time_path(lambda q: retriever.lexical_search(q, top_k=k, include_documents=False), args.repeat)
+    results["lexical"] = (p50, p95)
+
+    if not args.no_vector:
+        try:
+            retriever.warmup()
+        except Exception as e:
+            print(f"⚠️ Vector path unavailable ({e}); showing lexical only")
+        else:
+            vector_repeat = max(1, args.repeat // 20)
+            for mode in ("vector", "hybrid"):
+                results[mode] = time_path(
+                    lambda q: retriever.retrieve_docs({"query": q}, top_k=k, include_documents=False, mode=mode),
+                    vector_repeat,
+                )
+
+    print(f"\n{'path':>8} | {'p50 us':>10} | {'p95 us':>10}")
+    print("-" * 34)
+    for name, (p50, p95) in results.items():
+        print(f"{name:>8} | {p50 * 1e6:>10.1f} | {p95 * 1e6:>10.1f}")
+
+    if "vector" in results:
+        print(f"\nTop-{k} per query (lexical vs vector):")
+        for q in QUERIES:
+            lex = [r["doc_id"] for r in retriever.lexical_search(q, top_k=k, include_documents=False)]
+            vec = [r["doc_id"] for r in retriever.retrieve_docs({"query": q}, top_k=k, include_documents=False, mode="vector")]
+            overlap = len(set(lex) & set(vec)) / max(1, min(k, len(vec)))
+            print(f"  {q:<24} overlap {overlap:.0%}  lexical={lex[:3]}  vector={vec[:3]}")
+
+
+if __name__ == "__main__":
+    main()
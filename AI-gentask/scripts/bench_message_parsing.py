@@ -0,0 +1,292 @@
+"""
+Benchmark: per-message intent classification + regex extraction
+
+Usage:
+    python scripts/bench_message_parsing.py [--corpus kb/chat/messages.jsonl] [--repeat 50]
+
+Compares the previous approach (lists of raw patterns, re.search one by one,
+.lower() per helper) with services/message_patterns.scan_message (one
+accent-folded pass over the message), running intent classification + regex
+extraction per message as ChatProcessor does. The scan cache is cleared per
+message so every message is parsed from scratch.
+
+The corpus is also run with accents stripped ("to chuc concert ngay 25/12 voi
+80 nguoi"): fields recovered = fields equal to those extracted from the
+accented original (venue / event name excluded, they keep the typed text).
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from typing import Any, Dict
+
+from services.chat_processor import ChatProcessor
+from services.message_patterns import scan_message
+from utils.text_normalize import fold_accents
+
+
+SESSION = {"current_event": "EVT-bench"}
+FOLDED_FIELDS = ("event_type", "event_date", "headcount_total", "departments")
+PROCESSOR = ChatProcessor()
+
+
+# ====== Cách cũ (trước khi precompile): list pattern thô, re.search từng cái ======
+def legacy_classify_intent(message: str, session: Dict[str, Any]) -> str:
+    """
+    Classify user intent using LLM or rule-based
+    """
+    message_lower = message.lower().strip()
+
+    # Greeting patterns (chỉ khi message ngắn và không có info khác)
+    if len(message_lower) < 30:
+        greeting_patterns = [
+            r'^(xin chào|chào|hello|hi|hey|good morning|good afternoon)[\s!.]*$',
+            r'^(bạn là ai|bạn có thể làm gì|giới thiệu)[\s!.?]*$',
+        ]
+        if any(re.search(p, message_lower) for p in greeting_patterns):
+            return "greeting"
+
+    # Event planning patterns (ưu tiên cao)
+    planning_keywords = [
+        'tổ chức', 'sự kiện', 'event', 'concert', 'hội nghị', 'festival',
+        'khai giảng', 'khai mạc', 'bế mạc', 'opening', 'closing',
+        'ngày', 'tháng', 'địa điểm', 'venue', 'người', 'headcount',
+        'ban', 'department', 'team', 'hậu cần', 'marketing', 'chuyên môn', 'tài chính',
+        'đường 30m', 'phòng học', 'sảnh', 'tầng',
+    ]
+
+    # Đếm số keywords match
+    keyword_count = sum(1 for kw in planning_keywords if kw in message_lower)
+
+    # Nếu có ít nhất 3 keywords hoặc có date pattern → event planning
+    date_patterns = [
+        r'\d{1,2}/\d{1,2}/\d{4}',  # DD/MM/YYYY
+        r'\d{4}-\d{2}-\d{2}',       # YYYY-MM-DD
+        r'ngày \d{1,2}',            # ngày 25
+    ]
+    has_date = any(re.search(p, message_lower) for p in date_patterns)
+
+    if keyword_count >= 3 or (keyword_count >= 2 and has_date):
+        return "event_planning"
+
+    # Event query patterns
+    query_patterns = [
+        r'\b(task|công việc|deadline|tiến độ|rủi ro|risk)\b',
+        r'\b(của|trong|sự kiện|event)\b',
+        r'\b(show|xem|hiển thị|list)\b',
+    ]
+    if any(re.search(p, message_lower) for p in query_patterns) and session.get("current_event"):
+        return "event_query"
+
+    # Context switch patterns
+    switch_patterns = [
+        r'\b(chuyển sang|switch to|đổi sang|sang sự kiện)\b',
+    ]
+    if any(re.search(p, message_lower) for p in switch_patterns):
+        return "context_switch"
+
+    # Default to general chat
+    return "general_chat"
+
+
+def legacy_extract_with_regex(message: str, current_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fallback regex extraction"""
+    info = current_data.copy()
+    message_lower = message.lower()
+
+    # Extract event name (improved extraction)
+    if not info.get("event_name"):
+        # Pattern 1: "event_type + name" format
+        name_patterns = [
+            r'(concert|sự kiện|event|hội nghị|festival)\s+([^,\d]{5,40})',
+            r'(khai giảng|khai mạc|bế mạc)(?:\s+([^,\d]{0,30}))?',
+        ]
+
+        for pattern in name_patterns:
+            match = re.search(pattern, message_lower)
+            if match:
+                if match.lastindex >= 2 and match.group(2):
+                    # Has explicit name
+                    info["event_name"] = f"{match.group(1).title()} {match.group(2).strip()}"
+                else:
+                    # Just the type
+                    info["event_name"] = match.group(1).title()
+                break
+
+        # Fallback: use event_type as name
+        if not info.get("event_name") and info.get("event_type"):
+            type_names = {
+                "concert_opening": "Concert Khai Giảng",
+                "conference": "Hội nghị",
+                "food_festival": "Festival Ẩm thực",
+                "sport_competition": "Giải đấu",
+            }
+            info["event_name"] = type_names.get(info["event_type"], "Sự kiện")
+
+    # Extract event type
+    type_keywords = {
+        "concert_opening": ["concert", "show", "nhạc", "âm nhạc", "khai giảng", "khai mạc", "opening"],
+        "conference": ["hội nghị", "conference", "seminar", "workshop"],
+        "food_festival": ["festival", "lễ hội", "food", "ẩm thực"],
+        "sport_competition": ["thi đấu", "thể thao", "giải", "competition"],
+        "career_fair": ["career fair", "ngày hội việc làm", "job fair"],
+    }
+
+    for event_type, keywords in type_keywords.items():
+        if any(kw in message_lower for kw in keywords):
+            info["event_type"] = event_type
+            break
+
+    # Extract date - support both DD/MM/YYYY and YYYY-MM-DD
+    date_patterns = [
+        (r'(\d{1,2})/(\d{1,2})/(\d{4})', 'dmy'),  # DD/MM/YYYY
+        (r'(\d{4})-(\d{2})-(\d{2})', 'ymd'),      # YYYY-MM-DD
+        (r'ngày\s+(\d{1,2})[/ ](\d{1,2})[/ ](\d{4})', 'dmy'),  # ngày DD/MM/YYYY
+    ]
+
+    for pattern, date_format in date_patterns:
+        match = re.search(pattern, message_lower)
+        if match:
+            if date_format == 'dmy':
+                day, month, year = match.groups()
+                try:
+                    # Validate and convert to YYYY-MM-DD
+                    date_obj = datetime(int(year), int(month), int(day))
+                    info["event_date"] = date_obj.strftime("%Y-%m-%d")
+                    break
+                except ValueError:
+                    continue
+            elif date_format == 'ymd':
+                info["event_date"] = match.group(0)
+                break
+
+    # Extract venue
+    venue_patterns = [
+        r'(?:tại|ở|at|venue[::\s]+)([^,\d\.]+?)(?:\s*,|\s+với|\s+\d|$)',
+        r'(đường 30m|phòng học|sảnh tòa học|tầng 5 gamma)',
+    ]
+    for pattern in venue_patterns:
+        venue_match = re.search(pattern, message_lower)
+        if venue_match:
+            info["venue"] = venue_match.group(1).strip()
+            break
+
+    # Extract headcount
+    headcount_patterns = [
+        r'(\d+)\s*người',
+        r'với\s+(\d+)',
+        r'headcount[::\s]+(\d+)',
+    ]
+    for pattern in headcount_patterns:
+        headcount_match = re.search(pattern, message_lower)
+        if headcount_match:
+            info["headcount_total"] = int(headcount_match.group(1))
+            break
+
+    # Extract departments
+    dept_patterns = [
+        r'ban\s+([^,\d]+?)(?:\s*,|\s+và|\s*$)',
+        r'department[::\s]+([^,\d]+?)(?:\s*,|\s+và|\s*$)',
+    ]
+
+    # Common department names (include typos)
+    dept_keywords = {
+        "hậu cần": ["hậu cần", "hau can", "logistics", "hau can"],
+        "marketing": ["marketing", "maketing", "media", "truyền thông", "truyen thong"],  # Added "maketing" typo
+        "chuyên môn": ["chuyên môn", "chuyen mon", "technical", "kỹ thuật", "ky thuat"],
+        "tài chính": ["tài chính", "tai chinh", "finance", "tai chinh"],
+    }
+
+    found_depts = []
+    for dept_name, keywords in dept_keywords.items():
+        if any(kw in message_lower for kw in keywords):
+            # Capitalize properly
+            if dept_name == "hậu cần":
+                if "Hậu cần" not in found_depts:
+                    found_depts.append("Hậu cần")
+            elif dept_name == "marketing":
+                if "Marketing" not in found_depts:
+                    found_depts.append("Marketing")
+            elif dept_name == "chuyên môn":
+                if "Chuyên môn" not in found_depts:
+                    found_depts.append("Chuyên môn")
+            elif dept_name == "tài chính":
+                if "Tài chính" not in found_depts:
+                    found_depts.append("Tài chính")
+
+    if found_depts:
+        info["departments"] = found_depts  # Already unique
+
+    return info
+
+
+def legacy_parse(message: str):
+    intent = legacy_classify_intent(message, SESSION)
+    return intent, legacy_extract_with_regex(message, {})
+
+
+def compiled_parse(message: str):
+    scan_message.cache_clear()  # mỗi message được parse lại từ đầu
+    intent = PROCESSOR._classify_with_rules(message, SESSION)
+    return intent, PROCESSOR._extract_with_regex(message, {})
+
+
+def bench(fn, messages, repeat: int):
+    per_message = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for m in messages:
+            fn(m)
+        per_message.append((time.perf_counter() - t0) / len(messages))
+    return statistics.median(per_message), min(per_message)
+
+
+def fields_recovered(parse, messages, stripped):
+    """(fields extracted from the stripped copy as from the original, fields in the originals)"""
+    same = total = 0
+    for original, plain in zip(messages, stripped):
+        expected, got = parse(original)[1], parse(plain)[1]
+        for field in FOLDED_FIELDS:
+            if field in expected:
+                total += 1
+                same += got.get(field) == expected[field]
+    return same, total
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=os.path.join(root, "kb", "chat", "messages.jsonl"))
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        messages = [json.loads(line)["text"] for line in f if line.strip()]
+    print(f"Corpus: {len(messages)} messages")
+
+    mismatched = sum(1 for m in messages if legacy_parse(m) != compiled_parse(m))
+    print(f"Results differing from the legacy path: {mismatched}")
+
+    stripped = [fold_accents(m) for m in messages]
+    results = {}
+    for name, fn in (("legacy", legacy_parse), ("compiled", compiled_parse)):
+        results[name] = (bench(fn, messages, args.repeat), bench(fn, stripped, args.repeat), fields_recovered(fn, messages, stripped))
+
+    print(f"\n{'path':>9} | {'median us/msg':>13} | {'best us/msg':>11} | {'no accents us/msg':>17} | {'fields recovered (no accents)':>29}")
+    print("-" * 92)
+    for name, ((median, best), (plain_median, _), (same, total)) in results.items():
+        recall = f"{same}/{total} ({same / max(total, 1) * 100:.0f}%)"
+        print(f"{name:>9} | {median * 1e6:>13.1f} | {best * 1e6:>11.1f} | {plain_median * 1e6:>17.1f} | {recall:>29}")
+    print(f"\nspeedup: {results['legacy'][0][0] / results['compiled'][0][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: retrieve_docs (per event) vs retrieve_docs_batch (many events at once)
+
+Usage:
+    python scripts/bench_retrieve_batch.py [--sizes 1,4,16,64] [--top-k 12] [--repeat 5]
+
+Reports per-query cost (ms/query) against batch size for both paths.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.retriever import retrieve_docs, retrieve_docs_batch, _get_collection, _get_embedder
+
+
+EVENT_NAMES = [
+    ("Concert Khai Giảng", "concert_opening"),
+    ("Hội nghị AI & Future Tech", "conference"),
+    ("Festival Ẩm thực", "food_festival"),
+    ("Giải đấu bóng đá sinh viên", "sport_competition"),
+    ("Ngày hội việc làm IT", "career_fair"),
+    ("Workshop Data Science", "conference"),
+    ("Show âm nhạc cuối năm", "concert_opening"),
+    ("Seminar khởi nghiệp", "conference"),
+]
+
+
+def make_inputs(n: int):
+    return [
+        {"event_name": f"{EVENT_NAMES[i % len(EVENT_NAMES)][0]} #{i}", "event_type": EVENT_NAMES[i % len(EVENT_NAMES)][1]}
+        for i in range(n)
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,4,16,64")
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Load model + collection outside of the measured region
+    _get_embedder()
+    _get_collection()
+    retrieve_docs(make_inputs(1)[0], top_k=args.top_k)
+
+    print(f"{'batch':>6} | {'loop ms/query':>14} | {'batch ms/query':>15} | {'speedup':>7}")
+    print("-" * 52)
+    for size in (int(s) for s in args.sizes.split(",")):
+        inputs = make_inputs(size)
+        loop_t = timed(lambda: [retrieve_docs(e, top_k=args.top_k) for e in inputs], args.repeat)
+        batch_t = timed(lambda: retrieve_docs_batch(inputs, top_k=args.top_k), args.repeat)
+        print(
+            f"{size:>6} | {loop_t / size * 1000:>14.2f} | {batch_t / size * 1000:>15.2f} | "
+            f"{loop_t / batch_t if batch_t else 0:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: vector index backends (chroma / numpy / hnsw)
+
+Usage:
+    python scripts/bench_vector_index.py [--docs 5000] [--dim 384] [--queries 200] [--top-k 12]
+
+Builds every backend from the same synthetic vectors + metadata (the real KB
+is too small to show differences) and reports, per backend:
+recall@k against exact float64 search, median/p95 latency, and memory
+(index size on disk and RSS growth while opening it).
+Filtered queries use the same where clause on every backend.
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import statistics
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vector_index import ChromaIndex, NumpyIndex, HnswIndex, build_index_dir, match_where
+
+
+EVENT_TYPES = ["concert_opening", "conference", "food_festival", "sport_competition", "career_fair"]
+
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / (1024 * 1024)
+
+
+def make_data(n: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # Clustered vectors look more like real embeddings than uniform noise
+    centers = rng.normal(size=(32, dim))
+    embs = centers[rng.integers(0, 32, n)] + 0.3 * rng.normal(size=(n, dim))
+    ids = [f"doc-{i}" for i in range(n)]
+    metas = [
+        {
+            "event_type_primary": EVENT_TYPES[i % len(EVENT_TYPES)],
+            "tag_outdoor": bool(rng.random() < 0.4),
+            "tag_vip": bool(rng.random() < 0.2),
+            "tag_sponsor": bool(rng.random() < 0.5),
+        }
+        for i in range(n)
+    ]
+    docs = [f"synthetic doc {i}" for i in range(n)]
+    queries = centers[rng.integers(0, 32, 1000)] + 0.3 * rng.normal(size=(1000, dim))
+    return ids, embs.astype(np.float32), metas, docs, queries.astype(np.float32)
+
+
+def ground_truth(embs, metas, queries, k, where):
+    e = embs.astype(np.float64)
+    e /= np.linalg.norm(e, axis=1, keepdims=True)
+    q = queries.astype(np.float64)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    allowed = np.array([match_where(m, where) for m in metas])
+    sims = q @ e.T
+    sims[:, ~allowed] = -np.inf
+    return [set(np.argsort(-row)[:k].tolist()) for row in sims]
+
+
+def run(index, ids, queries, k, where, truth):
+    pos = {doc_id: i for i, doc_id in enumerate(ids)}
+    latencies, recalls = [], []
+    for qi, q in enumerate(queries):
+        t = time.perf_counter()
+        res = index.query(q[None, :], n_results=k, where=where, include=["metadatas", "distances"])
+        latencies.append(time.perf_counter() - t)
+        got = {pos[d] for d in res["ids"][0]}
+        recalls.append(len(got & truth[qi]) / max(1, len(truth[qi])))
+    latencies.sort()
+    return statistics.mean(recalls), statistics.median(latencies) * 1000, latencies[int(0.95 * (len(latencies) - 1))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=12)
+    args = parser.parse_args()
+
+    ids, embs, metas, docs, queries = make_data(args.docs, args.dim)
+    queries = queries[: args.queries]
+    tmp = tempfile.mkdtemp(prefix="vector-bench-")
+    index_dir = os.path.join(tmp, "index")
+    chroma_dir = os.path.join(tmp, "chroma")
+    build_index_dir(index_dir, ids, embs, metas, docs, hnsw=True)
+
+    def open_chroma():
+        os.environ.setdefault("ANONYMIZED_TELEMETRY", "false")
+        import chromadb
+
+        col = chromadb.PersistentClient(path=chroma_dir).get_or_create_collection(
+            "bench", metadata={"hnsw:space": "cosine"}
+        )
+        if col.count() == 0:
+            for start in range(0, len(ids), 1000):
+                end = start + 1000
+                col.add(ids=ids[start:end], embeddings=embs[start:end], metadatas=metas[start:end], documents=docs[start:end])
+        return ChromaIndex(col)
+
+    backends = [
+        ("numpy", lambda: NumpyIndex(index_dir), index_dir),
+        ("hnsw", lambda: HnswIndex(index_dir), index_dir),
+        ("chroma", open_chroma, chroma_dir),
+    ]
+    filters = [("no filter", None), ("outdoor+vip", {"$and": [{"tag_outdoor": True}, {"tag_vip": True}]})]
+
+    print(f"{args.docs} docs x {args.dim} dims, {len(queries)} queries, k={args.top_k}")
+    print(f"{'backend':>8} | {'filter':>12} | {'recall@k':>8} | {'p50 ms':>7} | {'p95 ms':>7} | {'disk MB':>7} | {'+RSS MB':>7}")
+    print("-" * 76)
+    for name, factory, path in backends:
+        before = rss_mb()
+        try:
+            index = factory()
+        except ImportError as e:
+            print(f"{name:>8} | skipped ({e})")
+            continue
+        index.query(queries[:1], n_results=args.top_k)
+        grown = rss_mb() - before
+        for label, where in filters:
+            truth = ground_truth(embs, metas, queries, args.top_k, where)
+            recall, p50, p95 = run(index, ids, queries, args.top_k, where, truth)
+            print(f"{name:>8} | {label:>12} | {recall:>8.3f} | {p50:>7.3f} | {p95:>7.3f} | {dir_size_mb(path):>7.1f} | {grown:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
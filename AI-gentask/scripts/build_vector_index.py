@@ -0,0 +1,30 @@
+"""
+Export the Chroma collection into an index directory for VECTOR_BACKEND=numpy / hnsw
+
+Usage:
+    python scripts/build_vector_index.py [--out ./vector_index] [--no-hnsw]
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.retriever import _get_collection
+from services.vector_index import VECTOR_INDEX_DIR, export_collection
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--no-hnsw", action="store_true", help="only write embeddings.npy + records.json")
+    args = parser.parse_args()
+
+    print(f"Exporting collection to '{args.out}'...")
+    built = export_collection(_get_collection(), args.out, hnsw=not args.no_hnsw)
+    print(f"Done: {built['count']} vectors, dimension {built['dimension']}, hnsw={built['hnsw']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
-import os, json
-from sentence_transformers import SentenceTransformer
+import os, sys, json, time, hashlib, argparse
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import chromadb
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embeddings import EMBED_BACKEND, load_embedder, embedding_info, write_embedding_info
+from services.vector_index import VECTOR_BACKEND, VECTOR_INDEX_DIR, bump_generation, publish_generation
+from services.lexical_index import BM25_FILE, BM25Writer
+
 # ====== Cấu hình ======
 DATA_DIR = "./kb/global"        # Thư mục chứa các file JSON tài liệu (đã sửa để khớp repo)
 CHROMA_DIR = "./chroma_db"           # Thư mục lưu vector database
 COLLECTION_NAME = "global_kb"        # Tên collection trong Chroma
+MANIFEST_FILE = "ingest_manifest.json"  # Hash nội dung từng doc_id đã ingest (trong CHROMA_DIR)
 EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))          # Số doc mỗi lần encode + upsert
+PARSE_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))  # Process parse JSON song song
+CHECKPOINT_SECS = float(os.getenv("INGEST_CHECKPOINT_SECS", "5"))  # Chu kỳ tối thiểu ghi manifest
+PARSE_CHUNK = 16  # Số file mỗi task gửi sang process con
 
 
 # ====== Chuẩn bị ChromaDB và Embedder ======
@@ -18,8 +32,8 @@ def get_chroma_collection():
 
 
 def get_embedder():
-    os.environ.setdefault("USE_TF", "0")
-    return SentenceTransformer(EMBED_MODEL)
+    # Backend (torch / onnx / onnx-int8) chọn qua EMBED_BACKEND
+    return load_embedder(EMBED_MODEL, EMBED_BACKEND)
 
 
 # ====== Hàm xử lý ======
@@ -28,56 +42,285 @@ def build_metadata(doc: dict):
     ctx_tags = doc.get("context_tags", [])
     etypes = doc.get("event_type", [])
 
-    return {
+    meta = {
         "event_type_primary": etypes[0] if etypes else "",
         "tag_vip": "vip" in ctx_tags,
         "tag_sponsor": "sponsor" in ctx_tags,
         "tag_outdoor": "outdoor" in ctx_tags,
     }
+    # Chroma không nhận None trong metadata -> chỉ thêm event_id khi tài liệu có
+    if doc.get("event_id"):
+        meta["event_id"] = str(doc["event_id"])
+    return meta
 
 
-def ingest():
-    print("Starting KB ingestion...")
-    embedder = get_embedder()
-    col = get_chroma_collection()
+def build_text(doc: dict) -> str:
+    """Convert baseline_tasks to text"""
+    text_parts = []
+    for t in doc.get("baseline_tasks", []):
+        description = t.get('description') or t.get('notes') or 'No description'
+        text_parts.append(f"{t['name']} ({t['owner_department']}): {description}")
+    return "\n".join(text_parts)
 
-    all_docs, all_ids, all_metas, all_embs = [], [], [], []
 
-    # ====== Read JSON files ======
-    for file in os.listdir(DATA_DIR):
-        if not file.endswith(".json"):
-            continue
-        path = os.path.join(DATA_DIR, file)
-        with open(path, "r", encoding="utf-8") as f:
-            doc = json.load(f)
+def content_hash(text: str, meta: dict) -> str:
+    """Hash của mọi thứ ảnh hưởng tới vector/metadata (đổi model -> embed lại toàn bộ)"""
+    payload = json.dumps({"model": EMBED_MODEL, "text": text, "meta": meta}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 
+def parse_kb_file(file: str):
+    """Đọc 1 file JSON -> (doc_id, text, meta, hash, source). Chạy được trong process con."""
+    try:
+        with open(os.path.join(DATA_DIR, file), "r", encoding="utf-8") as f:
+            doc = json.load(f)
         doc_id = doc.get("doc_id") or os.path.splitext(file)[0]
         meta = build_metadata(doc)
+        text = build_text(doc)
+    except Exception as e:
+        # File hỏng / đang ghi dở / thiếu trường: báo kèm tên file
+        raise ValueError(f"{file}: {type(e).__name__}: {e}") from e
+    return doc_id, text, meta, content_hash(text, meta), file
+
 
-        # Convert baseline_tasks to text
-        tasks = doc.get("baseline_tasks", [])
-        text_parts = []
-        for t in tasks:
-            description = t.get('description') or t.get('notes') or 'No description'
-            part = f"{t['name']} ({t['owner_department']}): {description}"
-            text_parts.append(part)
-        text_join = "\n".join(text_parts)
+def parse_kb_chunk(files: list) -> list:
+    return [parse_kb_file(file) for file in files]
 
-        all_ids.append(doc_id)
-        all_docs.append(text_join)
-        all_metas.append(meta)
 
-    # ====== Create embeddings ======
-    print(f"Creating embeddings for {len(all_docs)} documents...")
-    all_embs = embedder.encode(all_docs, show_progress_bar=True).tolist()
+def iter_kb_docs(workers: int = PARSE_WORKERS):
+    """Stream các doc trong DATA_DIR, parse song song nhiều process khi KB đủ lớn"""
+    files = sorted(f for f in os.listdir(DATA_DIR) if f.endswith(".json"))
+    if workers <= 1 or len(files) < 4 * workers:
+        yield from map(parse_kb_file, files)
+        return
+    chunks = (files[i:i + PARSE_CHUNK] for i in range(0, len(files), PARSE_CHUNK))
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # Cửa sổ trượt 2×workers task, giữ thứ tự: khi embed chậm hơn parse, bộ nhớ
+        # chỉ giữ tối đa 2×workers×PARSE_CHUNK doc (pool.map submit mọi file ngay từ đầu
+        # nên kết quả dồn lại không giới hạn)
+        window = deque(pool.submit(parse_kb_chunk, chunk) for chunk in islice(chunks, 2 * workers))
+        while window:
+            docs = window.popleft().result()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                window.append(pool.submit(parse_kb_chunk, chunk))
+            yield from docs
+    finally:
+        # Dừng giữa chừng (lỗi parse/embed): bỏ các task chưa chạy
+        pool.shutdown(cancel_futures=True)
+
+
+def load_manifest() -> dict:
+    try:
+        with open(os.path.join(CHROMA_DIR, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"docs": {}}
+
+
+def save_manifest(manifest: dict):
+    # Ghi ra file tạm rồi os.replace để không bao giờ để lại manifest hỏng
+    path = os.path.join(CHROMA_DIR, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def ingest(
+    full: bool = False,
+    batch_size: int = BATCH_SIZE,
+    workers: int = PARSE_WORKERS,
+    checkpoint_secs: float = CHECKPOINT_SECS,
+):
+    """
+    Ingest tăng dần, dạng streaming với bộ nhớ giới hạn:
+    - parse JSON song song, chỉ giữ text của batch hiện tại
+    - encode từng batch (float32 numpy, không .tolist()) rồi upsert ngay
+    - manifest là checkpoint: doc chỉ được ghi vào manifest sau khi đã upsert,
+      nên chạy lại sau khi bị ngắt sẽ tiếp tục từ chỗ dừng
+    Chỉ embed doc mới/đổi nội dung, xóa vector của doc đã bị xóa. full=True embed lại toàn bộ.
+    checkpoint_secs=inf: chỉ ghi manifest khi lượt ingest thành công.
+    """
+    print("Starting KB ingestion...")
+    t0 = time.perf_counter()
+    manifest = load_manifest()
+    known = manifest.get("docs", {})
+    # full=True: bắt đầu lại từ manifest rỗng (vẫn checkpoint theo batch)
+    done = {} if full else dict(known)
+    manifest["docs"] = done
+    manifest["embed_model"] = EMBED_MODEL
+
+    stats = {"added": [], "updated": [], "removed": [], "unchanged": 0, "embedded": 0, "embed_s": 0.0}
+    state = {"col": None, "embedder": None, "last_checkpoint": time.perf_counter()}
 
-    # ====== Upsert to Chroma ======
-    print(f"Upserting to collection '{COLLECTION_NAME}'...")
-    col.upsert(ids=all_ids, documents=all_docs, metadatas=all_metas, embeddings=all_embs)
+    def collection():
+        if state["col"] is None:
+            state["col"] = get_chroma_collection()
+        return state["col"]
 
+    def checkpoint(force: bool = False):
+        if force or time.perf_counter() - state["last_checkpoint"] >= checkpoint_secs:
+            manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            save_manifest(manifest)
+            state["last_checkpoint"] = time.perf_counter()
+
+    def flush(batch):
+        if not batch:
+            return
+        if state["embedder"] is None:
+            # Chỉ nạp model khi thực sự có tài liệu cần embed
+            state["embedder"] = get_embedder()
+        t = time.perf_counter()
+        embs = np.asarray(state["embedder"].encode([b[1] for b in batch], batch_size=batch_size), dtype=np.float32)
+        collection().upsert(
+            ids=[b[0] for b in batch],
+            documents=[b[1] for b in batch],
+            metadatas=[b[2] for b in batch],
+            embeddings=embs,
+        )
+        stats["embed_s"] += time.perf_counter() - t
+        stats["embedded"] += len(batch)
+        for doc_id, _, _, h, source in batch:
+            done[doc_id] = {"hash": h, "source": source}
+        checkpoint()
+        elapsed = time.perf_counter() - t0
+        print(f"  upserted {stats['embedded']} docs ({stats['embedded'] / elapsed:.1f} docs/s)")
+
+    seen = set()
+    batch = []
+    parsed = 0
+    # BM25 rebuild rẻ (không cần model) -> mọi doc, kể cả doc không đổi, được stream vào
+    # BM25Writer (text ghi ra file tạm, không giữ trong bộ nhớ); chỉ lưu nếu cần ở cuối
+    with BM25Writer() as lexical:
+        for doc_id, text, meta, h, source in iter_kb_docs(workers):
+            parsed += 1
+            if doc_id in seen:
+                print(f"⚠️ Duplicate doc_id '{doc_id}' in {source}, skipped")
+                continue
+            seen.add(doc_id)
+            lexical.add(doc_id, text, meta)
+            if doc_id in done and done[doc_id].get("hash") == h:
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if doc_id in known else "added"].append(doc_id)
+            batch.append((doc_id, text, meta, h, source))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        flush(batch)
+        parse_s = time.perf_counter() - t0
+
+        removed = [d for d in known if d not in seen]
+        for i in range(0, len(removed), batch_size):
+            chunk = removed[i:i + batch_size]
+            collection().delete(ids=chunk)
+            for doc_id in chunk:
+                done.pop(doc_id, None)
+        stats["removed"] = removed
+
+        if state["embedder"] is not None:
+            # Ghi lại model/dimension để retriever phát hiện embedder không tương thích
+            write_embedding_info(CHROMA_DIR, embedding_info(state["embedder"], EMBED_MODEL, EMBED_BACKEND))
+        checkpoint(force=True)
+
+        if stats["embedded"] or removed or not os.path.exists(os.path.join(CHROMA_DIR, BM25_FILE)):
+            t = time.perf_counter()
+            lexical.save(CHROMA_DIR)
+            print(f"Saved lexical (BM25) index over {len(lexical)} docs in {(time.perf_counter() - t) * 1000:.1f}ms.")
+
+    if stats["embedded"] or removed:
+        # Báo cho các worker API đang chạy: có thế hệ index mới -> swap + xóa cache
+        generation = bump_generation(CHROMA_DIR)
+        if VECTOR_BACKEND in ("numpy", "hnsw"):
+            publish_generation(collection(), VECTOR_INDEX_DIR, generation, hnsw=VECTOR_BACKEND == "hnsw")
+        print(f"Published index generation {generation}.")
+
+    total_s = time.perf_counter() - t0
     print("Ingestion completed!")
-    print(f"Total: {len(all_ids)} documents added.")
+    print(f"  added:     {len(stats['added'])} {stats['added'][:10]}")
+    print(f"  updated:   {len(stats['updated'])} {stats['updated'][:10]}")
+    print(f"  removed:   {len(removed)} {removed[:10]}")
+    print(f"  unchanged: {stats['unchanged']}")
+    print(
+        f"Total: {parsed} documents in {total_s:.2f}s "
+        f"({parsed / total_s if total_s else 0:.1f} docs/s parsed, "
+        f"{stats['embedded'] / stats['embed_s'] if stats['embed_s'] else 0:.1f} docs/s embedded+upserted, "
+        f"parse+embed {parse_s:.2f}s)."
+    )
+    return {
+        "added": stats["added"],
+        "updated": stats["updated"],
+        "removed": removed,
+        "unchanged": stats["unchanged"],
+    }
+
+
+def kb_signature() -> dict:
+    """(mtime, size) của từng file JSON -> phát hiện thay đổi khi polling"""
+    sig = {}
+    for file in os.listdir(DATA_DIR):
+        if file.endswith(".json"):
+            try:
+                st = os.stat(os.path.join(DATA_DIR, file))
+            except FileNotFoundError:
+                continue  # bị xóa giữa listdir và stat
+            sig[file] = (st.st_mtime_ns, st.st_size)
+    return sig
+
+
+def watch(interval: float = 2.0, batch_size: int = BATCH_SIZE, workers: int = PARSE_WORKERS):
+    """
+    Theo dõi DATA_DIR và ingest tăng dần mỗi khi có file thêm/sửa/xóa.
+    Dùng watchfiles (inotify, có sẵn trong uvicorn[standard]) nếu cài, nếu không thì polling.
+    Lượt ingest lỗi (JSON hỏng, file đang ghi dở...) không dừng watch: manifest và
+    thế hệ index giữ nguyên, lượt sau (tick kế tiếp) thử lại.
+    """
+    def ingest_pass() -> bool:
+        try:
+            # Không checkpoint giữa chừng: lượt lỗi để manifest như cũ (upsert lại là idempotent)
+            ingest(batch_size=batch_size, workers=workers, checkpoint_secs=float("inf"))
+            return True
+        except Exception as e:
+            print(f"⚠️ Ingest failed, retrying on next tick: {e}")
+            return False
+
+    pending = not ingest_pass()
+    print(f"Watching '{DATA_DIR}' for changes (Ctrl+C to stop)...")
+    try:
+        from watchfiles import watch as watch_changes
+    except ImportError:
+        watch_changes = None
+
+    try:
+        if watch_changes is not None:
+            # yield_on_timeout: có tick rỗng định kỳ để thử lại lượt lỗi kể cả khi không có thay đổi mới
+            for changes in watch_changes(
+                DATA_DIR, step=int(interval * 1000), rust_timeout=int(interval * 1000), yield_on_timeout=True
+            ):
+                if pending or any(path.endswith(".json") for _, path in changes):
+                    pending = not ingest_pass()
+        else:
+            previous = None if pending else kb_signature()
+            while True:
+                time.sleep(interval)
+                current = kb_signature()
+                if current != previous and ingest_pass():
+                    previous = current
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
 
 if __name__ == "__main__":
-    ingest()
+    parser = argparse.ArgumentParser(description="Ingest kb/global into Chroma")
+    parser.add_argument("--full", action="store_true", help="embed lại toàn bộ, bỏ qua manifest")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--watch", action="store_true", help="theo dõi kb/global và ingest khi có thay đổi")
+    parser.add_argument("--interval", type=float, default=2.0, help="chu kỳ polling/debounce (giây) cho --watch")
+    args = parser.parse_args()
+    if args.watch:
+        watch(interval=args.interval, batch_size=args.batch_size, workers=args.workers)
+    else:
+        ingest(full=args.full, batch_size=args.batch_size, workers=args.workers)
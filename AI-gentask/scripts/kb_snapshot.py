@@ -0,0 +1,102 @@
+"""
+Export / import the KB as a portable embedding snapshot
+
+Usage:
+    python scripts/kb_snapshot.py export [--out ./kb_snapshot] [--shard-size 4096]
+    python scripts/kb_snapshot.py import [--src ./kb_snapshot] [--no-verify]
+
+export: Chroma collection -> sharded .npy + records.json + manifest.json
+import: snapshot -> Chroma collection + ingest manifest (no embedding model needed)
+
+A node can also serve a snapshot directly, without Chroma:
+    VECTOR_BACKEND=numpy VECTOR_INDEX_DIR=./kb_snapshot
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest_global_chroma import CHROMA_DIR, get_chroma_collection, load_manifest, save_manifest
+from services.embeddings import EMBED_MODEL, EMBED_BACKEND, read_embedding_info, write_embedding_info
+from services.snapshot import SNAPSHOT_SHARD_SIZE, export_snapshot, read_snapshot
+from services.vector_index import bump_generation
+from services.lexical_index import BM25Writer
+
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./kb_snapshot")
+
+
+def cmd_export(out_dir: str, shard_size: int):
+    t0 = time.perf_counter()
+    col = get_chroma_collection()
+    info = read_embedding_info(CHROMA_DIR) or {"model": EMBED_MODEL, "backend": EMBED_BACKEND}
+    hashes = {d: v.get("hash", "") for d, v in load_manifest().get("docs", {}).items()}
+    manifest = export_snapshot(col, out_dir, info, doc_hashes=hashes, shard_size=shard_size)
+    print(
+        f"Exported {manifest['count']} docs ({manifest['model']}, dim {manifest['dimension']}) "
+        f"in {len(manifest['shards'])} shards to '{out_dir}' in {time.perf_counter() - t0:.2f}s."
+    )
+
+
+def cmd_import(src_dir: str, verify: bool):
+    t0 = time.perf_counter()
+    manifest, shards = read_snapshot(src_dir, verify=verify)
+    col = get_chroma_collection()
+
+    imported = set()
+    lexical = BM25Writer()  # BM25 index streamed shard by shard (texts spooled to a temp file)
+    for ids, embs, metas, docs in shards:
+        col.upsert(ids=ids, embeddings=embs, metadatas=metas, documents=docs)
+        for doc_id, doc, meta in zip(ids, docs, metas):
+            if doc_id not in imported:
+                lexical.add(doc_id, doc, meta)
+        imported.update(ids)
+        print(f"  upserted {len(imported)}/{manifest['count']}")
+
+    # Collection mirrors the snapshot: drop docs the snapshot does not have
+    stale = [d for d in col.get(include=[])["ids"] if d not in imported]
+    if stale:
+        col.delete(ids=stale)
+
+    # Keep incremental ingestion consistent with what was imported
+    ingest_manifest = load_manifest()
+    ingest_manifest["docs"] = {
+        d: {"hash": h, "source": "snapshot"} for d, h in manifest.get("doc_hashes", {}).items() if h
+    }
+    ingest_manifest["embed_model"] = manifest.get("model")
+    save_manifest(ingest_manifest)
+    write_embedding_info(
+        CHROMA_DIR,
+        {"model": manifest.get("model"), "backend": manifest.get("backend"), "dimension": manifest.get("dimension")},
+    )
+    with lexical:
+        lexical.save(CHROMA_DIR)
+    generation = bump_generation(CHROMA_DIR)
+    print(
+        f"Imported {len(imported)} docs (removed {len(stale)} stale) from '{src_dir}' "
+        f"in {time.perf_counter() - t0:.2f}s, index generation {generation}."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KB embedding snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export")
+    p_export.add_argument("--out", default=SNAPSHOT_DIR)
+    p_export.add_argument("--shard-size", type=int, default=SNAPSHOT_SHARD_SIZE)
+    p_import = sub.add_parser("import")
+    p_import.add_argument("--src", default=SNAPSHOT_DIR)
+    p_import.add_argument("--no-verify", action="store_true", help="skip shard sha256 checks")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        cmd_export(args.out, args.shard_size)
+    else:
+        cmd_import(args.src, verify=not args.no_verify)
+
+
+if __name__ == "__main__":
+    main()
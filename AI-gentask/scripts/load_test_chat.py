@@ -0,0 +1,128 @@
+"""
+Load test: concurrent chat sessions, checks that no turn is lost
+
+Usage:
+    python scripts/load_test_chat.py [--sessions 2000] [--clients 64]
+    python scripts/load_test_chat.py --url http://localhost:8000    # running server
+    python scripts/load_test_chat.py --unsafe --sessions 300         # in-process, locks off (shows the race)
+
+Every session sends the same short planning conversation; all messages of
+all sessions are shuffled into one queue drained by ``--clients`` concurrent
+clients, so turns of the same session overlap. Afterwards each history must
+hold every user message exactly once, each followed by its reply
+(2 x turns messages). Reports throughput and latency percentiles.
+Without --url the app runs in-process (httpx ASGI transport, no LLM calls).
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import statistics
+from collections import Counter
+from types import SimpleNamespace
+
+os.environ.pop("OPENAI_API_KEY", None)  # rule / local-model path only
+os.environ.setdefault("CHAT_MAX_SESSIONS", "1000000")  # no LRU eviction during the run
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+
+CONVERSATION = [
+    "Xin chào",
+    "Tôi muốn tổ chức hội thảo công nghệ",
+    "Tại hội trường A với 120 người",
+    "Ban marketing và hậu cần",
+    "Ngày 20/11/2026",
+]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def make_client(url: str, unsafe: bool) -> httpx.AsyncClient:
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=120)
+    from main import app
+    from modules.wbs.chat_router import chat_processor
+
+    if unsafe:
+        chat_processor.session_locks = SimpleNamespace(hold=lambda _sid: contextlib.nullcontext(), metrics=dict)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=120)
+
+
+async def run(args) -> int:
+    run_id = f"load-{int(time.time())}"
+    sessions = [f"{run_id}-{i}" for i in range(args.sessions)]
+    rng = random.Random(args.seed)
+    jobs = [(sid, message) for sid in sessions for message in CONVERSATION]
+    rng.shuffle(jobs)
+    queue: "asyncio.Queue" = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    latencies, errors = [], Counter()
+
+    async with make_client(args.url, args.unsafe) as client:
+        async def worker():
+            while True:
+                try:
+                    sid, message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/api/chat/message", json={"message": message, "session_id": sid})
+                    if r.status_code != 200:
+                        errors[f"HTTP {r.status_code}"] += 1
+                except httpx.HTTPError as e:
+                    errors[type(e).__name__] += 1
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+        print(f"Sending {len(jobs)} messages ({args.sessions} sessions x {len(CONVERSATION)} turns) from {args.clients} clients...")
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - t0
+
+        # ====== Verify histories ======
+        lost, broken = 0, 0
+        for sid in sessions:
+            r = await client.get(f"/api/chat/sessions/{sid}/history")
+            history = r.json().get("history", []) if r.status_code == 200 else []
+            users = Counter(m["content"] for m in history if m["role"] == "user")
+            lost += sum(1 for message in CONVERSATION if users[message] != 1)
+            roles = [m["role"] for m in history]
+            if roles != ["user", "assistant"] * (len(roles) // 2) or len(roles) != 2 * len(CONVERSATION):
+                broken += 1
+        metrics = (await client.get("/api/chat/metrics")).json()
+
+    print(f"\n⏱️  {elapsed:.2f}s | {len(jobs) / elapsed:.0f} msg/s | "
+          f"p50 {statistics.median(latencies):.1f} ms | p95 {percentile(latencies, 0.95):.1f} ms | "
+          f"p99 {percentile(latencies, 0.99):.1f} ms")
+    print(f"Session locks: {metrics.get('session_locks')}")
+    if errors:
+        print(f"❌ Request errors: {dict(errors)}")
+    print(f"{'✅' if not lost and not broken else '❌'} Lost user turns: {lost} | sessions with a broken history: {broken}/{len(sessions)}")
+    return 1 if lost or broken or errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=64, help="số client gửi đồng thời")
+    parser.add_argument("--url", default="", help="server đang chạy (mặc định: chạy app trong process)")
+    parser.add_argument("--unsafe", action="store_true", help="tắt session lock (chỉ khi chạy trong process)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
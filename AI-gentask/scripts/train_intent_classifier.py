@@ -0,0 +1,166 @@
+"""
+Train the local intent / event-type classifier
+
+Usage:
+    python scripts/train_intent_classifier.py [--data kb/chat/messages.jsonl] [--out kb/chat/intent_model.joblib] [--llm]
+
+1. Held-out evaluation (stratified 75/25 split): accuracy and per-message
+   latency of the TF-IDF + linear model vs the regex rules
+   (and gpt-4o-mini with --llm, needs OPENAI_API_KEY).
+2. Refit on the full labeled file and save the model loaded by
+   services/intent_classifier.py.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+from sklearn.model_selection import train_test_split
+
+from services.intent_classifier import INTENT_MODEL_FILE, INTENT_CONFIDENCE, INTENTS, IntentClassifier, build_models
+from services.message_patterns import scan_message
+from services.chat_processor import ChatProcessor
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Truy vấn WBS chỉ hợp lệ khi đã có sự kiện -> đánh giá rules trong session có sự kiện
+SESSION = {"current_event": "EVT-eval"}
+
+
+def load_data(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [r["text"] for r in rows], [r["intent"] for r in rows], [r.get("event_type") or "" for r in rows]
+
+
+def accuracy(pred, gold) -> float:
+    return sum(p == g for p, g in zip(pred, gold)) / len(gold) if gold else 0.0
+
+
+def per_message_us(fn, messages, repeat: int = 20) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for m in messages:
+            fn(m)
+        samples.append((time.perf_counter() - t0) / len(messages))
+    return statistics.median(samples) * 1e6
+
+
+def batch_us_per_msg(fn, messages, repeat: int = 20) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(messages)
+        samples.append((time.perf_counter() - t0) / len(messages))
+    return statistics.median(samples) * 1e6
+
+
+def llm_predict(client, message: str):
+    prompt = (
+        "Phân loại tin nhắn chat về quản lý sự kiện. Trả về JSON "
+        f'{{"intent": một trong {list(INTENTS)}, "event_type": một trong '
+        '["concert_opening","conference","food_festival","sport_competition","career_fair",""]}'
+    )
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "system", "content": prompt}, {"role": "user", "content": message}],
+        temperature=0,
+        response_format={"type": "json_object"},
+    )
+    data = json.loads(response.choices[0].message.content)
+    return data.get("intent", ""), data.get("event_type", "")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default=os.path.join(ROOT, "kb", "chat", "messages.jsonl"))
+    parser.add_argument("--out", default=INTENT_MODEL_FILE)
+    parser.add_argument("--llm", action="store_true", help="đánh giá thêm gpt-4o-mini (tốn API call)")
+    args = parser.parse_args()
+
+    messages, intents, types = load_data(args.data)
+    print(f"Loaded {len(messages)} labeled messages from '{args.data}'")
+
+    # ====== Đánh giá held-out ======
+    idx_train, idx_test = train_test_split(
+        list(range(len(messages))), test_size=0.25, random_state=42, stratify=intents
+    )
+    pick = lambda xs, idx: [xs[i] for i in idx]
+    model = IntentClassifier(
+        build_models(pick(messages, idx_train), pick(intents, idx_train), pick(types, idx_train)),
+        threshold=INTENT_CONFIDENCE,
+    )
+    test_msgs, test_intents, test_types = pick(messages, idx_test), pick(intents, idx_test), pick(types, idx_test)
+    typed = [i for i, t in enumerate(test_types) if t]
+
+    preds = model.predict(test_msgs)
+    confident = [i for i, p in enumerate(preds) if p["confident"]]
+    rule_intents = [ChatProcessor._classify_with_rules(m, SESSION) for m in test_msgs]
+    rule_types = [scan_message(m)["event_type"] or "" for m in test_msgs]
+
+    results = {
+        "model": {
+            "intent_acc": accuracy([p["intent"] for p in preds], test_intents),
+            "type_acc": accuracy([preds[i]["event_type"] for i in typed], [test_types[i] for i in typed]),
+            "us_per_msg": per_message_us(model.predict_one, test_msgs),
+        },
+        "model (batch)": {"us_per_msg": batch_us_per_msg(model.predict, test_msgs)},
+        "regex": {
+            "intent_acc": accuracy(rule_intents, test_intents),
+            "type_acc": accuracy([rule_types[i] for i in typed], [test_types[i] for i in typed]),
+            "us_per_msg": per_message_us(
+                lambda m: (ChatProcessor._classify_with_rules(m, SESSION), scan_message.cache_clear()), test_msgs
+            ),
+        },
+    }
+
+    if args.llm:
+        if not os.getenv("OPENAI_API_KEY"):
+            print("⚠️ --llm cần OPENAI_API_KEY, bỏ qua")
+        else:
+            from openai import OpenAI
+
+            client = OpenAI()
+            llm_preds, latencies = [], []
+            for m in test_msgs:
+                t0 = time.perf_counter()
+                llm_preds.append(llm_predict(client, m))
+                latencies.append(time.perf_counter() - t0)
+            results["gpt-4o-mini"] = {
+                "intent_acc": accuracy([p[0] for p in llm_preds], test_intents),
+                "type_acc": accuracy([llm_preds[i][1] for i in typed], [test_types[i] for i in typed]),
+                "us_per_msg": statistics.median(latencies) * 1e6,
+            }
+
+    print(f"\nHeld-out: {len(test_msgs)} messages ({len(typed)} with an event type)")
+    print(f"{'path':>14} | {'intent acc':>10} | {'type acc':>8} | {'us/msg':>10}")
+    print("-" * 52)
+    for name, r in results.items():
+        intent_acc = f"{r['intent_acc']:.1%}" if "intent_acc" in r else "-"
+        type_acc = f"{r['type_acc']:.1%}" if "type_acc" in r else "-"
+        print(f"{name:>14} | {intent_acc:>10} | {type_acc:>8} | {r['us_per_msg']:>10.1f}")
+    conf_acc = accuracy([preds[i]["intent"] for i in confident], [test_intents[i] for i in confident])
+    print(
+        f"\nConfident (>= {INTENT_CONFIDENCE}): {len(confident)}/{len(test_msgs)} messages "
+        f"({len(confident) / len(test_msgs):.0%} skip rules/LLM), accuracy {conf_acc:.1%}"
+    )
+
+    # ====== Train trên toàn bộ dữ liệu và lưu ======
+    models = build_models(messages, intents, types)
+    models["trained_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    models["n_samples"] = len(messages)
+    models["heldout"] = {name: {k: round(v, 4) for k, v in r.items()} for name, r in results.items()}
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    joblib.dump(models, args.out)
+    print(f"\n✅ Saved model trained on {len(messages)} messages to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,10 @@ Features:
 UPDATED: Works with 'departments' containing full task info (no separate 'tasks')
 """
 
-import re
 import json
 import os
-from typing import Dict, Any, List, Optional
+import hashlib
+from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
 import pytz
 try:
@@ -24,31 +24,98 @@ except Exception:
     def load_dotenv() -> None:  # type: ignore
         return None
 from services.pipeline import run_pipeline
+from services.session_store import SessionConflict, SessionLocks, SessionStore, create_session_store, new_session
+from services.message_patterns import scan_message, extract_venue, extract_event_name
+from services.intent_classifier import INTENT_CONFIDENCE, classify_message
+from services.wbs_index import WBSQueryIndex, build_wbs_index, get_wbs_index
+from services.speculation import StageSpeculator, create_speculator
+from services.history import CHAT_HISTORY_SUMMARY, fold_history, llm_summarizer, page_history
 
 load_dotenv()
 
+# emit(event, data): progress hook used by the streaming chat endpoints
+Emit = Callable[[str, Any], None]
+
+# One JSON-mode call returns intent + fields + reply (regex / local model pre-filter first)
+CHAT_UNIFIED_LLM = os.getenv("CHAT_UNIFIED_LLM", "0") == "1"
+# Re-runs of a turn whose session another worker saved meanwhile (sqlite backend)
+CHAT_TURN_RETRIES = int(os.getenv("CHAT_TURN_RETRIES", "2"))
+
+# Fields the user describes; generated artifacts live in session["artifacts"]
+EVENT_FIELDS = ("event_name", "event_type", "event_date", "venue", "headcount_total", "departments")
+
+
+def event_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact field set of an event (what the extraction prompt sees)"""
+    return {k: data[k] for k in EVENT_FIELDS if data.get(k) not in (None, "", [])}
+
+
+def wbs_etag(wbs: Dict[str, Any]) -> str:
+    """Content hash: regenerating an identical plan keeps the same etag"""
+    payload = json.dumps(wbs, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
 
 class ChatProcessor:
-    def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
-        self.client = OpenAI() if os.getenv("OPENAI_API_KEY") else None
+    def __init__(
+        self,
+        sessions: Optional[SessionStore] = None,
+        client: Any = None,
+        unified: Optional[bool] = None,
+        speculator: Optional[StageSpeculator] = None,
+    ):
+        # Bounded store (LRU / idle TTL / message cap), see services/session_store.py
+        self.sessions: SessionStore = sessions if sessions is not None else create_session_store()
+        # Turns of one session are serialized; different sessions run concurrently
+        self.session_locks = SessionLocks()
+        if client is None and os.getenv("OPENAI_API_KEY") and OpenAI is not None:
+            client = OpenAI()
+        self.client = client
+        self.unified = CHAT_UNIFIED_LLM if unified is None else unified
+        # Older turns are folded into a summary (rule-based unless CHAT_HISTORY_SUMMARY=llm)
+        self.summarizer = llm_summarizer(client) if CHAT_HISTORY_SUMMARY == "llm" and client else None
+        # Early WBS stages computed while the event is still incomplete (None = off)
+        self.speculator = speculator if speculator is not None else create_speculator()
+        # Which path understood each message (GET /api/chat/metrics)
+        self.stats = {
+            "local_intent": 0,
+            "rule_intent": 0,
+            "llm_extractions": 0,
+            "llm_skipped": 0,
+            "unified_calls": 0,
+            "prefiltered": 0,
+            "folded_messages": 0,
+            "turn_retries": 0,
+        }
         
-    def process_message(self, message: str, session_id: str) -> Dict[str, Any]:
+    def process_message(self, message: str, session_id: str, emit: Optional[Emit] = None) -> Dict[str, Any]:
         """
         Process user message with full conversational capability
+
+        ``emit`` (optional) receives progress as it happens: "intent",
+        "extracted_info", "wbs_section" (pipeline sections) and "token"
+        (LLM text deltas). The returned response is the same either way.
+
+        Safe to call from several threads: messages of the same session are
+        processed one after another, in arrival order of the lock. A turn that
+        loses a race with another worker (SessionConflict) is re-run on the
+        fresh session, unless progress was already streamed through ``emit``.
         """
+        with self.session_locks.hold(session_id):
+            for attempt in range(CHAT_TURN_RETRIES + 1):
+                try:
+                    return self._process_turn(message, session_id, emit)
+                except SessionConflict:
+                    if emit is not None or attempt == CHAT_TURN_RETRIES:
+                        raise
+                    self.stats["turn_retries"] += 1
+
+    def _process_turn(self, message: str, session_id: str, emit: Optional[Emit]) -> Dict[str, Any]:
+        """One turn, under the session lock"""
         # Initialize session
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "created_at": datetime.now(),
-                "last_updated": datetime.now(),
-                "messages": [],
-                "current_event": None,  # Current active event
-                "events": {},  # All events in this session {event_id: event_data}
-                "context": "greeting",  # greeting, planning, querying
-            }
-        
-        session = self.sessions[session_id]
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = new_session()
         
         # Add user message
         session["messages"].append({
@@ -57,20 +124,24 @@ class ChatProcessor:
             "timestamp": datetime.now().isoformat()
         })
         
-        # Determine intent
-        intent = self._classify_intent(message, session)
+        # Determine intent (unified: intent, fields and reply from at most one LLM call)
+        understood = self._understand(message, session) if self.unified and self.client else None
+        intent = understood["intent"] if understood else self._classify_intent(message, session)
+        understood = understood or {}
+        if emit:
+            emit("intent", {"intent": intent})
         
         # Route to appropriate handler
         if intent == "greeting":
             response = self._handle_greeting(message, session)
         elif intent == "event_planning":
-            response = self._handle_event_planning(message, session)
+            response = self._handle_event_planning(message, session, extracted=understood.get("fields"), emit=emit)
         elif intent == "event_query":
-            response = self._handle_event_query(message, session)
+            response = self._handle_event_query(message, session, emit=emit)
         elif intent == "context_switch":
             response = self._handle_context_switch(message, session)
         elif intent == "general_chat":
-            response = self._handle_general_chat(message, session)
+            response = self._handle_general_chat(message, session, reply=understood.get("reply"), emit=emit)
         else:
             response = self._handle_unknown(message, session)
         
@@ -84,66 +155,135 @@ class ChatProcessor:
         })
         
         session["last_updated"] = datetime.now()
+        self.stats["folded_messages"] += fold_history(session, summarizer=self.summarizer)
+        self.sessions.save(session_id, session)
         
         return response
     
     def _classify_intent(self, message: str, session: Dict[str, Any]) -> str:
         """
-        Classify user intent using LLM or rule-based
+        Classify user intent: keyword rules, then the local model where the
+        rules fall through to general chat (the LLM would be called)
         """
-        message_lower = message.lower().strip()
+        intent = self._classify_with_rules(message, session)
+        # Local TF-IDF + linear model (scripts/train_intent_classifier.py): only
+        # replaces an LLM round trip, never a rule that already decided
+        prediction = classify_message(message) if intent == "general_chat" and self.client else None
+        if prediction and prediction["confident"]:
+            intent = prediction["intent"]
+            # Không có sự kiện đang hoạt động thì không thể truy vấn WBS
+            if intent == "event_query" and not session.get("current_event"):
+                intent = "general_chat"
+            self.stats["local_intent"] += 1
+            return intent
+        self.stats["rule_intent"] += 1
+        return intent
+    
+    @staticmethod
+    def _classify_with_rules(message: str, session: Dict[str, Any]) -> str:
+        """Keyword / pattern rules (used when the local model is missing or unsure)"""
+        # One cached scan (precompiled combined regexes) serves classification and extraction
+        signals = scan_message(message)
         
         # Greeting patterns (chỉ khi message ngắn và không có info khác)
-        if len(message_lower) < 30:
-            greeting_patterns = [
-                r'^(xin chào|chào|hello|hi|hey|good morning|good afternoon)[\s!.]*$',
-                r'^(bạn là ai|bạn có thể làm gì|giới thiệu)[\s!.?]*$',
-            ]
-            if any(re.search(p, message_lower) for p in greeting_patterns):
-                return "greeting"
-        
-        # Event planning patterns (ưu tiên cao)
-        planning_keywords = [
-            'tổ chức', 'sự kiện', 'event', 'concert', 'hội nghị', 'festival',
-            'khai giảng', 'khai mạc', 'bế mạc', 'opening', 'closing',
-            'ngày', 'tháng', 'địa điểm', 'venue', 'người', 'headcount',
-            'ban', 'department', 'team', 'hậu cần', 'marketing', 'chuyên môn', 'tài chính',
-            'đường 30m', 'phòng học', 'sảnh', 'tầng',
-        ]
-        
-        # Đếm số keywords match
-        keyword_count = sum(1 for kw in planning_keywords if kw in message_lower)
+        if signals["is_greeting"]:
+            return "greeting"
         
         # Nếu có ít nhất 3 keywords hoặc có date pattern → event planning
-        date_patterns = [
-            r'\d{1,2}/\d{1,2}/\d{4}',  # DD/MM/YYYY
-            r'\d{4}-\d{2}-\d{2}',       # YYYY-MM-DD
-            r'ngày \d{1,2}',            # ngày 25
-        ]
-        has_date = any(re.search(p, message_lower) for p in date_patterns)
-        
-        if keyword_count >= 3 or (keyword_count >= 2 and has_date):
+        keyword_count = signals["planning_keyword_count"]
+        if keyword_count >= 3 or (keyword_count >= 2 and signals["has_date"]):
             return "event_planning"
         
         # Event query patterns
-        query_patterns = [
-            r'\b(task|công việc|deadline|tiến độ|rủi ro|risk)\b',
-            r'\b(của|trong|sự kiện|event)\b',
-            r'\b(show|xem|hiển thị|list)\b',
-        ]
-        if any(re.search(p, message_lower) for p in query_patterns) and session.get("current_event"):
+        if signals["has_query"] and session.get("current_event"):
             return "event_query"
         
         # Context switch patterns
-        switch_patterns = [
-            r'\b(chuyển sang|switch to|đổi sang|sang sự kiện)\b',
-        ]
-        if any(re.search(p, message_lower) for p in switch_patterns):
+        if signals["has_switch"]:
             return "context_switch"
         
         # Default to general chat
         return "general_chat"
     
+    def _understand(self, message: str, session: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Unified understanding: {"intent", "fields" (planning), "reply" (general chat)}.
+
+        Pre-filter without the LLM: greetings, context switches and WBS queries
+        (their handlers need no extraction), planning messages whose date and
+        departments the regex already finds, and confident local planning
+        predictions. Everything else costs exactly one JSON-mode call that
+        decides the intent too, instead of trusting keyword rules and then
+        calling for extraction or a reply.
+        """
+        intent = self._classify_intent(message, session)
+        current_event_id = session.get("current_event")
+        current_data = event_fields(session["events"].get(current_event_id, {})) if current_event_id else {}
+        
+        if intent in ("greeting", "context_switch", "event_query"):
+            self.stats["prefiltered"] += 1
+            return {"intent": intent}
+        if intent == "event_planning":
+            signals = scan_message(message)
+            prediction = classify_message(message)
+            fields = self._extract_with_regex(message, current_data, prediction)
+            structured = signals["event_date"] and signals["departments"] and fields.get("event_type")
+            if structured or self._is_confident_planning(prediction):
+                self.stats["prefiltered"] += 1
+                return {"intent": intent, "fields": fields}
+        
+        self.stats["unified_calls"] += 1
+        try:
+            system_prompt = f"""
+Bạn là AI assistant lập kế hoạch sự kiện. Phân tích tin nhắn và trả về JSON:
+{{"intent": "...", "fields": {{...}}, "reply": "..."}}
+
+intent là một trong:
+- event_planning: mô tả/cập nhật sự kiện cần lập kế hoạch
+- event_query: hỏi về tasks/rủi ro/deadline của sự kiện hiện tại{"" if current_event_id else " (hiện CHƯA có sự kiện)"}
+- context_switch: chuyển sang sự kiện khác
+- greeting: chào hỏi
+- general_chat: trò chuyện khác
+
+fields (chỉ khi intent = event_planning, chỉ thông tin MỚI trong tin nhắn):
+- event_name, event_type (concert_opening | conference | food_festival | sport_competition | career_fair),
+  event_date (YYYY-MM-DD), venue, headcount_total (số), departments (array tên ban)
+
+reply (chỉ khi intent = general_chat): câu trả lời ngắn gọn, thân thiện, hướng người dùng về việc
+lập kế hoạch sự kiện; không trả lời ngoài phạm vi quản lý sự kiện.
+
+Thông tin sự kiện hiện tại: {json.dumps(current_data, ensure_ascii=False)}
+"""
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                temperature=0.1,
+                max_tokens=400,
+                response_format={"type": "json_object"}
+            )
+            result = json.loads(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Unified LLM error: {e}")
+            return {"intent": intent}
+        
+        llm_intent = result.get("intent")
+        if llm_intent not in ("event_planning", "event_query", "context_switch", "greeting", "general_chat"):
+            llm_intent = intent
+        if llm_intent == "event_query" and not current_event_id:
+            llm_intent = "general_chat"
+        understood: Dict[str, Any] = {"intent": llm_intent}
+        if llm_intent == "event_planning":
+            fields = result.get("fields") or {}
+            merged = current_data.copy()
+            merged.update({k: v for k, v in fields.items() if k in EVENT_FIELDS and v not in (None, "", [])})
+            understood["fields"] = merged
+        elif llm_intent == "general_chat" and result.get("reply"):
+            understood["reply"] = str(result["reply"])
+        return understood
+    
     def _handle_greeting(self, message: str, session: Dict[str, Any]) -> Dict[str, Any]:
         """Handle greeting messages"""
         greeting_responses = [
@@ -162,11 +302,18 @@ class ChatProcessor:
             "data": None
         }
     
-    def _handle_event_planning(self, message: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    def _handle_event_planning(
+        self,
+        message: str,
+        session: Dict[str, Any],
+        extracted: Optional[Dict[str, Any]] = None,
+        emit: Optional[Emit] = None,
+    ) -> Dict[str, Any]:
         """Handle event planning - extract info and generate WBS"""
         
-        # Extract event information
-        extracted = self._extract_event_info(message, session)
+        # Extract event information (unless the unified call already did)
+        if extracted is None:
+            extracted = self._extract_event_info(message, session)
         
         # Update or create current event
         current_event = session.get("current_event")
@@ -178,39 +325,55 @@ class ChatProcessor:
         else:
             # Update existing event
             session["events"][current_event].update(extracted)
+            self._artifact(session, current_event)  # moves a legacy inline WBS out of the fields
+        
+        event_id = session["current_event"]
+        event_data = session["events"][event_id]
+        if emit:
+            emit("extracted_info", event_fields(event_data))
         
-        event_data = session["events"][session["current_event"]]
+        # What the user actually gave (the check below fills in defaults)
+        given = event_fields(event_data)
         
         # Check if we have enough info to generate WBS
         if self._has_sufficient_info(event_data):
             # Generate WBS
-            wbs_result = run_pipeline(event_data)
+            on_section = (lambda section, data: emit("wbs_section", {"section": section, "data": data})) if emit else None
+            fields = event_fields(event_data)
+            precomputed = self.speculator.collect(fields) if self.speculator else None
+            wbs_result = run_pipeline(fields, on_section=on_section, precomputed=precomputed)
             
-            # Store WBS in event data
-            session["events"][session["current_event"]]["wbs"] = wbs_result
+            # Store WBS as a versioned artifact; the query index is built once here
+            ref = self._store_wbs(session, event_id, wbs_result)
+            build_wbs_index(ref["etag"], wbs_result)
             
             # Generate response message
             response_msg = self._format_wbs_summary(event_data, wbs_result)
             
-            # Return with departments containing full task info
+            # Return with departments containing full task info; "data" (kept in
+            # the message log) is only a reference to the stored artifact
             return {
                 "message": response_msg,
-                "data": wbs_result,
+                "data": {"wbs_ref": ref},
+                "wbs_ref": ref,
                 "extracted_info": wbs_result["extracted_info"],
                 "epics_task": wbs_result["epics_task"],
                 "departments": wbs_result["departments"],  # Contains full task info (no separate 'tasks')
                 "risks": wbs_result.get("risks", {}),
             }
         else:
+            # Start the stages whose inputs are already known
+            if self.speculator:
+                self.speculator.speculate(given)
             # Ask for missing info
             missing_msg = self._identify_missing_info(event_data)
             return {
                 "message": missing_msg,
                 "data": None,
-                "extracted_info": event_data,
+                "extracted_info": event_fields(event_data),
             }
     
-    def _handle_event_query(self, message: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    def _handle_event_query(self, message: str, session: Dict[str, Any], emit: Optional[Emit] = None) -> Dict[str, Any]:
         """Handle queries about current event (RAG)"""
         
         current_event_id = session.get("current_event")
@@ -221,23 +384,31 @@ class ChatProcessor:
             }
         
         event_data = session["events"][current_event_id]
-        wbs = event_data.get("wbs")
+        artifact = self._artifact(session, current_event_id)
         
-        if not wbs:
+        if not artifact:
             return {
                 "message": "Sự kiện chưa có WBS. Hãy cung cấp đầy đủ thông tin để tôi tạo WBS cho bạn!",
                 "data": None
             }
         
+        # Only the rows the question is about, from the per-event index
+        index = get_wbs_index(artifact["etag"], artifact["wbs"])
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        view = index.relevant(message, today=today)
+        
         # Use LLM to answer query based on WBS data
         if self.client:
-            answer = self._llm_answer_query(message, wbs, event_data)
+            answer = self._llm_answer_query(message, index, view, event_data, artifact["wbs"], emit=emit)
         else:
-            answer = self._rule_based_answer_query(message, wbs, event_data)
+            answer = self._rule_based_answer_query(message, index, view, event_data)
         
+        # The answer refers to the stored WBS instead of carrying it
+        ref = self._wbs_ref(current_event_id, artifact)
         return {
             "message": answer,
-            "data": wbs
+            "data": {"wbs_ref": ref},
+            "wbs_ref": ref,
         }
     
     def _handle_context_switch(self, message: str, session: Dict[str, Any]) -> Dict[str, Any]:
@@ -267,13 +438,24 @@ class ChatProcessor:
             "data": {"events": list(events.keys())}
         }
     
-    def _handle_general_chat(self, message: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    def _handle_general_chat(
+        self,
+        message: str,
+        session: Dict[str, Any],
+        reply: Optional[str] = None,
+        emit: Optional[Emit] = None,
+    ) -> Dict[str, Any]:
         """Handle general conversation"""
         
-        # Use LLM for natural conversation
-        if self.client:
+        # Use LLM for natural conversation (reply already written by the unified call)
+        if reply:
+            answer = reply
+            if emit:
+                emit("token", reply)
+        elif self.client:
             try:
-                response = self.client.chat.completions.create(
+                answer = self._complete_text(
+                    emit,
                     model="gpt-4o-mini",
                     messages=[
                         {
@@ -287,7 +469,6 @@ Không trả lời các câu hỏi ngoài phạm vi quản lý sự kiện."""
                     temperature=0.7,
                     max_tokens=200
                 )
-                answer = response.choices[0].message.content
             except:
                 answer = "Tôi là AI giúp bạn lập kế hoạch sự kiện. Bạn cần hỗ trợ gì về sự kiện?"
         else:
@@ -311,9 +492,12 @@ Không trả lời các câu hỏi ngoài phạm vi quản lý sự kiện."""
         current_event_id = session.get("current_event")
         current_data = {}
         if current_event_id and current_event_id in session["events"]:
-            current_data = session["events"][current_event_id]
+            current_data = event_fields(session["events"][current_event_id])
         
-        if self.client:
+        # Local model sure about intent + event type: regex extraction is enough, skip the LLM
+        prediction = classify_message(message)
+        if self.client and not self._is_confident_planning(prediction):
+            self.stats["llm_extractions"] += 1
             try:
                 system_prompt = f"""
 Bạn là AI trích xuất thông tin sự kiện.
@@ -355,9 +539,9 @@ Trả về JSON với các trường (chỉ khi có):
                 
                 result = json.loads(response.choices[0].message.content)
                 
-                # Merge with current data
+                # Merge with current data (event fields only)
                 merged = current_data.copy()
-                merged.update(result)
+                merged.update({k: v for k, v in result.items() if k in EVENT_FIELDS})
                 return merged
                 
             except Exception as e:
@@ -365,34 +549,37 @@ Trả về JSON với các trường (chỉ khi có):
                 return current_data
         
         # Fallback to regex
-        return self._extract_with_regex(message, current_data)
+        if self.client:
+            self.stats["llm_skipped"] += 1
+        return self._extract_with_regex(message, current_data, prediction)
+    
+    @staticmethod
+    def _is_confident_planning(prediction: Optional[Dict[str, Any]]) -> bool:
+        return bool(
+            prediction
+            and prediction["confident"]
+            and prediction["intent"] == "event_planning"
+            and prediction["event_type_confidence"] >= INTENT_CONFIDENCE
+        )
     
-    def _extract_with_regex(self, message: str, current_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Fallback regex extraction"""
+    def _extract_with_regex(
+        self,
+        message: str,
+        current_data: Dict[str, Any],
+        prediction: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Fallback regex extraction (event type from the local model when no keyword matches)"""
         info = current_data.copy()
-        message_lower = message.lower()
+        signals = scan_message(message)
+        text = signals["text"]
         
         # Extract event name (improved extraction)
         if not info.get("event_name"):
-            # Pattern 1: "event_type + name" format
-            name_patterns = [
-                r'(concert|sự kiện|event|hội nghị|festival)\s+([^,\d]{5,40})',
-                r'(khai giảng|khai mạc|bế mạc)(?:\s+([^,\d]{0,30}))?',
-            ]
-            
-            for pattern in name_patterns:
-                match = re.search(pattern, message_lower)
-                if match:
-                    if match.lastindex >= 2 and match.group(2):
-                        # Has explicit name
-                        info["event_name"] = f"{match.group(1).title()} {match.group(2).strip()}"
-                    else:
-                        # Just the type
-                        info["event_name"] = match.group(1).title()
-                    break
-            
+            event_name = extract_event_name(text)
+            if event_name:
+                info["event_name"] = event_name
             # Fallback: use event_type as name
-            if not info.get("event_name") and info.get("event_type"):
+            elif info.get("event_type"):
                 type_names = {
                     "concert_opening": "Concert Khai Giảng",
                     "conference": "Hội nghị",
@@ -402,98 +589,27 @@ Trả về JSON với các trường (chỉ khi có):
                 info["event_name"] = type_names.get(info["event_type"], "Sự kiện")
         
         # Extract event type
-        type_keywords = {
-            "concert_opening": ["concert", "show", "nhạc", "âm nhạc", "khai giảng", "khai mạc", "opening"],
-            "conference": ["hội nghị", "conference", "seminar", "workshop"],
-            "food_festival": ["festival", "lễ hội", "food", "ẩm thực"],
-            "sport_competition": ["thi đấu", "thể thao", "giải", "competition"],
-            "career_fair": ["career fair", "ngày hội việc làm", "job fair"],
-        }
-        
-        for event_type, keywords in type_keywords.items():
-            if any(kw in message_lower for kw in keywords):
-                info["event_type"] = event_type
-                break
+        if signals["event_type"]:
+            info["event_type"] = signals["event_type"]
+        elif prediction and prediction.get("event_type") and prediction["event_type_confidence"] >= INTENT_CONFIDENCE:
+            info["event_type"] = prediction["event_type"]
         
         # Extract date - support both DD/MM/YYYY and YYYY-MM-DD
-        date_patterns = [
-            (r'(\d{1,2})/(\d{1,2})/(\d{4})', 'dmy'),  # DD/MM/YYYY
-            (r'(\d{4})-(\d{2})-(\d{2})', 'ymd'),      # YYYY-MM-DD
-            (r'ngày\s+(\d{1,2})[/ ](\d{1,2})[/ ](\d{4})', 'dmy'),  # ngày DD/MM/YYYY
-        ]
-        
-        for pattern, date_format in date_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                if date_format == 'dmy':
-                    day, month, year = match.groups()
-                    try:
-                        # Validate and convert to YYYY-MM-DD
-                        date_obj = datetime(int(year), int(month), int(day))
-                        info["event_date"] = date_obj.strftime("%Y-%m-%d")
-                        break
-                    except ValueError:
-                        continue
-                elif date_format == 'ymd':
-                    info["event_date"] = match.group(0)
-                    break
+        if signals["event_date"]:
+            info["event_date"] = signals["event_date"]
         
         # Extract venue
-        venue_patterns = [
-            r'(?:tại|ở|at|venue[::\s]+)([^,\d\.]+?)(?:\s*,|\s+với|\s+\d|$)',
-            r'(đường 30m|phòng học|sảnh tòa học|tầng 5 gamma)',
-        ]
-        for pattern in venue_patterns:
-            venue_match = re.search(pattern, message_lower)
-            if venue_match:
-                info["venue"] = venue_match.group(1).strip()
-                break
+        venue = extract_venue(text)
+        if venue:
+            info["venue"] = venue
         
         # Extract headcount
-        headcount_patterns = [
-            r'(\d+)\s*người',
-            r'với\s+(\d+)',
-            r'headcount[::\s]+(\d+)',
-        ]
-        for pattern in headcount_patterns:
-            headcount_match = re.search(pattern, message_lower)
-            if headcount_match:
-                info["headcount_total"] = int(headcount_match.group(1))
-                break
-        
-        # Extract departments
-        dept_patterns = [
-            r'ban\s+([^,\d]+?)(?:\s*,|\s+và|\s*$)',
-            r'department[::\s]+([^,\d]+?)(?:\s*,|\s+và|\s*$)',
-        ]
-        
-        # Common department names (include typos)
-        dept_keywords = {
-            "hậu cần": ["hậu cần", "hau can", "logistics", "hau can"],
-            "marketing": ["marketing", "maketing", "media", "truyền thông", "truyen thong"],  # Added "maketing" typo
-            "chuyên môn": ["chuyên môn", "chuyen mon", "technical", "kỹ thuật", "ky thuat"],
-            "tài chính": ["tài chính", "tai chinh", "finance", "tai chinh"],
-        }
+        if signals["headcount_total"] is not None:
+            info["headcount_total"] = signals["headcount_total"]
         
-        found_depts = []
-        for dept_name, keywords in dept_keywords.items():
-            if any(kw in message_lower for kw in keywords):
-                # Capitalize properly
-                if dept_name == "hậu cần":
-                    if "Hậu cần" not in found_depts:
-                        found_depts.append("Hậu cần")
-                elif dept_name == "marketing":
-                    if "Marketing" not in found_depts:
-                        found_depts.append("Marketing")
-                elif dept_name == "chuyên môn":
-                    if "Chuyên môn" not in found_depts:
-                        found_depts.append("Chuyên môn")
-                elif dept_name == "tài chính":
-                    if "Tài chính" not in found_depts:
-                        found_depts.append("Tài chính")
-        
-        if found_depts:
-            info["departments"] = found_depts  # Already unique
+        # Extract departments (canonical names, typos included)
+        if signals["departments"]:
+            info["departments"] = list(signals["departments"])
         
         return info
     
@@ -597,11 +713,54 @@ Bạn có thể cung cấp thêm không? 😊"""
 • "Công việc nào deadline gần nhất?"
 """
     
-    def _llm_answer_query(self, question: str, wbs: Dict[str, Any], event_data: Dict[str, Any]) -> str:
-        """Use LLM to answer query based on WBS data"""
-        
-        # Count total tasks from departments
-        total_tasks = sum(len(tasks) for tasks in wbs.get("departments", {}).values())
+    def _complete_text(self, emit: Optional[Emit], **request: Any) -> str:
+        """Chat completion text; streamed token by token to ``emit`` when given"""
+        if not emit:
+            response = self.client.chat.completions.create(**request)
+            return response.choices[0].message.content
+        parts: List[str] = []
+        for chunk in self.client.chat.completions.create(stream=True, **request):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                emit("token", delta)
+        return "".join(parts)
+    
+    @staticmethod
+    def _compact_task(index: WBSQueryIndex, task: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "task_id": task.get("task_id"),
+            "name": task.get("name"),
+            "department": index.department_label(index.task_department.get(task.get("task_id"))),
+            "priority": task.get("priority"),
+            "deadline": task.get("deadline"),
+        }
+
+    @staticmethod
+    def _compact_risk(index: WBSQueryIndex, risk: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": risk.get("id"),
+            "title": risk.get("title"),
+            "level": risk.get("level"),
+            "owner": index.department_label(risk.get("owner")) or "Tổng thể",
+        }
+
+    def _llm_answer_query(
+        self,
+        question: str,
+        index: WBSQueryIndex,
+        view: Dict[str, Any],
+        event_data: Dict[str, Any],
+        wbs: Dict[str, Any],
+        emit: Optional[Emit] = None,
+    ) -> str:
+        """Use LLM to answer query based on WBS data (counts + relevant rows only)"""
+        counts = index.counts()
+        relevant = {
+            "tasks": [self._compact_task(index, t) for t in view["tasks"]],
+            "risks": [self._compact_risk(index, r) for r in view["risks"]],
+            "total_matching": view["total"],
+        }
         
         context = f"""
 Dữ liệu sự kiện:
@@ -610,21 +769,22 @@ Dữ liệu sự kiện:
 - Ngày: {event_data.get('event_date')}
 - Địa điểm: {event_data.get('venue')}
 
-Số lượng tasks: {total_tasks}
+Số lượng tasks: {counts['tasks']}
 Số lượng epics: {len(wbs.get('epics_task', []))}
 
 Departments (với số tasks):
-{json.dumps({k: len(v) for k, v in wbs.get('departments', {}).items()}, ensure_ascii=False)}
+{json.dumps({index.department_label(k): v for k, v in counts['by_department'].items()}, ensure_ascii=False)}
 
-Sample tasks:
-{json.dumps({dept: tasks[:2] for dept, tasks in list(wbs.get('departments', {}).items())[:2]}, ensure_ascii=False, indent=2)}
+Tasks theo priority: {json.dumps(counts['by_priority'], ensure_ascii=False)}
+Risks theo level: {json.dumps(counts['risks_by_level'], ensure_ascii=False)}
 
-Risks:
-{json.dumps(wbs.get('risks', {}), ensure_ascii=False)}
+Dữ liệu liên quan đến câu hỏi:
+{json.dumps(relevant, ensure_ascii=False)}
 """
         
         try:
-            response = self.client.chat.completions.create(
+            return self._complete_text(
+                emit,
                 model="gpt-4o-mini",
                 messages=[
                     {
@@ -642,58 +802,130 @@ Context:
                 temperature=0.3,
                 max_tokens=500
             )
-            
-            return response.choices[0].message.content
         except Exception as e:
             return f"Xin lỗi, tôi gặp lỗi khi xử lý câu hỏi: {str(e)}"
     
-    def _rule_based_answer_query(self, question: str, wbs: Dict[str, Any], event_data: Dict[str, Any]) -> str:
-        """Rule-based query answering (fallback)"""
-        
-        question_lower = question.lower()
+    def _rule_based_answer_query(
+        self, question: str, index: WBSQueryIndex, view: Dict[str, Any], event_data: Dict[str, Any]
+    ) -> str:
+        """Rule-based query answering (fallback), straight from the index views"""
+        kind = view["kind"]
+        label = index.department_label(view["department"])
+        levels = "/".join(view["levels"])
         
-        # Query about tasks
-        if "task" in question_lower or "công việc" in question_lower:
-            if "marketing" in question_lower:
-                tasks = wbs["departments"].get("marketing", [])
-                return f"Ban Marketing có {len(tasks)} tasks:\n" + "\n".join([f"• {t['name']}" for t in tasks[:10]])
-            
-            total_tasks = sum(len(tasks) for tasks in wbs.get("departments", {}).values())
-            return f"Tổng cộng {total_tasks} tasks trong sự kiện."
+        def task_lines(tasks: List[Dict[str, Any]]) -> str:
+            return "\n".join(f"• {t['name']} [{t.get('priority', 'medium')}] - deadline {t.get('deadline', 'N/A')}" for t in tasks)
         
         # Query about risks
-        if "risk" in question_lower or "rủi ro" in question_lower:
-            risks = wbs.get("risks", {})
-            overall = risks.get("overall", [])
-            return f"Có {len(overall)} rủi ro tổng thể. Rủi ro quan trọng nhất:\n" + "\n".join([f"• [{r['level']}] {r['title']}" for r in overall[:5]])
+        if kind == "risk":
+            scope = f" của ban {label}" if label else ""
+            scope += f" mức {levels}" if levels else ""
+            if not view["risks"]:
+                return f"Không có rủi ro nào{scope}."
+            return f"Có {view['total']} rủi ro{scope}. Rủi ro quan trọng nhất:\n" + "\n".join(
+                f"• [{r['level']}] {r['title']}" for r in view["risks"][:5]
+            )
+        
+        # Query about deadlines
+        if kind == "deadline":
+            scope = f" của ban {label}" if label else ""
+            if not view["tasks"]:
+                return f"Không có task nào{scope} có deadline."
+            return f"Các task{scope} có deadline gần nhất:\n" + task_lines(view["tasks"])
+        
+        # Query about tasks of a department / priority
+        if kind == "department":
+            scope = f" mức {levels}" if levels else ""
+            return f"Ban {label} có {view['total']} tasks{scope}:\n" + task_lines(view["tasks"])
+        if kind == "priority":
+            return f"Có {view['total']} tasks mức {levels}:\n" + task_lines(view["tasks"])
+        if kind == "search":
+            return "Các task liên quan:\n" + task_lines(view["tasks"])
+        
+        question_lower = question.lower()
+        if "task" in question_lower or "công việc" in question_lower:
+            counts = index.counts()
+            per_dept = ", ".join(f"{index.department_label(d)}: {n}" for d, n in counts["by_department"].items())
+            return f"Tổng cộng {counts['tasks']} tasks trong sự kiện ({per_dept})."
         
         return "Tôi có thể giúp bạn tra cứu về tasks, risks, deadline. Bạn muốn biết gì?"
     
-    def get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
-        """Get conversation history"""
-        if session_id not in self.sessions:
-            raise ValueError("Session không tồn tại")
-        return self.sessions[session_id]["messages"]
+    # ====== Artifacts (generated WBS, kept apart from event fields) ======
+    @staticmethod
+    def _wbs_ref(event_id: str, artifact: Dict[str, Any]) -> Dict[str, Any]:
+        return {"event_id": event_id, "version": artifact["version"], "etag": artifact["etag"]}
+
+    def _artifact(self, session: Dict[str, Any], event_id: str) -> Optional[Dict[str, Any]]:
+        """Stored WBS artifact of an event (migrates sessions that kept it inline)"""
+        artifacts = session.setdefault("artifacts", {})
+        event = session.get("events", {}).get(event_id)
+        if event is not None and "wbs" in event:
+            wbs = event.pop("wbs")
+            if wbs:
+                artifacts[event_id] = {"version": 1, "etag": wbs_etag(wbs), "wbs": wbs}
+        return artifacts.get(event_id)
+
+    def _store_wbs(self, session: Dict[str, Any], event_id: str, wbs: Dict[str, Any]) -> Dict[str, Any]:
+        """Save a generated WBS; the version only moves when the content changes"""
+        previous = self._artifact(session, event_id)
+        etag = wbs_etag(wbs)
+        if previous and previous["etag"] == etag:
+            return self._wbs_ref(event_id, previous)
+        artifact = {
+            "version": (previous["version"] + 1) if previous else 1,
+            "etag": etag,
+            "wbs": wbs,
+            "generated_at": datetime.now().isoformat(),
+        }
+        session["artifacts"][event_id] = artifact
+        return self._wbs_ref(event_id, artifact)
+
+    def get_event_wbs(self, session_id: str, event_id: Optional[str] = None) -> Dict[str, Any]:
+        """Stored WBS of an event (current event by default) with its reference"""
+        with self.session_locks.hold(session_id):
+            session = self.sessions.get(session_id)
+            if session is None:
+                raise ValueError("Session không tồn tại")
+            event_id = event_id or session.get("current_event")
+            inline = "wbs" in (session.get("events", {}).get(event_id) or {})
+            artifact = self._artifact(session, event_id) if event_id else None
+            if inline:
+                # Legacy inline WBS was just moved to artifacts: persist the migration
+                self.sessions.save(session_id, session)
+            if not artifact:
+                raise ValueError("Sự kiện chưa có WBS")
+            return {**self._wbs_ref(event_id, artifact), "wbs": artifact["wbs"]}
+    
+    def get_session_history(
+        self, session_id: str, before: Optional[int] = None, limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Page of conversation history (latest messages by default) + summary of folded turns"""
+        with self.session_locks.hold(session_id):
+            session = self.sessions.get(session_id)
+            if session is None:
+                raise ValueError("Session không tồn tại")
+            return page_history(session, before=before, limit=limit)
     
     def clear_session(self, session_id: str):
         """Clear session"""
-        if session_id not in self.sessions:
-            raise ValueError("Session không tồn tại")
-        del self.sessions[session_id]
+        with self.session_locks.hold(session_id):
+            if not self.sessions.delete(session_id):
+                raise ValueError("Session không tồn tại")
     
-    def list_active_sessions(self) -> List[Dict[str, Any]]:
-        """List all active sessions"""
-        sessions = []
-        for sid, data in self.sessions.items():
-            sessions.append({
-                "session_id": sid,
-                "created_at": data["created_at"].isoformat(),
-                "last_updated": data["last_updated"].isoformat(),
-                "message_count": len(data["messages"]),
-                "events_count": len(data.get("events", {})),
-                "current_event": data.get("current_event"),
-            })
-        return sessions
+    def list_active_sessions(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        updated_after: Optional[datetime] = None,
+        updated_before: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """Page of active sessions, most recently active first (summaries kept by the store)"""
+        return self.sessions.list_sessions(
+            limit=limit,
+            cursor=cursor,
+            updated_after=updated_after.timestamp() if updated_after else None,
+            updated_before=updated_before.timestamp() if updated_before else None,
+        )
 
 
 # Example usage
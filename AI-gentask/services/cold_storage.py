@@ -0,0 +1,159 @@
+"""
+Cold Storage - compressed blobs for idle chat sessions
+Sessions idle longer than CHAT_COLD_AFTER_SECS are moved out of the live
+dict by InMemorySessionStore: pickled (binary, keeps datetimes) and
+compressed with zlib, or zstd when the ``zstandard`` package is installed
+and CHAT_COLD_CODEC=zstd. Blobs stay in memory, or in files under
+CHAT_COLD_DIR when set. The next access decodes the session and makes it live again.
+
+Blobs are only ever read back by the process that wrote them (private
+directory, removed on close), so unpickling them is safe.
+"""
+
+import os
+import time
+import zlib
+import pickle
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+
+CHAT_COLD_AFTER_SECS = float(os.getenv("CHAT_COLD_AFTER_SECS", "600"))  # 0 = keep every session live
+CHAT_COLD_CODEC = os.getenv("CHAT_COLD_CODEC", "zlib")  # zlib | zstd
+CHAT_COLD_LEVEL = int(os.getenv("CHAT_COLD_LEVEL", "3"))
+CHAT_COLD_DIR = os.getenv("CHAT_COLD_DIR", "")  # empty: blobs kept in memory
+
+
+def _zstd():
+    try:
+        import zstandard  # optional dependency
+
+        return zstandard
+    except ImportError:
+        return None
+
+
+class ColdTier:
+    """Frozen sessions by id, in freeze order (the front was idle the longest)"""
+
+    def __init__(self, codec: str = CHAT_COLD_CODEC, level: int = CHAT_COLD_LEVEL, directory: str = CHAT_COLD_DIR):
+        if codec == "zstd" and _zstd() is None:
+            print("⚠️ CHAT_COLD_CODEC=zstd but zstandard is not installed, using zlib")
+            codec = "zlib"
+        if codec not in ("zlib", "zstd"):
+            raise ValueError(f"Unknown CHAT_COLD_CODEC '{codec}' (expected zlib | zstd)")
+        self.codec = codec
+        self.level = level
+        if codec == "zstd":
+            zstandard = _zstd()
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+        # Private per-process directory: other workers' blobs are never read
+        self.directory = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix="sessions-", dir=directory)
+        # session_id -> (blob or file path, blob bytes, live size estimate)
+        self._entries: "OrderedDict[str, Tuple[Any, int, int]]" = OrderedDict()
+        self.blob_bytes = 0
+        self.live_bytes = 0
+        self._rehydrate_ms: "deque[float]" = deque(maxlen=1024)
+        self.stats = {"frozen": 0, "rehydrated": 0}
+
+    # ====== Codec ======
+    def encode(self, session: Dict[str, Any]) -> bytes:
+        raw = pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.codec == "zstd":
+            return self._compressor.compress(raw)
+        return zlib.compress(raw, self.level)
+
+    def decode(self, blob: bytes) -> Dict[str, Any]:
+        raw = self._decompressor.decompress(blob) if self.codec == "zstd" else zlib.decompress(blob)
+        return pickle.loads(raw)
+
+    # ====== Entries ======
+    def put(self, session_id: str, blob: bytes, live_size: int) -> None:
+        self.discard(session_id)
+        stored: Any = blob
+        if self.directory:
+            stored = os.path.join(self.directory, hashlib.sha1(session_id.encode("utf-8")).hexdigest() + ".bin")
+            with open(stored, "wb") as f:
+                f.write(blob)
+        self._entries[session_id] = (stored, len(blob), live_size)
+        self.blob_bytes += len(blob)
+        self.live_bytes += live_size
+        self.stats["frozen"] += 1
+
+    def _read(self, stored: Any) -> bytes:
+        if isinstance(stored, bytes):
+            return stored
+        with open(stored, "rb") as f:
+            return f.read()
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        return self.decode(self._read(entry[0])) if entry else None
+
+    def take(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Decode and remove a frozen session (rehydration)"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        t0 = time.perf_counter()
+        session = self.decode(self._read(entry[0]))
+        self._rehydrate_ms.append((time.perf_counter() - t0) * 1000)
+        self.stats["rehydrated"] += 1
+        self.discard(session_id)
+        return session
+
+    def discard(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        stored, blob_size, live_size = entry
+        self.blob_bytes -= blob_size
+        self.live_bytes -= live_size
+        if not isinstance(stored, bytes):
+            try:
+                os.remove(stored)
+            except OSError:
+                pass
+
+    def oldest(self) -> Optional[str]:
+        return next(iter(self._entries), None)
+
+    def ids(self) -> List[str]:
+        return list(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> Dict[str, Any]:
+        timings = sorted(self._rehydrate_ms)
+
+        def pct(q: float) -> Optional[float]:
+            return round(timings[min(len(timings) - 1, int(q * len(timings)))], 3) if timings else None
+
+        return {
+            "cold_sessions": len(self._entries),
+            "cold_codec": self.codec,
+            "cold_dir": self.directory,
+            "cold_bytes": self.blob_bytes,
+            # Live size estimate of the frozen sessions minus their blobs
+            "cold_saved_bytes": self.live_bytes - self.blob_bytes,
+            "rehydrate_ms_p50": pct(0.5),
+            "rehydrate_ms_p95": pct(0.95),
+            **self.stats,
+        }
+
+    def close(self) -> None:
+        self._entries.clear()
+        self.blob_bytes = self.live_bytes = 0
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,289 @@
+"""
+Embedding Server - share one embedding model between all uvicorn workers
+Listens on a Unix socket (no network dependency), loads the model once and
+micro-batches concurrent encode requests from every worker.
+
+Run:
+    EMBED_SOCKET=/tmp/wbs-embed.sock python -m services.embedding_server
+
+Workers pick it up automatically when EMBED_SOCKET is set (see retriever._get_embedder).
+
+Wire format (both directions): 4-byte big-endian length + JSON header,
+followed for encode responses by the raw float32 matrix (rows x dimension).
+Encode requests may carry "options" (ENCODE_OPTIONS), passed to the model's
+encode(); requests are only batched together with identical options.
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embeddings import EMBED_MODEL, EMBED_BACKEND, load_embedder, embedding_info
+
+
+EMBED_SOCKET = os.getenv("EMBED_SOCKET", "")
+# How long the server waits for more requests before encoding a batch
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_CLIENT_TIMEOUT = float(os.getenv("EMBED_CLIENT_TIMEOUT", "30"))
+
+_HEADER = struct.Struct(">I")
+
+# SentenceTransformer.encode keyword arguments forwarded to the server
+ENCODE_OPTIONS = ("batch_size", "normalize_embeddings", "prompt_name", "prompt")
+# Handled by the client: the wire always carries a float32 matrix
+_CLIENT_OPTIONS = ("convert_to_numpy", "show_progress_bar")
+
+
+# ====== Framing ======
+def _pack(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    raw = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(raw)) + raw + payload
+
+
+async def _read_header(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return json.loads(await reader.readexactly(size))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding server closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+# ====== Server ======
+class EmbeddingServer:
+    """Unix-socket embedding service with a micro-batching encode loop"""
+
+    def __init__(
+        self,
+        embedder: Any,
+        socket_path: str,
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_batch: int = EMBED_MAX_BATCH,
+        info: Optional[Dict[str, Any]] = None,
+    ):
+        self.embedder = embedder
+        self.socket_path = socket_path
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.info = info or embedding_info(embedder)
+        self.queue: "asyncio.Queue[Tuple[List[str], Dict[str, Any], asyncio.Future]]" = None  # type: ignore
+        # Single encode thread: the model already uses all cores internally
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+
+    async def serve(self, ready: Optional[threading.Event] = None) -> None:
+        self.queue = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from a previous run
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        batcher = asyncio.create_task(self._batch_loop())
+        print(f"Embedding server ({self.info['model']}, {self.info['backend']}) on {self.socket_path}")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await _read_header(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                op = request.get("op", "encode")
+                if op == "info":
+                    writer.write(_pack({**self.info, "stats": self.stats}))
+                elif op == "encode":
+                    texts = [str(t) for t in request.get("texts", [])]
+                    options = request.get("options") or {}
+                    self.stats["requests"] += 1
+                    try:
+                        unsupported = sorted(set(options) - set(ENCODE_OPTIONS))
+                        if unsupported:
+                            raise ValueError(f"unsupported encode options {unsupported}")
+                        embs = await self._submit(texts, options)
+                        writer.write(_pack({"shape": list(embs.shape), "dtype": "float32"}, embs.tobytes()))
+                    except Exception as e:
+                        writer.write(_pack({"error": str(e)}))
+                else:
+                    writer.write(_pack({"error": f"unknown op '{op}'"}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _submit(self, texts: List[str], options: Dict[str, Any]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.info["dimension"]), dtype=np.float32)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, options, future))
+        return await future
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            count = len(pending[0][0])
+            deadline = loop.time() + self.window
+            # Collect whatever else arrives within the window
+            while count < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            # One encode call per distinct set of options
+            groups: Dict[str, List[Tuple[List[str], Dict[str, Any], asyncio.Future]]] = {}
+            for item in pending:
+                groups.setdefault(json.dumps(item[1], sort_keys=True), []).append(item)
+            for group in groups.values():
+                await self._encode_group(loop, group)
+
+    async def _encode_group(
+        self, loop: asyncio.AbstractEventLoop, group: List[Tuple[List[str], Dict[str, Any], asyncio.Future]]
+    ) -> None:
+        texts = [t for item, _, _ in group for t in item]
+        try:
+            embs = await loop.run_in_executor(self.executor, self._encode, texts, group[0][1])
+        except Exception as e:
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(texts)
+        offset = 0
+        for item, _, future in group:
+            if not future.done():
+                future.set_result(embs[offset:offset + len(item)])
+            offset += len(item)
+
+    def _encode(self, texts: List[str], options: Dict[str, Any]) -> np.ndarray:
+        return np.ascontiguousarray(self.embedder.encode(texts, **options), dtype=np.float32)
+
+
+# ====== Client ======
+class EmbeddingClient:
+    """
+    Drop-in replacement for SentenceTransformer.encode backed by the embedding server.
+    One connection per thread, reconnected on failure.
+
+    encode() accepts ENCODE_OPTIONS (sent to the server), convert_to_numpy
+    (False: list of row vectors) and show_progress_bar (ignored); any other
+    keyword raises TypeError instead of being silently dropped.
+    """
+
+    def __init__(self, socket_path: str = EMBED_SOCKET, timeout: float = EMBED_CLIENT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._info: Optional[Dict[str, Any]] = None
+
+    def _connect(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            finally:
+                self._local.sock = None
+
+    def _request(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], socket.socket]:
+        for attempt in range(2):
+            try:
+                sock = self._connect()
+                sock.sendall(_pack(header))
+                (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+                return json.loads(_recv_exactly(sock, size)), sock
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+        raise ConnectionError("unreachable")
+
+    def info(self) -> Dict[str, Any]:
+        if self._info is None:
+            self._info, _ = self._request({"op": "info"})
+        return self._info
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.info()["dimension"])
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        unsupported = sorted(set(kwargs) - set(ENCODE_OPTIONS) - set(_CLIENT_OPTIONS))
+        if unsupported:
+            raise TypeError(f"EmbeddingClient.encode() does not support {unsupported}")
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        header: Dict[str, Any] = {"op": "encode", "texts": texts}
+        options = {k: kwargs[k] for k in ENCODE_OPTIONS if k in kwargs}
+        if options:
+            header["options"] = options
+        response, sock = self._request(header)
+        if "error" in response:
+            raise RuntimeError(f"embedding server: {response['error']}")
+        rows, dim = response["shape"]
+        try:
+            raw = _recv_exactly(sock, rows * dim * 4)
+        except (OSError, ConnectionError):
+            self._close()
+            raise
+        embs = np.frombuffer(raw, dtype=np.float32).reshape(rows, dim)
+        if single:
+            return embs[0]
+        return embs if kwargs.get("convert_to_numpy", True) else list(embs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared embedding server (Unix socket)")
+    parser.add_argument("--socket", default=EMBED_SOCKET or "/tmp/wbs-embed.sock")
+    parser.add_argument("--window-ms", type=float, default=EMBED_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=EMBED_MAX_BATCH)
+    args = parser.parse_args()
+
+    embedder = load_embedder(EMBED_MODEL, EMBED_BACKEND)
+    embedder.encode(["warmup"])
+    server = EmbeddingServer(embedder, args.socket, window_ms=args.window_ms, max_batch=args.max_batch)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
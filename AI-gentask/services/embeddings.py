@@ -0,0 +1,82 @@
+"""
+Embedding backends - one place to load the sentence embedder
+Selected with EMBED_BACKEND:
+- torch      : SentenceTransformer in fp32 PyTorch (default)
+- onnx       : same model exported to ONNX Runtime (fp32, CPU friendly)
+- onnx-int8  : ONNX Runtime with a dynamically int8-quantized graph
+
+All backends run the same model, so vectors stay compatible with an index
+built by another backend (int8 only adds a small approximation error).
+A different model/dimension is not compatible and needs a re-index.
+"""
+
+import os
+import json
+from typing import Any, Dict, Optional
+
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# Quantized graph shipped in the model repo (or a local path) for onnx-int8
+EMBED_ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Written next to the vector store by ingestion, checked by the retriever
+EMBEDDING_INFO_FILE = "embedding.json"
+
+
+def load_embedder(model_name: str = EMBED_MODEL, backend: str = EMBED_BACKEND) -> "SentenceTransformer":
+    """Load the embedding model with the requested backend"""
+    os.environ.setdefault("USE_TF", "0")
+    # Imported lazily: processes that only talk to the embedding server never load torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        # Requires sentence-transformers[onnx]
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(
+            model_name, backend="onnx", model_kwargs={"file_name": EMBED_ONNX_INT8_FILE}
+        )
+    raise ValueError(f"Unknown EMBED_BACKEND '{backend}', expected one of {BACKENDS}")
+
+
+def embedding_info(embedder: Any, model_name: str = EMBED_MODEL, backend: str = EMBED_BACKEND) -> Dict[str, Any]:
+    """Describe the vectors an embedder produces"""
+    return {
+        "model": model_name,
+        "backend": backend,
+        "dimension": int(embedder.get_sentence_embedding_dimension()),
+    }
+
+
+def write_embedding_info(store_dir: str, info: Dict[str, Any]) -> None:
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, EMBEDDING_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+
+def read_embedding_info(store_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(store_dir, EMBEDDING_INFO_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def incompatibility(stored: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Optional[str]:
+    """
+    Return why vectors from ``current`` cannot be compared with the stored index, or None.
+
+    The backend is deliberately not compared: torch/onnx/onnx-int8 embed into the same space.
+    """
+    if not stored:
+        return None
+    if stored.get("model") != current.get("model"):
+        return f"index built with model '{stored.get('model')}', embedder is '{current.get('model')}'"
+    if stored.get("dimension") and stored.get("dimension") != current.get("dimension"):
+        return f"index dimension {stored.get('dimension')} != embedder dimension {current.get('dimension')}"
+    return None
@@ -0,0 +1,200 @@
+"""
+Conversation History - windowing, summary compaction and paging
+A session keeps its last CHAT_HISTORY_WINDOW messages verbatim. Once it
+grows CHAT_HISTORY_FOLD messages past that, the oldest turns are folded into
+``session["history_summary"]``: counters (turns, intents, time range), the
+WBS versions produced, a few recent user requests, and a short text,
+rule-based or from a cached LLM call (CHAT_HISTORY_SUMMARY=llm).
+Folding in chunks keeps the LLM variant to one call per CHAT_HISTORY_FOLD
+messages instead of one per turn.
+
+Messages are addressed by ``seq``, their position in the whole conversation
+(folded ones included), so pages stay stable while older turns are folded.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "40"))  # messages kept verbatim (0 = no folding)
+CHAT_HISTORY_FOLD = int(os.getenv("CHAT_HISTORY_FOLD", "20"))  # messages folded at once
+CHAT_HISTORY_SUMMARY = os.getenv("CHAT_HISTORY_SUMMARY", "rules")  # rules | llm
+CHAT_HISTORY_PAGE = int(os.getenv("CHAT_HISTORY_PAGE", "50"))
+CHAT_HISTORY_MAX_PAGE = 200
+CHAT_SUMMARY_CACHE_SIZE = int(os.getenv("CHAT_SUMMARY_CACHE_SIZE", "256"))
+
+NOTES_KEPT = 8  # recent user requests kept in the summary
+NOTE_CHARS = 120
+
+INTENT_LABELS = {
+    "event_planning": "lập kế hoạch",
+    "event_query": "hỏi về sự kiện",
+    "context_switch": "chuyển sự kiện",
+    "general_chat": "trò chuyện",
+    "greeting": "chào hỏi",
+    "unknown": "khác",
+}
+
+# (previous summary text, folded messages) -> text
+Summarizer = Callable[[str, List[Dict[str, Any]]], str]
+
+
+def empty_summary() -> Dict[str, Any]:
+    return {
+        "messages": 0,
+        "turns": 0,
+        "from": None,
+        "to": None,
+        "intents": {},
+        "wbs": {},  # event_id -> latest WBS version referenced in folded replies
+        "notes": [],
+        "text": "",
+    }
+
+
+def folded_count(session: Dict[str, Any]) -> int:
+    return (session.get("history_summary") or {}).get("messages", 0)
+
+
+def total_messages(session: Dict[str, Any]) -> int:
+    """Messages in the whole conversation, folded ones included"""
+    return folded_count(session) + len(session.get("messages", []))
+
+
+# ====== Summaries ======
+def rule_summary_text(summary: Dict[str, Any]) -> str:
+    """Short Vietnamese recap built from the summary counters"""
+    if not summary["turns"]:
+        return ""
+    intents = sorted(summary["intents"].items(), key=lambda kv: -kv[1])
+    # Messages from older session rows may have no timestamp
+    start, end = (summary.get("from") or "")[:16], (summary.get("to") or "")[:16]
+    parts = [f"{summary['turns']} lượt trước" + (f" ({start} → {end})" if start or end else "")]
+    if intents:
+        parts.append(", ".join(f"{n} {INTENT_LABELS.get(i, i)}" for i, n in intents))
+    if summary["wbs"]:
+        parts.append("WBS: " + ", ".join(f"{e} v{v}" for e, v in summary["wbs"].items()))
+    if summary["notes"]:
+        parts.append("Yêu cầu gần nhất: " + "; ".join(f'"{n}"' for n in summary["notes"][-3:]))
+    return ". ".join(parts)
+
+
+_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+_summary_cache_lock = threading.Lock()
+
+
+def llm_summarizer(client: Any, model: str = "gpt-4o-mini") -> Summarizer:
+    """
+    Summarizer backed by a chat completion, cached by content hash so the same
+    chunk (retries, copied sessions) is summarized once per process.
+    """
+
+    def summarize(previous: str, messages: List[Dict[str, Any]]) -> str:
+        transcript = "\n".join(f"{m.get('role')}: {str(m.get('content', ''))[:400]}" for m in messages)
+        key = hashlib.sha1(json.dumps([previous, transcript], ensure_ascii=False).encode("utf-8")).hexdigest()
+        with _summary_cache_lock:
+            if key in _summary_cache:
+                _summary_cache.move_to_end(key)
+                return _summary_cache[key]
+
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Tóm tắt cuộc hội thoại lập kế hoạch sự kiện trong tối đa 80 từ tiếng Việt: "
+                               "sự kiện, thông tin đã chốt, WBS đã tạo, câu hỏi còn mở. Chỉ trả về đoạn tóm tắt.",
+                },
+                {"role": "user", "content": f"Tóm tắt trước đó:\n{previous or '(không có)'}\n\nCác lượt tiếp theo:\n{transcript}"},
+            ],
+            temperature=0.2,
+            max_tokens=200,
+        )
+        text = (response.choices[0].message.content or "").strip()
+        with _summary_cache_lock:
+            _summary_cache[key] = text
+            while len(_summary_cache) > CHAT_SUMMARY_CACHE_SIZE:
+                _summary_cache.popitem(last=False)
+        return text
+
+    return summarize
+
+
+# ====== Folding ======
+def fold_history(
+    session: Dict[str, Any],
+    window: int = CHAT_HISTORY_WINDOW,
+    fold: int = CHAT_HISTORY_FOLD,
+    summarizer: Optional[Summarizer] = None,
+) -> int:
+    """
+    Fold the oldest messages into the summary once there are ``window + fold``;
+    returns how many were folded. Cuts on a user message, so a turn is only
+    split when the window holds no user message at all.
+    """
+    messages = session.get("messages") or []
+    if not window or len(messages) < window + max(fold, 1):
+        return 0
+    cut = len(messages) - window
+    while cut < len(messages) and messages[cut].get("role") != "user":
+        cut += 1
+    if cut == len(messages):
+        # No turn starts inside the window: split a turn rather than fold it all
+        cut = len(messages) - window
+    folded = messages[:cut]
+    if not folded:
+        return 0
+
+    summary = session.get("history_summary") or empty_summary()
+    summary["messages"] += len(folded)
+    summary["from"] = summary["from"] or folded[0].get("timestamp")
+    summary["to"] = folded[-1].get("timestamp")
+    for m in folded:
+        if m.get("role") == "user":
+            summary["turns"] += 1
+            summary["notes"].append(str(m.get("content", ""))[:NOTE_CHARS])
+        else:
+            intent = m.get("intent") or "unknown"
+            summary["intents"][intent] = summary["intents"].get(intent, 0) + 1
+            ref = (m.get("data") or {}).get("wbs_ref") if isinstance(m.get("data"), dict) else None
+            if ref:
+                summary["wbs"][ref["event_id"]] = ref["version"]
+    summary["notes"] = summary["notes"][-NOTES_KEPT:]
+
+    text = None
+    if summarizer is not None:
+        try:
+            text = summarizer(summary["text"], folded)
+        except Exception as e:
+            print(f"⚠️ History summary failed ({e}), using rule-based summary")
+    summary["text"] = text or rule_summary_text(summary)
+
+    session["history_summary"] = summary
+    del messages[:cut]
+    return len(folded)
+
+
+# ====== Paging ======
+def page_history(session: Dict[str, Any], before: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Newest-first window over the verbatim messages: the ``limit`` messages with
+    ``seq < before`` (latest ones when ``before`` is None), oldest first.
+    ``next_before`` pages further back; folded turns are only in ``summary``.
+    """
+    limit = max(1, min(limit or CHAT_HISTORY_PAGE, CHAT_HISTORY_MAX_PAGE))
+    messages = session.get("messages", [])
+    base = folded_count(session)
+    end = len(messages) if before is None else max(0, min(before - base, len(messages)))
+    start = max(0, end - limit)
+    page = [{"seq": base + i, **messages[i]} for i in range(start, end)]
+    return {
+        "history": page,
+        "summary": session.get("history_summary"),
+        "total_messages": base + len(messages),
+        "next_before": base + start if start > 0 else None,
+        "has_more": start > 0,
+    }
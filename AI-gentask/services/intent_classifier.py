@@ -0,0 +1,191 @@
+"""
+Intent Classifier - local TF-IDF (char n-gram) + linear models
+Predicts the chat intent and the event type of a message in-process
+(sub-millisecond, batch-capable), so confident messages skip the LLM.
+
+Trained offline from kb/chat/messages.jsonl:
+    python scripts/train_intent_classifier.py
+The model file is loaded once per process; without it (or without
+scikit-learn) ``get_intent_classifier()`` returns None and ChatProcessor
+keeps its regex / LLM behaviour.
+"""
+
+import os
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+INTENT_MODEL_FILE = os.getenv("INTENT_MODEL_FILE", "./kb/chat/intent_model.joblib")
+# Minimum predicted probability for a prediction to be trusted (LLM skipped)
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.6"))
+
+INTENTS = ("greeting", "event_planning", "event_query", "context_switch", "general_chat")
+
+
+def build_models(messages: List[str], intents: List[str], event_types: List[str]) -> Dict[str, Any]:
+    """Fit the shared vectorizer + intent head + event-type head"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), lowercase=True, sublinear_tf=True, min_df=1)
+    X = vectorizer.fit_transform(messages)
+    intent_clf = LogisticRegression(max_iter=2000, C=10.0).fit(X, intents)
+
+    typed = [i for i, t in enumerate(event_types) if t]
+    type_clf = None
+    if typed and len({event_types[i] for i in typed}) > 1:
+        type_clf = LogisticRegression(max_iter=2000, C=10.0).fit(X[typed], [event_types[i] for i in typed])
+    return {"vectorizer": vectorizer, "intent": intent_clf, "event_type": type_clf}
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+
+def _head_columns(clf: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (weights n_features x n_classes, bias) of a linear head. A binary head
+    has a single row (score of classes_[1]): pairing it with a zero column
+    makes the softmax equal predict_proba's [1 - sigmoid, sigmoid].
+    """
+    coef, intercept = clf.coef_.T, clf.intercept_
+    if len(clf.classes_) == 2:
+        coef = np.hstack([np.zeros_like(coef), coef])
+        intercept = np.concatenate([np.zeros_like(intercept), intercept])
+    return coef, intercept
+
+
+class IntentClassifier:
+    """
+    Prediction runs on the fitted parameters directly: the analyzer's n-grams
+    of a batch become sublinear TF-IDF rows (L2-normalized, as TfidfVectorizer
+    does) of one CSR matrix, and both linear heads are scored with a single
+    sparse x dense product. This avoids sklearn's per-call validation, which
+    dominates for short messages.
+    """
+
+    def __init__(self, models: Dict[str, Any], threshold: float = INTENT_CONFIDENCE):
+        self.vectorizer = models["vectorizer"]
+        self.intent_clf = models["intent"]
+        self.type_clf = models.get("event_type")
+        self.threshold = threshold
+        self.info = {k: v for k, v in models.items() if k not in ("vectorizer", "intent", "event_type")}
+
+        self._analyzer = self.vectorizer.build_analyzer()
+        self._vocab: Dict[str, int] = self.vectorizer.vocabulary_
+        self._idf = self.vectorizer.idf_
+        self._sublinear = self.vectorizer.sublinear_tf
+        # Both heads stacked: one product gives intent and event-type scores
+        heads = [_head_columns(h) for h in [self.intent_clf] + ([self.type_clf] if self.type_clf is not None else [])]
+        self._weights = np.ascontiguousarray(np.hstack([w for w, _ in heads]), dtype=np.float64)
+        self._bias = np.concatenate([b for _, b in heads])
+        self._n_intents = len(self.intent_clf.classes_)
+        self._intent_labels = [str(c) for c in self.intent_clf.classes_]
+        self._type_labels = [str(c) for c in self.type_clf.classes_] if self.type_clf is not None else []
+
+    def _tfidf(self, messages: List[str]) -> Tuple[np.ndarray, np.ndarray, List[int]]:
+        """L2-normalized TF-IDF rows of a batch in CSR form: (values, columns, indptr)"""
+        indptr = [0]
+        cols: List[int] = []
+        tfs: List[int] = []
+        for message in messages:
+            counts = Counter(t for t in self._analyzer(message) if t in self._vocab)
+            cols.extend(self._vocab[t] for t in counts)
+            tfs.extend(counts.values())
+            indptr.append(len(cols))
+        cols_arr = np.asarray(cols, dtype=np.intp)
+        tf = np.asarray(tfs, dtype=np.float64)
+        vals = (1.0 + np.log(tf) if self._sublinear else tf) * self._idf[cols_arr]
+        # Row norms; rows without known n-grams stay empty (bias only)
+        rows = np.repeat(np.arange(len(messages)), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=vals * vals, minlength=len(messages)))
+        vals /= norms[rows]
+        return vals, cols_arr, indptr
+
+    def _probabilities(self, messages: List[str]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        vals, cols, indptr = self._tfidf(messages)
+        if len(messages) == 1:
+            # One row: gathering its weight rows is the same product without
+            # the cost of building a sparse matrix
+            scores = (vals @ self._weights[cols])[None, :] + self._bias
+        else:
+            from scipy.sparse import csr_matrix
+
+            X = csr_matrix((vals, cols, indptr), shape=(len(messages), len(self._idf)))
+            scores = np.asarray(X @ self._weights) + self._bias
+        intent_proba = _softmax(scores[:, : self._n_intents])
+        type_proba = _softmax(scores[:, self._n_intents:]) if self._type_labels else None
+        return intent_proba, type_proba
+
+    @classmethod
+    def load(cls, path: str = INTENT_MODEL_FILE, threshold: float = INTENT_CONFIDENCE) -> "IntentClassifier":
+        import joblib
+
+        return cls(joblib.load(path), threshold=threshold)
+
+    def predict(self, messages: List[str]) -> List[Dict[str, Any]]:
+        """
+        Vectorized prediction for a batch of messages.
+
+        Each result: intent, intent_confidence, event_type (None if no type
+        head), event_type_confidence, confident (intent above threshold).
+        """
+        if not messages:
+            return []
+        intent_proba, type_proba = self._probabilities(messages)
+        intent_idx = intent_proba.argmax(axis=1)
+        if type_proba is not None:
+            type_idx = type_proba.argmax(axis=1)
+        results = []
+        for row in range(len(messages)):
+            intent_conf = float(intent_proba[row, intent_idx[row]])
+            result = {
+                "intent": self._intent_labels[intent_idx[row]],
+                "intent_confidence": intent_conf,
+                "event_type": None,
+                "event_type_confidence": 0.0,
+                "confident": intent_conf >= self.threshold,
+            }
+            if type_proba is not None:
+                result["event_type"] = self._type_labels[type_idx[row]]
+                result["event_type_confidence"] = float(type_proba[row, type_idx[row]])
+            results.append(result)
+        return results
+
+    def predict_one(self, message: str) -> Dict[str, Any]:
+        return self.predict([message])[0]
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Process-wide classifier, loaded once; None if the model is not available"""
+    global _classifier, _classifier_loaded
+    if _classifier_loaded:
+        return _classifier
+    with _classifier_lock:
+        if not _classifier_loaded:
+            if os.path.exists(INTENT_MODEL_FILE):
+                try:
+                    _classifier = IntentClassifier.load(INTENT_MODEL_FILE)
+                except Exception as e:
+                    print(f"⚠️ Could not load intent classifier '{INTENT_MODEL_FILE}': {e}")
+            _classifier_loaded = True
+    return _classifier
+
+
+@lru_cache(maxsize=512)
+def classify_message(message: str) -> Optional[Dict[str, Any]]:
+    """Cached single-message prediction (classification and extraction share it)"""
+    classifier = get_intent_classifier()
+    return classifier.predict_one(message) if classifier is not None else None
@@ -0,0 +1,201 @@
+"""
+Lexical Index - BM25 inverted index over KB documents
+Exact Vietnamese domain terms ("giấy phép công an", "technical rider") are
+matched without a model forward pass. Tokens are accent-folded, and adjacent
+word pairs are indexed too so multi-word terms rank above scattered words.
+
+Built by scripts/ingest_global_chroma.py (streamed through ``BM25Writer``)
+into ``bm25_index.json`` next to the vector store; queried directly
+(``search``) or fused with vector results in services/retriever.py.
+"""
+
+import os
+import json
+import math
+import tempfile
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
+
+from utils.text_normalize import tokenize
+
+
+BM25_FILE = "bm25_index.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def index_terms(text: str) -> List[str]:
+    """Unigrams + adjacent bigrams ("giay_phep") of the folded text"""
+    tokens = tokenize(text)
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class BM25Index:
+    """In-memory inverted index: term -> [(doc index, term frequency)]"""
+
+    def __init__(self):
+        self.doc_ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.documents: List[str] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.idf: Dict[str, float] = {}
+        self.avg_len = 0.0
+        self.position: Dict[str, int] = {}
+
+    # ====== Build ======
+    @classmethod
+    def build(cls, docs: Dict[str, str], metadatas: Optional[Dict[str, Dict[str, Any]]] = None) -> "BM25Index":
+        index = cls()
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, text in docs.items():
+            index._add(postings, doc_id, text, (metadatas or {}).get(doc_id, {}))
+            index.documents.append(text)
+        index.postings = dict(postings)
+        index._finalize()
+        return index
+
+    def _add(self, postings: Dict[str, List[Tuple[int, int]]], doc_id: str, text: str, meta: Dict[str, Any]) -> None:
+        i = len(self.doc_ids)
+        terms = index_terms(text)
+        self.doc_ids.append(doc_id)
+        self.metadatas.append(meta)
+        self.doc_lens.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings[term].append((i, tf))
+
+    def _finalize(self) -> None:
+        n = len(self.doc_ids)
+        self.avg_len = (sum(self.doc_lens) / n) if n else 0.0
+        self.position = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    # ====== Query ======
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 12,
+        allow: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, score); ``allow`` filters on document metadata"""
+        if not self.doc_ids:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        avg_len = self.avg_len or 1.0
+        for term in set(index_terms(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for i, tf in plist:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens[i] / avg_len)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        out = []
+        for i, score in ranked:
+            if allow is not None and not allow(self.metadatas[i]):
+                continue
+            out.append((self.doc_ids[i], score))
+            if len(out) >= top_k:
+                break
+        return out
+
+    # ====== Persistence ======
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "doc_ids": self.doc_ids,
+            "metadatas": self.metadatas,
+            "documents": self.documents,
+            "doc_lens": self.doc_lens,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        index = cls()
+        index.doc_ids = data["doc_ids"]
+        index.metadatas = data.get("metadatas") or [{} for _ in index.doc_ids]
+        index.documents = data.get("documents") or ["" for _ in index.doc_ids]
+        index.doc_lens = data["doc_lens"]
+        index.postings = {t: [tuple(p) for p in plist] for t, plist in data["postings"].items()}
+        index._finalize()
+        return index
+
+    def save(self, store_dir: str) -> str:
+        path = os.path.join(store_dir, BM25_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, store_dir: str) -> Optional["BM25Index"]:
+        try:
+            with open(os.path.join(store_dir, BM25_FILE), "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+class BM25Writer:
+    """
+    Streaming ``BM25Index.build(...).save(...)``: documents are added one at a
+    time and their texts spooled to a temp file, so building the index for a
+    large KB holds the postings but never every document text at once.
+    """
+
+    def __init__(self, spool_dir: Optional[str] = None):
+        self._index = BM25Index()
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._spool: TextIO = tempfile.TemporaryFile("w+", encoding="utf-8", dir=spool_dir)
+
+    def __len__(self) -> int:
+        return len(self._index.doc_ids)
+
+    def add(self, doc_id: str, text: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        self._index._add(self._postings, doc_id, text, meta or {})
+        # One JSON string per line (newlines inside the text are escaped)
+        self._spool.write(json.dumps(text, ensure_ascii=False) + "\n")
+
+    def save(self, store_dir: str) -> str:
+        """Same file as ``BM25Index.save``; documents are copied from the spool"""
+        index = self._index
+        path = os.path.join(store_dir, BM25_FILE)
+        tmp = path + ".tmp"
+
+        def dump(value: Any) -> str:
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+        self._spool.seek(0)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f'{{"doc_ids":{dump(index.doc_ids)},"metadatas":{dump(index.metadatas)},"documents":[')
+            for i, line in enumerate(self._spool):
+                f.write(("," if i else "") + line.rstrip("\n"))
+            f.write(f'],"doc_lens":{dump(index.doc_lens)},"postings":{dump(self._postings)}}}')
+        os.replace(tmp, path)
+        return path
+
+    def close(self) -> None:
+        self._spool.close()
+
+    def __enter__(self) -> "BM25Writer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several ranked doc_id lists: score = sum 1 / (k + rank)"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
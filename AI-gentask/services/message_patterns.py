@@ -0,0 +1,286 @@
+"""
+Message Patterns - precompiled intent/extraction scanner for ChatProcessor
+``scan_message`` lowercases and accent-folds the message once
+(utils.text_normalize.fold_accents) and runs one precompiled scanner over the
+folded text. At every candidate position a trie of all literals (planning /
+event type / department keywords, query and switch words, folded and
+deduplicated) is tried together with the date and headcount patterns; shorter
+literals that are prefixes of the captured one come from a table built at
+import. Intent signals and extracted fields come back together.
+
+"hau can" and "hậu cần" therefore match the same keyword without listing both
+spellings. A match only counts if the user typed the keyword's own diacritics
+or none at all, so "bạn" is not "ban" (department); plain spellings that are
+common words of their own (AMBIGUOUS_UNACCENTED: "ngay" = "ngay lập tức"...)
+only count with their diacritics.
+
+Venue and event-name captures keep the user's accents and still run as two
+precompiled searches on the lowercased text.
+"""
+
+import re
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from utils.text_normalize import fold_accents
+
+
+# ====== Keyword families (substring match) ======
+PLANNING_KEYWORDS = [
+    'tổ chức', 'sự kiện', 'event', 'concert', 'hội nghị', 'festival',
+    'khai giảng', 'khai mạc', 'bế mạc', 'opening', 'closing',
+    'ngày', 'tháng', 'địa điểm', 'venue', 'người', 'headcount',
+    'ban', 'department', 'team', 'hậu cần', 'marketing', 'chuyên môn', 'tài chính',
+    'đường 30m', 'phòng học', 'sảnh', 'tầng',
+]
+
+# Order matters: the first event type with a matching keyword wins
+EVENT_TYPE_KEYWORDS = {
+    "concert_opening": ["concert", "show", "nhạc", "âm nhạc", "khai giảng", "khai mạc", "opening"],
+    "conference": ["hội nghị", "conference", "seminar", "workshop"],
+    "food_festival": ["festival", "lễ hội", "food", "ẩm thực"],
+    "sport_competition": ["thi đấu", "thể thao", "giải", "competition"],
+    "career_fair": ["career fair", "ngày hội việc làm", "job fair"],
+}
+
+# Canonical department name -> keywords (include typos; unaccented spellings match through folding)
+DEPARTMENT_KEYWORDS = {
+    "Hậu cần": ["hậu cần", "logistics"],
+    "Marketing": ["marketing", "maketing", "media", "truyền thông"],
+    "Chuyên môn": ["chuyên môn", "technical", "kỹ thuật"],
+    "Tài chính": ["tài chính", "finance"],
+}
+
+# Folded spellings that are everyday words without their accents ("ngay" = right
+# away, "thang" = ladder, "cua" = crab...): typed plain they are not the keyword
+AMBIGUOUS_UNACCENTED = frozenset({"ngay", "thang", "tang", "giai", "nhac", "cua"})
+
+# ====== Word families (\b-delimited) ======
+QUERY_WORDS = [
+    'task', 'công việc', 'deadline', 'tiến độ', 'rủi ro', 'risk',
+    'của', 'trong', 'sự kiện', 'event',
+    'show', 'xem', 'hiển thị', 'list',
+]
+SWITCH_WORDS = ['chuyển sang', 'switch to', 'đổi sang', 'sang sự kiện']
+
+GREETING_RE = re.compile(
+    r'^(?:(?:xin chào|chào|hello|hi|hey|good morning|good afternoon)[\s!.]*'
+    r'|(?:bạn là ai|bạn có thể làm gì|giới thiệu)[\s!.?]*)$'
+)
+
+# ====== Field patterns (accent-folded text) ======
+# Tried at the scanner's positions next to the literal trie, grouped by the
+# characters they can start with so the engine skips a whole group at once.
+# Zero-width as well, so e.g. "với 25/12/2024" yields both a "với N" and a date.
+FIELD_PATTERNS = {
+    r"\d": [
+        r"(?P<dmy>(?P<dmy_d>\d{1,2})/(?P<dmy_m>\d{1,2})/(?P<dmy_y>\d{4}))",
+        r"(?P<ymd>\d{4}-\d{2}-\d{2})",
+        r"(?P<hc_nguoi>(?P<hc_nguoi_n>\d+)\s*nguoi)",
+    ],
+    r"[nvh]": [
+        r"(?P<ngay>ngay\s+(?P<ngay_d>\d{1,2})[/ ](?P<ngay_m>\d{1,2})[/ ](?P<ngay_y>\d{4}))",
+        r"(?P<ngay_short>ngay \d{1,2})",
+        r"(?P<hc_voi>voi\s+(?P<hc_voi_n>\d+))",
+        r"(?P<hc_kw>headcount[::\s]+(?P<hc_kw_n>\d+))",
+    ],
+}
+# kind -> (word checked for accents, at the start of the match?); followed by
+# a number the plain spelling is not ambiguous, so only wrong accents reject it
+_FIELD_WORDS = {
+    "ngay": ("ngày", True),
+    "ngay_short": ("ngày", True),
+    "hc_nguoi": ("người", False),
+    "hc_voi": ("với", True),
+    "hc_kw": ("headcount", True),
+}
+# Literals a field match starts with (the scanner reports one alternative per position)
+_FIELD_LITERALS = {"ngay": "ngay", "ngay_short": "ngay", "hc_kw": "headcount"}
+_DATE_KINDS = frozenset({"dmy", "ymd", "ngay", "ngay_short"})
+
+# Venue / name patterns stop at delimiters the field scanner also needs
+# ("với", digits), so they run as separate (precompiled) searches.
+VENUE_RES = [
+    re.compile(r'(?:tại|ở|at|venue[::\s]+)([^,\d\.]+?)(?:\s*,|\s+với|\s+\d|$)'),
+    re.compile(r'(đường 30m|phòng học|sảnh tòa học|tầng 5 gamma)'),
+]
+EVENT_NAME_RES = [
+    re.compile(r'(concert|sự kiện|event|hội nghị|festival)\s+([^,\d]{5,40})'),
+    re.compile(r'(khai giảng|khai mạc|bế mạc)(?:\s+([^,\d]{0,30}))?'),
+]
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Prefix-factored alternation ("ng(?:ay(?: hoi viec lam)?|uoi)"): the regex
+    engine follows one branch per character instead of trying every keyword
+    at every position. Greedy optional suffixes keep longest-match semantics.
+    """
+    root: Dict[str, Any] = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(root)
+
+
+# ====== Literal table ======
+# folded literal -> spellings it stands for ("ngay" <- "ngày")
+_SPELLINGS: Dict[str, FrozenSet[str]] = {}
+for _word in PLANNING_KEYWORDS + QUERY_WORDS + SWITCH_WORDS + [
+    kw for kws in list(EVENT_TYPE_KEYWORDS.values()) + list(DEPARTMENT_KEYWORDS.values()) for kw in kws
+]:
+    _SPELLINGS[fold_accents(_word)] = _SPELLINGS.get(fold_accents(_word), frozenset()) | {_word}
+
+# Shorter literals that are prefixes of a captured one (Aho-Corasick output
+# links): every start position is scanned, so only same-position ones are needed
+_PREFIXES: Dict[str, Tuple[str, ...]] = {
+    lit: tuple(sorted((k for k in _SPELLINGS if lit.startswith(k)), key=len)) for lit in _SPELLINGS
+}
+
+_PLANNING_SET = frozenset(fold_accents(w) for w in PLANNING_KEYWORDS)
+_QUERY_SET = frozenset(fold_accents(w) for w in QUERY_WORDS)
+_SWITCH_SET = frozenset(fold_accents(w) for w in SWITCH_WORDS)
+_WORD_SET = _QUERY_SET | _SWITCH_SET  # \b-delimited, the rest are substrings
+_EVENT_TYPES = [(t, frozenset(fold_accents(k) for k in kws)) for t, kws in EVENT_TYPE_KEYWORDS.items()]
+_DEPARTMENTS = [(d, frozenset(fold_accents(k) for k in kws)) for d, kws in DEPARTMENT_KEYWORDS.items()]
+
+_FIRST_CHARS = re.escape("".join(sorted({lit[0] for lit in _SPELLINGS} | set("0123456789nvh"))))
+_FIELD_BRANCHES = "|".join(f"(?={first})(?:{'|'.join(patterns)})" for first, patterns in FIELD_PATTERNS.items())
+SCAN_RE = re.compile(rf"(?=[{_FIRST_CHARS}])(?={_FIELD_BRANCHES}|(?P<lit>{_trie_pattern(list(_SPELLINGS))}))")
+
+
+def _typed_as(span: str, spellings: FrozenSet[str], ambiguous: bool = False) -> bool:
+    """Typed with the keyword's own diacritics, or (unless ambiguous) without any"""
+    if span in spellings:
+        return True
+    if span.isascii():
+        return not ambiguous
+    # Partly accented: every accented character must be the keyword's
+    return any(all(a == b or a < "\x80" for a, b in zip(span, s)) for s in spellings)
+
+
+def _fold_aligned(text: str) -> str:
+    """fold_accents(text), one character per character so offsets map back to ``text``"""
+    folded = fold_accents(text)
+    if len(folded) == len(text):
+        return folded
+    # Stray combining marks / characters NFD splits into several letters
+    return "".join(f if len(f := fold_accents(ch)) == 1 else ch for ch in text)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _valid_date(day: str, month: str, year: str) -> Optional[str]:
+    try:
+        return datetime(int(year), int(month), int(day)).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=512)
+def scan_message(message: str) -> Dict[str, Any]:
+    """
+    Normalize once and collect intent signals + extracted fields in one scan.
+
+    Cached per message text, so classification and extraction of the same
+    message share one scan. Callers must not mutate the result.
+    """
+    text = message.lower().strip()
+    if not text.isascii():
+        text = unicodedata.normalize("NFC", text)
+    folded = _fold_aligned(text)
+    n = len(folded)
+
+    found: set = set()
+    has_query = has_switch = has_date = False
+    # Only the leftmost match of a format counts, valid or not ("31/02/2026"
+    # must not yield "1/02/2026" from the next position)
+    dates: Dict[str, Optional[str]] = {}
+    counts: Dict[str, int] = {}
+
+    for m in SCAN_RE.finditer(folded):
+        pos = m.start()
+        # The outer group of the matching alternative closes last
+        kind = m.lastgroup
+        if kind == "lit":
+            for lit in _PREFIXES[m.group("lit")]:
+                end = pos + len(lit)
+                if not _typed_as(text[pos:end], _SPELLINGS[lit], lit in AMBIGUOUS_UNACCENTED):
+                    continue
+                if lit in _WORD_SET and (pos == 0 or not _is_word_char(folded[pos - 1])) and (
+                    end == n or not _is_word_char(folded[end])
+                ):
+                    has_query = has_query or lit in _QUERY_SET
+                    has_switch = has_switch or lit in _SWITCH_SET
+                found.add(lit)
+            continue
+
+        if kind in _FIELD_WORDS:
+            word, at_start = _FIELD_WORDS[kind]
+            span = text[pos:pos + len(word)] if at_start else text[m.end(kind) - len(word):m.end(kind)]
+            if not _typed_as(span, frozenset((word,))):
+                continue
+        if kind in _FIELD_LITERALS:
+            found.add(_FIELD_LITERALS[kind])
+        if kind in _DATE_KINDS:
+            has_date = True
+        # The first match of each kind is the leftmost one, as with re.search
+        if kind == "dmy" and "dmy" not in dates:
+            dates["dmy"] = _valid_date(m.group("dmy_d"), m.group("dmy_m"), m.group("dmy_y"))
+        elif kind == "ymd" and "ymd" not in dates:
+            dates["ymd"] = m.group("ymd")
+        elif kind == "ngay" and "ngay" not in dates:
+            dates["ngay"] = _valid_date(m.group("ngay_d"), m.group("ngay_m"), m.group("ngay_y"))
+        elif kind.startswith("hc_") and kind not in counts:
+            counts[kind] = int(m.group(f"{kind}_n"))
+
+    # Priority between formats is the order of the original pattern lists
+    event_date = next((dates[k] for k in ("dmy", "ymd", "ngay") if dates.get(k)), None)
+    headcount = next((counts[k] for k in ("hc_nguoi", "hc_voi", "hc_kw") if k in counts), None)
+
+    return {
+        "text": text,
+        "is_greeting": len(text) < 30 and GREETING_RE.search(text) is not None,
+        "planning_keyword_count": len(found & _PLANNING_SET),
+        "has_date": has_date,
+        "has_query": has_query,
+        "has_switch": has_switch,
+        "event_type": next((t for t, kws in _EVENT_TYPES if not kws.isdisjoint(found)), None),
+        "event_date": event_date,
+        "headcount_total": headcount,
+        "departments": [d for d, kws in _DEPARTMENTS if not kws.isdisjoint(found)],
+    }
+
+
+def extract_venue(text: str) -> Optional[str]:
+    for pattern in VENUE_RES:
+        m = pattern.search(text)
+        if m:
+            return m.group(1).strip()
+    return None
+
+
+def extract_event_name(text: str) -> Optional[str]:
+    for pattern in EVENT_NAME_RES:
+        m = pattern.search(text)
+        if m:
+            if m.lastindex >= 2 and m.group(2):
+                # Has explicit name
+                return f"{m.group(1).title()} {m.group(2).strip()}"
+            # Just the type
+            return m.group(1).title()
+    return None
@@ -5,10 +5,11 @@ Combines template reliability with LLM flexibility and RAG context awareness
 UPDATED: Only returns 'departments' with full task info (no separate 'tasks' field)
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Mapping, Tuple
 from datetime import datetime, timedelta
 import os
 import sys
+import copy
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -77,10 +78,86 @@ def generate_epic_from_department(department: str, epic_id: str) -> Dict[str, An
     }
 
 
+def _as_text(value: Any) -> str:
+    """LLM extraction sometimes returns {"name": ...} objects instead of strings"""
+    if isinstance(value, dict):
+        return str(value.get("name") or value.get("department") or next(iter(value.values()), ""))
+    return str(value)
+
+
+# ====== Early stages ======
+# Their inputs (type, venue, headcount, departments) usually arrive before the
+# event date, so the chat processor can run them speculatively
+# (services/speculation.py) and hand the results to run_pipeline_with_rag.
+def rag_stage(
+    event_type: str,
+    venue_tier: str,
+    headcount_total: int,
+    departments: Tuple[str, ...],
+    special_requirements: Tuple[str, ...],
+) -> Dict[str, Any]:
+    """Similar past events, best practices and venue requirements"""
+    rag = SimpleRAGEngine()
+    similar_events = rag.retrieve_similar_events(
+        event_type=event_type,
+        venue_tier=venue_tier,
+        headcount_total=headcount_total,
+        departments=list(departments),
+        top_k=3
+    )
+    best_practices = rag.extract_best_practices(similar_events)
+    return {
+        "similar_events": similar_events,
+        "best_practices": best_practices,
+        "venue_reqs": rag.get_venue_specific_requirements(venue_tier),
+        "all_special_reqs": list(set(list(special_requirements) + best_practices.get("special_requirements", []))),
+    }
+
+
+def risk_stage(departments: Tuple[str, ...], venue_tier: str, event_type: str) -> Dict[str, Any]:
+    """Risk catalog per department + overall, scaled by venue tier"""
+    return {
+        "by_department": generate_risks_by_department(
+            departments=list(departments),
+            venue_tier=venue_tier,
+            event_type=event_type
+        ),
+        "overall": generate_overall_risks(
+            venue_tier=venue_tier,
+            event_type=event_type
+        ),
+    }
+
+
+def early_stages(event_input: Mapping[str, Any]) -> Dict[str, Tuple[Tuple, Callable[..., Any], Tuple]]:
+    """
+    name -> (cache key, function, args) of each early stage, with the same
+    defaults as run_pipeline_with_rag so speculative keys match the final run.
+    """
+    event_type = event_input.get("event_type", "conference")
+    venue = event_input.get("venue", "FPT University")
+    headcount_total = event_input.get("headcount_total", 50)
+    # Strings only: the tuples are cache keys (dicts are unhashable)
+    departments = tuple(_as_text(d) for d in event_input.get("departments", []))
+    special = tuple(_as_text(r) for r in event_input.get("special_requirements", []))
+    venue_tier = classify_venue(venue)
+    unique_depts = tuple(dict.fromkeys(get_department_bucket(d) for d in departments))
+
+    rag_args = (event_type, venue_tier, headcount_total, departments, special)
+    risk_args = (unique_depts, venue_tier, event_type)
+    return {
+        "venue": (("venue", venue), classify_venue, (venue,)),
+        "rag": (("rag",) + rag_args, rag_stage, rag_args),
+        "risks": (("risks",) + risk_args, risk_stage, risk_args),
+    }
+
+
 def run_pipeline_with_rag(
     event_input: Dict[str, Any],
     use_llm: bool = True,
-    llm_mode: str = "enhance"  # "enhance" or "generate"
+    llm_mode: str = "enhance",  # "enhance" or "generate"
+    on_section: Optional[Callable[[str, Any], None]] = None,
+    precomputed: Optional[Mapping[Tuple, Any]] = None,
 ) -> Dict[str, Any]:
     """
     Main WBS generation pipeline with RAG + LLM
@@ -91,6 +168,11 @@ def run_pipeline_with_rag(
         event_input: Event details dict
         use_llm: Whether to use LLM (set False to fallback to pure templates)
         llm_mode: "enhance" (lightweight) or "generate" (full generation)
+        on_section: Called as each WBS section is ready (streaming chat):
+            ("extracted_info", dict), ("department", {department, epic_id, tasks})
+            per epic, ("epics_task", list), ("risks", dict)
+        precomputed: Early stage results by cache key (see early_stages);
+            stages without a result run here
         
     Returns:
         Complete WBS with extracted_info, epics_task, departments (with full tasks), risks
@@ -102,8 +184,8 @@ def run_pipeline_with_rag(
     event_date = event_input.get("event_date", "")
     venue = event_input.get("venue", "FPT University")
     headcount_total = event_input.get("headcount_total", 50)
-    departments = event_input.get("departments", [])
-    special_requirements = event_input.get("special_requirements", [])
+    departments = [_as_text(d) for d in event_input.get("departments", [])]
+    special_requirements = [_as_text(r) for r in event_input.get("special_requirements", [])]
     
     # Validate event_date
     try:
@@ -111,29 +193,26 @@ def run_pipeline_with_rag(
     except:
         event_date = datetime.now().strftime("%Y-%m-%d")
     
-    # Classify venue
-    venue_tier = classify_venue(venue)
+    # Early stages: reuse speculative results when their inputs match
+    stages = early_stages(event_input)
     
-    # Initialize RAG engine
-    rag = SimpleRAGEngine()
+    def run_stage(name: str) -> Any:
+        key, fn, args = stages[name]
+        if precomputed is not None and key in precomputed:
+            return copy.deepcopy(precomputed[key])
+        return fn(*args)
     
-    # Retrieve similar events
-    similar_events = rag.retrieve_similar_events(
-        event_type=event_type,
-        venue_tier=venue_tier,
-        headcount_total=headcount_total,
-        departments=departments,
-        top_k=3
-    )
-    
-    # Extract best practices
-    best_practices = rag.extract_best_practices(similar_events)
+    # Classify venue
+    venue_tier = run_stage("venue")
     
-    # Get venue-specific requirements
-    venue_reqs = rag.get_venue_specific_requirements(venue_tier)
+    # Retrieve similar events, best practices, venue-specific requirements
+    rag_result = run_stage("rag")
+    similar_events = rag_result["similar_events"]
+    best_practices = rag_result["best_practices"]
+    venue_reqs = rag_result["venue_reqs"]
     
     # Combine special requirements
-    all_special_reqs = list(set(special_requirements + best_practices.get("special_requirements", [])))
+    all_special_reqs = rag_result["all_special_reqs"]
     
     # Build RAG context
     rag_context = {
@@ -173,6 +252,20 @@ def run_pipeline_with_rag(
         venue_tier
     )
     
+    extracted_info = {
+        "event_name": event_name,
+        "event_type": event_type,
+        "event_date": event_date,
+        "venue": venue,
+        "headcount_total": headcount_total,
+        "departments": departments,
+        "venue_tier": venue_tier,
+        "available_workers": available_workers,
+        "worker_distribution": worker_distribution,
+    }
+    if on_section:
+        on_section("extracted_info", extracted_info)
+    
     # Initialize LLM generator (optional)
     llm_gen = None
     if use_llm:
@@ -247,8 +340,22 @@ def run_pipeline_with_rag(
             }
 
             departments_output[normalized_dept].append(task)
+
+        if on_section:
+            on_section("department", {
+                "department": normalized_dept,
+                "epic_id": epic_id,
+                "tasks": [t for t in departments_output[normalized_dept] if t["epic_id"] == epic_id],
+            })
     
     # Update epic dates based on tasks
+    parsed_dates: Dict[str, datetime] = {}
+    
+    def parse_date(value: str) -> datetime:
+        if value not in parsed_dates:
+            parsed_dates[value] = datetime.strptime(value, "%Y-%m-%d")
+        return parsed_dates[value]
+    
     for epic in epics:
         epic_dept = get_department_bucket(epic["department"])
         epic_tasks = departments_output.get(epic_dept, [])
@@ -257,42 +364,23 @@ def run_pipeline_with_rag(
         epic_tasks = [t for t in epic_tasks if t["epic_id"] == epic["epic_id"]]
         
         if epic_tasks:
-            start_dates = [datetime.strptime(t["start-date"], "%Y-%m-%d") for t in epic_tasks]
-            end_dates = [datetime.strptime(t["deadline"], "%Y-%m-%d") for t in epic_tasks]
+            # Tasks share a handful of dates: parse each distinct string once
+            start_dates = [parse_date(t["start-date"]) for t in epic_tasks]
+            end_dates = [parse_date(t["deadline"]) for t in epic_tasks]
             
             epic["start-date"] = min(start_dates).strftime("%Y-%m-%d")
             epic["end-date"] = max(end_dates).strftime("%Y-%m-%d")
+    if on_section:
+        on_section("epics_task", epics)
     
     # Generate risks
-    risks_by_dept = generate_risks_by_department(
-        departments=unique_depts,
-        venue_tier=venue_tier,
-        event_type=event_type
-    )
-    
-    risks_overall = generate_overall_risks(
-        venue_tier=venue_tier,
-        event_type=event_type
-    )
-    
-    risks = {
-        "by_department": risks_by_dept,
-        "overall": risks_overall
-    }
+    risks = run_stage("risks")
+    if on_section:
+        on_section("risks", risks)
     
     # Prepare result - NO 'tasks' field, only 'departments' with full info
     result = {
-        "extracted_info": {
-            "event_name": event_name,
-            "event_type": event_type,
-            "event_date": event_date,
-            "venue": venue,
-            "headcount_total": headcount_total,
-            "departments": departments,
-            "venue_tier": venue_tier,
-            "available_workers": available_workers,
-            "worker_distribution": worker_distribution,
-        },
+        "extracted_info": extracted_info,
         "epics_task": epics,
         "departments": departments_output,  # Full task info here
         "risks": risks,
@@ -333,11 +421,17 @@ def _priority_to_complexity(priority: str) -> str:
 
 
 # Backward compatibility alias
-def run_pipeline(event_input: Dict[str, Any]) -> Dict[str, Any]:
+def run_pipeline(
+    event_input: Dict[str, Any],
+    on_section: Optional[Callable[[str, Any], None]] = None,
+    precomputed: Optional[Mapping[Tuple, Any]] = None,
+) -> Dict[str, Any]:
     """
     Backward compatible wrapper for old run_pipeline calls
     """
-    return run_pipeline_with_rag(event_input, use_llm=True, llm_mode="enhance")
+    return run_pipeline_with_rag(
+        event_input, use_llm=True, llm_mode="enhance", on_section=on_section, precomputed=precomputed
+    )
 
 
 # Example usage
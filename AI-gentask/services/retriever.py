@@ -1,74 +1,450 @@
 import os
-from typing import List, Dict, Any
+import time
+import threading
+from typing import List, Dict, Any, Optional, Callable
 
-import chromadb
-from sentence_transformers import SentenceTransformer
+from services.embeddings import (
+    EMBED_MODEL,
+    EMBED_BACKEND,
+    load_embedder,
+    embedding_info,
+    read_embedding_info,
+    incompatibility,
+)
+from services.embedding_server import EMBED_SOCKET, EmbeddingClient
+from services.vector_index import (
+    VECTOR_BACKEND,
+    VECTOR_INDEX_DIR,
+    VectorIndex,
+    open_index,
+    generation_marker,
+    marker_signature,
+    resolve_index_dir,
+    load_snapshot_manifest,
+    match_where,
+)
+from services.lexical_index import BM25_FILE, BM25Index, reciprocal_rank_fusion
 
 
-EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
 CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db")
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "global_kb")
+# When an event_id is preferred, fetch top_k * RETRIEVE_OVERFETCH candidates in one call
+RETRIEVE_OVERFETCH = max(1, int(os.getenv("RETRIEVE_OVERFETCH", "3")))
+
+# How often (seconds) workers check whether ingestion published a new index generation
+INDEX_RELOAD_CHECK_SECS = float(os.getenv("INDEX_RELOAD_CHECK_SECS", "2"))
+# Grace period before the previous Chroma System is stopped (queries still running on it finish)
+INDEX_RETIRE_SECS = float(os.getenv("INDEX_RETIRE_SECS", "10"))
+
+# vector (embedding search) / lexical (BM25, no model load) / hybrid (both, rank-fused)
+RETRIEVE_MODE = os.getenv("RETRIEVE_MODE", "vector")
+RETRIEVE_MODES = ("vector", "lexical", "hybrid")
+
+# Metadata fields (see build_metadata in scripts/ingest_global_chroma.py) usable as filters
+FILTER_KEYS = ("event_id", "event_type_primary", "tag_outdoor", "tag_vip", "tag_sponsor")
 
 _embedder = None
 _client = None
 _collection = None
+_index = None
+_index_signature = None
+_index_checked_at = 0.0
+_reload_lock = threading.Lock()
+_lexical: Optional[BM25Index] = None
+_lexical_signature = None
+_lexical_checked_at = 0.0
+# Called after every index swap so derived caches never serve the old generation
+_cache_invalidators: List[Callable[[], None]] = []
 
 
-def _get_embedder() -> SentenceTransformer:
+def _get_embedder():
+    """SentenceTransformer, or a client of the shared embedding server when EMBED_SOCKET is set"""
     global _embedder
+    if _embedder is not None:
+        return _embedder
+
+    info = None
+    if EMBED_SOCKET:
+        client = EmbeddingClient(EMBED_SOCKET)
+        try:
+            info = client.info()
+            _embedder = client
+        except OSError as e:
+            print(f"⚠️ Embedding server at {EMBED_SOCKET} unavailable ({e}), loading model in-process")
     if _embedder is None:
-        os.environ.setdefault("USE_TF", "0")
-        _embedder = SentenceTransformer(EMBED_MODEL)
+        _embedder = load_embedder(EMBED_MODEL, EMBED_BACKEND)
+        info = embedding_info(_embedder)
+
+    reason = incompatibility(_stored_embedding_info(), info)
+    if reason:
+        print(f"⚠️ Embedder does not match '{CHROMA_COLLECTION}' ({reason}); re-run scripts/ingest_global_chroma.py")
     return _embedder
 
 
+def _stored_embedding_info() -> Optional[Dict[str, Any]]:
+    """Model/dimension the active index was built with (snapshot manifest or embedding.json)"""
+    if VECTOR_BACKEND != "chroma":
+        index_dir = resolve_index_dir(VECTOR_INDEX_DIR)
+        stored = load_snapshot_manifest(index_dir) or read_embedding_info(index_dir)
+        if stored:
+            return stored
+    return read_embedding_info(CHROMA_DIR)
+
+
+def _open_collection():
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "false")
+    # Imported lazily: the numpy/hnsw backends never need chromadb
+    import chromadb
+
+    client = chromadb.PersistentClient(path=CHROMA_DIR)
+    collection = client.get_or_create_collection(CHROMA_COLLECTION, metadata={"hnsw:space": "cosine"})
+    return client, collection
+
+
 def _get_collection():
     global _client, _collection
-    if _client is None:
-        os.environ.setdefault("ANONYMIZED_TELEMETRY", "false")
-        _client = chromadb.PersistentClient(path=CHROMA_DIR)
     if _collection is None:
-        _collection = _client.get_or_create_collection(
-            CHROMA_COLLECTION, metadata={"hnsw:space": "cosine"}
-        )
+        _client, _collection = _open_collection()
     return _collection
 
 
-def retrieve_docs(event_input: Dict[str, Any], top_k: int = 12) -> List[Dict[str, Any]]:
-    # Use event_name + event_type as retrieval query, optionally scoped by event_id
-    query = f"{event_input.get('event_name','')} {event_input.get('event_type','')}".strip()
-    if not query:
-        return []
+def _marker() -> str:
+    return generation_marker(VECTOR_BACKEND, CHROMA_DIR, VECTOR_INDEX_DIR)
+
+
+def _get_index() -> VectorIndex:
+    """Vector index selected by VECTOR_BACKEND (chroma / numpy / hnsw)"""
+    global _index, _index_signature
+    if _index is None:
+        with _reload_lock:
+            if _index is None:
+                _index_signature = marker_signature(_marker())
+                _index = open_index(VECTOR_BACKEND, collection_factory=_get_collection, index_dir=VECTOR_INDEX_DIR)
+    else:
+        _maybe_reload()
+    return _index
+
+
+def register_cache_invalidator(fn: Callable[[], None]) -> None:
+    """Register a callback run whenever the index is swapped to a new generation"""
+    _cache_invalidators.append(fn)
+
+
+def _maybe_reload() -> None:
+    """Cheap, throttled stat() of the generation marker; reload when it changed"""
+    global _index_checked_at
+    now = time.monotonic()
+    if now - _index_checked_at < INDEX_RELOAD_CHECK_SECS:
+        return
+    _index_checked_at = now
+    if marker_signature(_marker()) != _index_signature:
+        reload_index(force=False)
+
+
+def reload_index(force: bool = True) -> VectorIndex:
+    """
+    Open the latest index generation and swap it in.
 
-    collection = _get_collection()
+    The new index is opened and warmed before the global reference is replaced,
+    so concurrent queries keep using the old one until the swap (no downtime).
+    """
+    global _client, _collection, _index, _index_signature
+    with _reload_lock:
+        signature = marker_signature(_marker())
+        if not force and _index is not None and signature == _index_signature:
+            return _index  # another thread already swapped
+        if VECTOR_BACKEND == "chroma":
+            # Chroma caches one System per path whose segments never see other processes'
+            # writes; drop it so the next client reads the current data.
+            from chromadb.api.client import SharedSystemClient
+
+            # Looked up through the cache, so it must be taken before clearing it
+            previous_system = SharedSystemClient._identifier_to_system.get(_client._identifier) if _client else None
+            SharedSystemClient.clear_system_cache()
+            client, collection = _open_collection()
+            new_index = open_index("chroma", collection_factory=lambda: collection)
+        else:
+            client, collection, previous_system = _client, _collection, None
+            new_index = open_index(VECTOR_BACKEND, index_dir=VECTOR_INDEX_DIR)
+        new_index.count()
+
+        _client, _collection = client, collection
+        _index = new_index
+        _index_signature = signature
+        for fn in _cache_invalidators:
+            fn()
+        if previous_system is not None:
+            _retire_system(previous_system)
+    print(f"🔄 Reloaded '{VECTOR_BACKEND}' vector index ({new_index.count()} docs)")
+    return new_index
+
+
+def _retire_system(system) -> None:
+    """
+    Stop a swapped-out Chroma System (sqlite connections, threads) once
+    in-flight queries had INDEX_RETIRE_SECS to finish; clear_system_cache()
+    only forgets it.
+    """
+
+    def stop():
+        try:
+            system.stop()
+        except Exception as e:
+            print(f"⚠️ Could not stop previous Chroma System: {e}")
+
+    timer = threading.Timer(INDEX_RETIRE_SECS, stop)
+    timer.daemon = True
+    timer.start()
+
+
+def _get_lexical() -> Optional[BM25Index]:
+    """BM25 index written by ingestion (None if missing); reloaded when the file changes"""
+    global _lexical, _lexical_signature, _lexical_checked_at
+    now = time.monotonic()
+    if _lexical is not None and now - _lexical_checked_at < INDEX_RELOAD_CHECK_SECS:
+        return _lexical
+    _lexical_checked_at = now
+    signature = marker_signature(os.path.join(CHROMA_DIR, BM25_FILE))
+    if _lexical is None or signature != _lexical_signature:
+        _lexical = BM25Index.load(CHROMA_DIR)
+        _lexical_signature = signature
+    return _lexical
+
+
+def warmup() -> Dict[str, float]:
+    """
+    Preload the embedder and the vector index so the first request does not pay for it.
+
+    Returns the duration (seconds) of each startup phase.
+    """
+    timings: Dict[str, float] = {}
+
+    t0 = time.perf_counter()
     embedder = _get_embedder()
-    q_emb = embedder.encode([query]).tolist()[0]
-    res = collection.query(query_embeddings=[q_emb], n_results=top_k)
+    timings["embedder_load"] = time.perf_counter() - t0
 
-    if not res or not res.get("ids") or not res["ids"]:
-        return []
+    # Dummy encode: allocates buffers / initializes kernels
+    t1 = time.perf_counter()
+    embedder.encode(["warmup"])
+    timings["embedder_encode"] = time.perf_counter() - t1
+
+    t2 = time.perf_counter()
+    _get_index().count()
+    timings["index_open"] = time.perf_counter() - t2
+
+    # One real query loads the vector index segment into memory
+    t3 = time.perf_counter()
+    retrieve_docs({"event_name": "warmup"}, top_k=1, include_documents=False)
+    timings["first_query"] = time.perf_counter() - t3
+
+    t4 = time.perf_counter()
+    _get_lexical()
+    timings["lexical_load"] = time.perf_counter() - t4
+
+    timings["total"] = time.perf_counter() - t0
+    return timings
 
-    out: List[Dict[str, Any]] = []
-    wanted_event_id = (event_input.get("event_id") or "").strip()
-    for i in range(len(res["ids"][0])):
-        meta = res["metadatas"][0][i] if res.get("metadatas") else {}
-        doc_id = res["ids"][0][i]
-        text = res["documents"][0][i] if res.get("documents") else ""
+
+def _build_query(event_input: Dict[str, Any]) -> str:
+    # Free-text "query" (e.g. a chat keyword question) wins over event_name + event_type
+    if event_input.get("query"):
+        return str(event_input["query"]).strip()
+    return f"{event_input.get('event_name','')} {event_input.get('event_type','')}".strip()
+
+
+def _build_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Translate retrieval filters into a Chroma ``where`` clause (None if no filter)."""
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unsupported retrieval filters: {sorted(unknown)}")
+    clauses = []
+    for key in FILTER_KEYS:
+        value = filters.get(key)
+        if value is None or value == "":
+            continue
+        if isinstance(value, (list, tuple, set)):
+            clauses.append({key: {"$in": list(value)}})
+        else:
+            clauses.append({key: value})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _rows_for_query(res: Dict[str, Any], qi: int, wanted_event_id: str, top_k: int) -> List[Dict[str, Any]]:
+    """Demultiplex the results of query ``qi`` from a (multi-)query response."""
+    ids = res["ids"][qi] if res.get("ids") and len(res["ids"]) > qi else []
+    metas = res["metadatas"][qi] if res.get("metadatas") else [None] * len(ids)
+    docs = res["documents"][qi] if res.get("documents") else None
+    dists = res["distances"][qi] if res.get("distances") else None
+
+    rows: List[Dict[str, Any]] = []
+    for i, doc_id in enumerate(ids):
+        meta = metas[i] if metas[i] is not None else {}
         if isinstance(meta, dict):
             meta.setdefault("doc_id", doc_id)
-        # If event_id is provided, prefer docs that match it
-        if wanted_event_id:
-            if str(meta.get("event_id") or "") == wanted_event_id:
-                out.append({"doc_id": doc_id, "text": text, "metadata": meta})
-        else:
-            out.append({"doc_id": doc_id, "text": text, "metadata": meta})
-    # If filtered resulted empty but event_id specified, fallback to unfiltered top_k
-    if wanted_event_id and not out:
-        for i in range(len(res["ids"][0])):
-            meta = res["metadatas"][0][i] if res.get("metadatas") else {}
-            doc_id = res["ids"][0][i]
-            text = res["documents"][0][i] if res.get("documents") else ""
-            if isinstance(meta, dict):
-                meta.setdefault("doc_id", doc_id)
-            out.append({"doc_id": doc_id, "text": text, "metadata": meta})
-    return out
+        row: Dict[str, Any] = {"doc_id": doc_id, "metadata": meta}
+        if docs is not None:
+            row["text"] = docs[i]
+        if dists is not None:
+            row["distance"] = dists[i]
+        rows.append(row)
+    return _prefer_event(rows, wanted_event_id, top_k)
+
+
+def _prefer_event(rows: List[Dict[str, Any]], wanted_event_id: str, top_k: int) -> List[Dict[str, Any]]:
+    # If event_id is provided, prefer docs that match it. Candidates were
+    # over-fetched, so the fallback to unfiltered top_k needs no second query.
+    if wanted_event_id:
+        matched = [r for r in rows if str(r["metadata"].get("event_id") or "") == wanted_event_id]
+        if matched:
+            return matched[:top_k]
+    return rows[:top_k]
+
+
+def _lexical_rows(
+    index: BM25Index,
+    query: str,
+    n_results: int,
+    where: Optional[Dict[str, Any]],
+    include_documents: bool,
+) -> List[Dict[str, Any]]:
+    allow = (lambda meta: match_where(meta, where)) if where else None
+    rows: List[Dict[str, Any]] = []
+    for doc_id, score in index.search(query, top_k=n_results, allow=allow):
+        i = index.position[doc_id]
+        meta = dict(index.metadatas[i])
+        meta.setdefault("doc_id", doc_id)
+        row: Dict[str, Any] = {"doc_id": doc_id, "metadata": meta, "bm25": score}
+        if include_documents:
+            row["text"] = index.documents[i]
+        rows.append(row)
+    return rows
+
+
+def _fuse(vector_rows: List[Dict[str, Any]], lexical_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reciprocal rank fusion; rows keep distance and/or bm25 of the paths that found them"""
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for row in lexical_rows + vector_rows:
+        by_id.setdefault(row["doc_id"], {}).update(row)
+    fused = reciprocal_rank_fusion([[r["doc_id"] for r in vector_rows], [r["doc_id"] for r in lexical_rows]])
+    return [dict(by_id[doc_id], rrf_score=score) for doc_id, score in fused]
+
+
+def lexical_search(
+    query: str,
+    top_k: int = 12,
+    filters: Optional[Dict[str, Any]] = None,
+    include_documents: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Keyword (BM25) search over the KB: no embedding model is loaded.
+
+    Accent-insensitive ("giay phep cong an" matches "giấy phép công an").
+    Rows carry a ``bm25`` score instead of a ``distance``; empty if ingestion
+    has not written the lexical index yet.
+    """
+    index = _get_lexical()
+    if index is None or not query.strip():
+        return []
+    return _lexical_rows(index, query, top_k, _build_where(filters), include_documents)
+
+
+def embedder_loaded() -> bool:
+    """True once the embedder is in memory (encode_texts will not load a model)"""
+    return _embedder is not None
+
+
+def encode_texts(texts: List[str]) -> Any:
+    """Embed arbitrary texts with the retrieval embedder (same space as the KB)"""
+    return _get_embedder().encode(list(texts))
+
+
+def retrieve_docs(
+    event_input: Dict[str, Any],
+    top_k: int = 12,
+    filters: Optional[Dict[str, Any]] = None,
+    include_documents: bool = True,
+    mode: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    # Use event_name + event_type as retrieval query, optionally scoped by event_id
+    return retrieve_docs_batch(
+        [event_input], top_k=top_k, filters=filters, include_documents=include_documents, mode=mode
+    )[0]
+
+
+def retrieve_docs_batch(
+    event_inputs: List[Dict[str, Any]],
+    top_k: int = 12,
+    filters: Optional[Dict[str, Any]] = None,
+    include_documents: bool = True,
+    mode: Optional[str] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Retrieve KB docs for many events at once.
+
+    All queries go through a single batched ``encode`` call and a single
+    multi-embedding vector index query; results are then split back per
+    input, in the same order, with the same ``event_id`` preference as
+    ``retrieve_docs``. Inputs without a usable query get an empty list.
+
+    ``filters`` (keys from FILTER_KEYS) are hard constraints evaluated by
+    the index through a Chroma-style ``where``. A per-input ``event_id`` stays a soft
+    preference: candidates are over-fetched so that matching docs can be
+    preferred and non-matching ones used as fallback from the same call.
+    With ``include_documents=False`` only ids, metadata and distances are
+    returned (rows have no ``text``).
+
+    ``mode`` (default RETRIEVE_MODE): ``vector``, ``lexical`` (BM25 only,
+    the embedder is never touched) or ``hybrid`` (both candidate lists merged
+    by reciprocal rank fusion). Without a lexical index (ingestion not run
+    yet) hybrid behaves like vector and lexical returns empty lists.
+    """
+    mode = mode or RETRIEVE_MODE
+    if mode not in RETRIEVE_MODES:
+        raise ValueError(f"Unsupported retrieval mode '{mode}' (expected one of {RETRIEVE_MODES})")
+    queries = [_build_query(e) for e in event_inputs]
+    outputs: List[List[Dict[str, Any]]] = [[] for _ in event_inputs]
+    positions = [i for i, q in enumerate(queries) if q]
+    if not positions or top_k <= 0:
+        return outputs
+
+    wanted_ids = [(event_inputs[pos].get("event_id") or "").strip() for pos in positions]
+    n_results = top_k * RETRIEVE_OVERFETCH if any(wanted_ids) else top_k
+    where = _build_where(filters)
+
+    lexical = _get_lexical() if mode != "vector" else None
+    lexical_rows = {
+        pos: _lexical_rows(lexical, queries[pos], n_results, where, include_documents)
+        for pos in positions
+    } if lexical is not None else {}
+    if mode == "lexical":
+        for qi, pos in enumerate(positions):
+            outputs[pos] = _prefer_event(lexical_rows.get(pos, []), wanted_ids[qi], top_k)
+        return outputs
+
+    include = ["metadatas", "distances"]
+    if include_documents:
+        include.append("documents")
+
+    index = _get_index()
+    embedder = _get_embedder()
+    q_embs = embedder.encode([queries[i] for i in positions])
+    res = index.query(
+        query_embeddings=q_embs,
+        n_results=n_results,
+        where=where,
+        include=include,
+    )
+
+    if not res or not res.get("ids") or not res["ids"]:
+        res = None
+
+    for qi, pos in enumerate(positions):
+        vector_rows = _rows_for_query(res, qi, "", n_results) if res else []
+        if pos in lexical_rows:
+            vector_rows = _fuse(vector_rows, lexical_rows[pos])
+        outputs[pos] = _prefer_event(vector_rows, wanted_ids[qi], top_k)
+    return outputs
@@ -0,0 +1,896 @@
+"""
+Session Store - bounded storage for chat sessions
+Keeps ChatProcessor memory flat on long-running workers:
+- at most CHAT_MAX_SESSIONS resident sessions (least recently used evicted first)
+- sessions idle longer than CHAT_SESSION_TTL_SECS are evicted by a background task
+- each session keeps only its last CHAT_MAX_MESSAGES messages verbatim (older
+  ones are folded into the history summary, so ``seq`` numbers stay valid)
+- (memory backend) sessions idle longer than CHAT_COLD_AFTER_SECS are kept as
+  compressed blobs until their next message (services/cold_storage.py)
+- approximate resident bytes are tracked per session and reported by ``metrics()``
+
+Backends (CHAT_SESSION_BACKEND):
+- memory: per-process dict (default)
+- sqlite: shared SQLite file in WAL mode, so several uvicorn workers on one
+  host serve the same chats and sessions survive restarts
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import pickle
+import bisect
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from services.cold_storage import CHAT_COLD_AFTER_SECS, ColdTier
+from services.history import fold_history, total_messages
+
+
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_SESSION_TTL_SECS = float(os.getenv("CHAT_SESSION_TTL_SECS", "3600"))
+CHAT_MAX_MESSAGES = int(os.getenv("CHAT_MAX_MESSAGES", "200"))
+CHAT_EVICT_INTERVAL_SECS = float(os.getenv("CHAT_EVICT_INTERVAL_SECS", "60"))
+
+CHAT_SESSION_BACKEND = os.getenv("CHAT_SESSION_BACKEND", "memory")
+CHAT_SESSION_DB = os.getenv("CHAT_SESSION_DB", "./chat_sessions.db")
+# Group commit: saves arriving within this window (ms) share one transaction
+CHAT_SESSION_FLUSH_MS = float(os.getenv("CHAT_SESSION_FLUSH_MS", "2"))
+CHAT_SESSION_FLUSH_BATCH = int(os.getenv("CHAT_SESSION_FLUSH_BATCH", "64"))
+# Sessions kept in-process (pickled, so every read gets its own copy), revalidated by etag
+CHAT_SESSION_CACHE_SIZE = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "256"))
+
+
+def new_session() -> Dict[str, Any]:
+    """Empty chat session"""
+    now = datetime.now()
+    return {
+        "created_at": now,
+        "last_updated": now,
+        "messages": [],
+        "history_summary": None,  # Older turns folded by services/history.py
+        "current_event": None,  # Current active event
+        "events": {},  # All events in this session {event_id: event fields}
+        "artifacts": {},  # Generated WBS per event {event_id: {version, etag, wbs}}
+        "context": "greeting",  # greeting, planning, querying
+    }
+
+
+def estimate_size(session: Dict[str, Any]) -> int:
+    """Approximate memory footprint: size of the JSON encoding (WBS dominates)"""
+    return len(json.dumps(session, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def trim_messages(session: Dict[str, Any], max_messages: int) -> int:
+    """
+    Hard cap: fold everything but the last ``max_messages`` messages into the
+    history summary (rule-based text); returns how many were folded. Counted
+    in the summary, so seq / total_messages / paging stay consistent.
+    """
+    return fold_history(session, window=max_messages, fold=1)
+
+
+def session_summary(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Listing row of a session, computed once per save (O(1) in the session size)"""
+    return {
+        "created_at": _isoformat(session.get("created_at")),
+        "last_updated": _isoformat(session.get("last_updated")),
+        "message_count": total_messages(session),
+        "events_count": len(session.get("events") or {}),
+        "current_event": session.get("current_event"),
+    }
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# ====== Listing cursors ======
+# Opaque to clients: "<activity timestamp>|<session_id>" of the last row of a page
+def encode_cursor(saved_at: float, session_id: str) -> str:
+    return f"{saved_at!r}|{session_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    saved_at, sep, session_id = cursor.partition("|")
+    try:
+        return float(saved_at), session_id
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    return str(value)
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def dumps_session(session: Dict[str, Any]) -> str:
+    """JSON encoding that round-trips datetime fields (created_at, last_updated)"""
+    return json.dumps(session, ensure_ascii=False, default=_json_default, separators=(",", ":"))
+
+
+def loads_session(data: str) -> Dict[str, Any]:
+    return json.loads(data, object_hook=_json_object_hook)
+
+
+class SessionConflict(Exception):
+    """The session was saved by another worker since this turn read it"""
+
+
+class SessionStore:
+    """
+    Interface used by ChatProcessor.
+
+    Sessions are plain dicts mutated in place by the caller; ``save`` must be
+    called once the turn is done so the store can trim, account and persist.
+    Shared backends raise SessionConflict from ``save`` when another process
+    wrote the session after it was read.
+    """
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, session_id: str, session: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def list_sessions(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        updated_after: Optional[float] = None,
+        updated_before: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Page of session summaries, most recently active first.
+
+        ``updated_after`` / ``updated_before`` (epoch seconds) filter by last
+        activity; pass the returned ``next_cursor`` to get the next page.
+        Returns ``{"sessions", "next_cursor", "total"}`` (total matches the
+        filters). Generic fallback: scans every session.
+        """
+        position = decode_cursor(cursor) if cursor else None
+        rows = []
+        for sid, session in self.items():
+            updated = session.get("last_updated")
+            saved_at = updated.timestamp() if isinstance(updated, datetime) else 0.0
+            if (updated_after is None or saved_at >= updated_after) and (updated_before is None or saved_at < updated_before):
+                rows.append((saved_at, sid, session))
+        rows.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        total = len(rows)
+        if position is not None:
+            rows = [r for r in rows if (r[0], r[1]) < position]
+        page = rows[:limit]
+        return {
+            "sessions": [{"session_id": sid, **session_summary(session)} for _, sid, session in page],
+            "next_cursor": encode_cursor(page[-1][0], page[-1][1]) if len(rows) > limit else None,
+            "total": total,
+        }
+
+    def evict_expired(self) -> int:
+        return 0
+
+    def freeze_idle(self, locks: Optional["SessionLocks"] = None) -> int:
+        return 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self) -> None:
+        return None
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.items())
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    LRU + idle-TTL bounded dict of sessions (one worker process).
+
+    Two tiers: live sessions (dicts) and, after ``cold_after_secs`` idle,
+    compressed blobs rehydrated on the next ``get``. max_sessions and the TTL
+    count both tiers.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = CHAT_MAX_SESSIONS,
+        ttl_secs: float = CHAT_SESSION_TTL_SECS,
+        max_messages: int = CHAT_MAX_MESSAGES,
+        cold_after_secs: float = CHAT_COLD_AFTER_SECS,
+        cold: Optional[ColdTier] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_secs = ttl_secs
+        self.max_messages = max_messages
+        self.cold_after_secs = cold_after_secs
+        # Ordered by last access: the front is the LRU / longest idle session
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cold: Optional[ColdTier] = cold if cold is not None else (ColdTier() if cold_after_secs else None)
+        self._accessed: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}  # live size estimate, frozen sessions included
+        self._bytes = 0  # live sessions only
+        # Listing: summary per session + (saved_at, session_id) sorted by activity.
+        # A deque: the entries removed on every save are at its ends (the LRU
+        # session evicted at capacity, the session just re-saved), O(1) there.
+        # One slot above max_sessions: a save appends before it evicts.
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._saved_at: Dict[str, float] = {}
+        self._activity: "deque[Tuple[float, str]]" = deque(maxlen=max_sessions + 1 if max_sessions else None)
+        self._totals = {"messages": 0, "events": 0}
+        self._lock = threading.RLock()
+        self._stats = {"evicted_lru": 0, "evicted_ttl": 0, "trimmed_messages": 0, "freeze_skipped": 0}
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None and self._cold is not None and session_id in self._cold:
+                session = self._cold.take(session_id)
+                self._sessions[session_id] = session
+                self._bytes += self._sizes.get(session_id, 0)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self._accessed[session_id] = time.monotonic()
+            return session
+
+    def save(self, session_id: str, session: Dict[str, Any]) -> None:
+        dropped = trim_messages(session, self.max_messages)
+        size = estimate_size(session)
+        summary = session_summary(session)
+
+        with self._lock:
+            self._stats["trimmed_messages"] += dropped
+            if self._cold is not None:
+                self._cold.discard(session_id)  # saved without a get: the blob is stale
+            self._bytes += size - (self._sizes.get(session_id, 0) if session_id in self._sessions else 0)
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._accessed[session_id] = time.monotonic()
+            self._sizes[session_id] = size
+            self._unindex(session_id)
+            saved_at = time.time()
+            if self._activity and saved_at < self._activity[-1][0]:
+                bisect.insort(self._activity, (saved_at, session_id))
+            else:
+                self._activity.append((saved_at, session_id))  # usual case: newest activity
+            self._saved_at[session_id] = saved_at
+            self._summaries[session_id] = summary
+            self._totals["messages"] += summary["message_count"]
+            self._totals["events"] += summary["events_count"]
+            while self.max_sessions and len(self) > self.max_sessions:
+                # Frozen sessions were idle the longest
+                oldest = (self._cold.oldest() if self._cold else None) or next(iter(self._sessions))
+                self._drop(oldest)
+                self._stats["evicted_lru"] += 1
+
+    def _drop(self, session_id: str) -> None:
+        size = self._sizes.pop(session_id, 0)
+        if self._sessions.pop(session_id, None) is not None:
+            self._bytes -= size
+        if self._cold is not None:
+            self._cold.discard(session_id)
+        self._accessed.pop(session_id, None)
+        self._unindex(session_id)
+
+    def _unindex(self, session_id: str) -> None:
+        saved_at = self._saved_at.pop(session_id, None)
+        if saved_at is None:
+            return
+        i = bisect.bisect_left(self._activity, (saved_at, session_id))
+        del self._activity[i]
+        summary = self._summaries.pop(session_id)
+        self._totals["messages"] -= summary["message_count"]
+        self._totals["events"] -= summary["events_count"]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self:
+                return False
+            self._drop(session_id)
+            return True
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Live and frozen sessions (frozen ones are decoded, not rehydrated)"""
+        with self._lock:
+            snapshot = list(self._sessions.items())
+            cold_ids = self._cold.ids() if self._cold else []
+        for item in snapshot:
+            yield item
+        for sid in cold_ids:
+            with self._lock:
+                session = self._cold.peek(sid)
+            if session is not None:
+                yield sid, session
+
+    def list_sessions(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        updated_after: Optional[float] = None,
+        updated_before: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Bisect on the activity index: O(log n + limit), no session is touched"""
+        with self._lock:
+            lo = bisect.bisect_left(self._activity, (updated_after,)) if updated_after is not None else 0
+            hi = bisect.bisect_left(self._activity, (updated_before,)) if updated_before is not None else len(self._activity)
+            total = max(0, hi - lo)
+            if cursor:
+                hi = min(hi, bisect.bisect_left(self._activity, decode_cursor(cursor)))
+            start = max(lo, hi - limit)
+            # Indexing a deque is cheap near its ends, where the first pages are
+            page = [self._activity[i] for i in range(hi - 1, start - 1, -1)]
+            return {
+                "sessions": [{"session_id": sid, **self._summaries[sid]} for _, sid in page],
+                "next_cursor": encode_cursor(*page[-1]) if page and start > lo else None,
+                "total": total,
+            }
+
+    def evict_expired(self) -> int:
+        """Drop sessions idle for more than ttl_secs; only walks the expired prefix"""
+        if not self.ttl_secs:
+            return 0
+        deadline = time.monotonic() - self.ttl_secs
+        evicted = 0
+        with self._lock:
+            while self._cold:
+                oldest = self._cold.oldest()
+                if self._accessed.get(oldest, 0.0) > deadline:
+                    break
+                self._drop(oldest)
+                evicted += 1
+            while self._sessions:
+                oldest = next(iter(self._sessions))
+                if self._accessed.get(oldest, 0.0) > deadline:
+                    break
+                self._drop(oldest)
+                evicted += 1
+            self._stats["evicted_ttl"] += evicted
+        return evicted
+
+    def freeze_idle(self, locks: Optional["SessionLocks"] = None) -> int:
+        """
+        Move live sessions idle for more than cold_after_secs to the cold tier;
+        only walks the idle prefix. Encoding runs outside the store lock, under
+        the session's turn lock when ``locks`` is given (sessions with a turn in
+        flight are skipped), and a session touched meanwhile stays live.
+        """
+        if self._cold is None:
+            return 0
+        deadline = time.monotonic() - self.cold_after_secs
+        with self._lock:
+            idle = []
+            for sid in self._sessions:
+                accessed = self._accessed.get(sid, 0.0)
+                if accessed > deadline:
+                    break
+                idle.append((sid, accessed))
+
+        frozen = 0
+        for sid, accessed in idle:
+            with (locks.try_hold(sid) if locks is not None else nullcontext(True)) as held:
+                if not held:
+                    with self._lock:
+                        self._stats["freeze_skipped"] += 1
+                    continue
+                with self._lock:
+                    session = self._sessions.get(sid)
+                    if session is None or self._accessed.get(sid) != accessed:
+                        continue
+                try:
+                    blob = self._cold.encode(session)
+                except RuntimeError:
+                    # Mutated by a turn running without the lock: retry next pass
+                    with self._lock:
+                        self._stats["freeze_skipped"] += 1
+                    continue
+                with self._lock:
+                    if self._sessions.get(sid) is not session or self._accessed.get(sid) != accessed:
+                        continue
+                    size = self._sizes.get(sid, 0)
+                    self._cold.put(sid, blob, size)
+                    del self._sessions[sid]
+                    self._bytes -= size
+                    frozen += 1
+        return frozen
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "resident_sessions": len(self._sessions),
+                "resident_bytes": self._bytes,
+                **(self._cold.metrics() if self._cold is not None else {}),
+                "total_messages": self._totals["messages"],
+                "total_events": self._totals["events"],
+                "max_sessions": self.max_sessions,
+                "ttl_secs": self.ttl_secs,
+                "max_messages": self.max_messages,
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        if self._cold is not None:
+            self._cold.close()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions or (self._cold is not None and session_id in self._cold)
+
+    def __len__(self) -> int:
+        return len(self._sessions) + (len(self._cold) if self._cold else 0)
+
+
+_NOT_READ = object()  # save() without a preceding get(): no etag check
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite database (WAL) shared by all workers on the host.
+
+    - group commit: ``save`` serializes the session, queues it and waits until
+      the flusher thread has written it; saves queued within
+      CHAT_SESSION_FLUSH_MS (up to CHAT_SESSION_FLUSH_BATCH) share one
+      transaction. A turn is therefore visible to every worker before its
+      reply is sent.
+    - optimistic concurrency: each write checks, under BEGIN IMMEDIATE, that
+      the row still has the etag the turn read; otherwise ``save`` raises
+      SessionConflict (another worker answered in between) and nothing is
+      overwritten
+    - read cache: sessions are kept pickled in a small LRU and revalidated
+      with a primary-key etag lookup; every ``get`` returns a fresh copy, so a
+      turn that fails halfway leaves no partial changes behind
+    """
+
+    def __init__(
+        self,
+        path: str = CHAT_SESSION_DB,
+        ttl_secs: float = CHAT_SESSION_TTL_SECS,
+        max_messages: int = CHAT_MAX_MESSAGES,
+        flush_ms: float = CHAT_SESSION_FLUSH_MS,
+        flush_batch: int = CHAT_SESSION_FLUSH_BATCH,
+        cache_size: int = CHAT_SESSION_CACHE_SIZE,
+    ):
+        self.path = path
+        self.ttl_secs = ttl_secs
+        self.max_messages = max_messages
+        self.flush_interval = flush_ms / 1000.0
+        self.flush_batch = flush_batch
+        self.cache_size = cache_size
+        self._local = threading.local()
+        # session_id -> (serialized, etag, last_updated epoch, serialized summary, etag read, future)
+        self._pending: Dict[str, Tuple[str, str, float, str, Any, Future]] = {}
+        # session_id -> (pickled session, etag)
+        self._cache: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        # session_id -> etag the last get() returned (None: no row); checked by the next save
+        self._read_etags: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._stats = {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "flushes": 0,
+            "flushed_rows": 0,
+            "conflicts": 0,
+            "evicted_ttl": 0,
+            "trimmed_messages": 0,
+        }
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                last_updated REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_sessions)")}
+        if "summary" not in columns:
+            # Listing row (session_summary) kept next to the data; NULL for rows written before it existed
+            conn.execute("ALTER TABLE chat_sessions ADD COLUMN summary TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated ON chat_sessions (last_updated)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_activity ON chat_sessions (last_updated, session_id)")
+        conn.commit()
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ====== Connection ======
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    # ====== Read path ======
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                self._stats["cache_hits"] += 1
+                self._read(session_id, pending[1])
+                return loads_session(pending[0])
+            cached = self._cache.get(session_id)
+
+        if cached is not None:
+            row = self._conn().execute(
+                "SELECT etag FROM chat_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row and row[0] == cached[1]:
+                with self._lock:
+                    self._stats["cache_hits"] += 1
+                    if session_id in self._cache:
+                        self._cache.move_to_end(session_id)
+                    self._read(session_id, cached[1])
+                return pickle.loads(cached[0])
+
+        row = self._conn().execute(
+            "SELECT data, etag FROM chat_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        with self._lock:
+            self._stats["cache_misses"] += 1
+            if row is None:
+                self._cache.pop(session_id, None)
+                self._read(session_id, None)
+                return None
+            session = loads_session(row[0])
+            self._remember(session_id, session, row[1])
+            self._read(session_id, row[1])
+        return session
+
+    def _read(self, session_id: str, etag: Optional[str]) -> None:
+        self._read_etags[session_id] = etag
+        self._read_etags.move_to_end(session_id)
+        while len(self._read_etags) > 4 * self.cache_size:
+            self._read_etags.popitem(last=False)
+
+    def _remember(self, session_id: str, session: Dict[str, Any], etag: str) -> None:
+        self._cache[session_id] = (pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL), etag)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # ====== Write path ======
+    def save(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Queue the session and wait until it is committed; SessionConflict if another worker wrote it first"""
+        dropped = trim_messages(session, self.max_messages)
+        data = dumps_session(session)
+        summary = json.dumps(session_summary(session), ensure_ascii=False)
+        etag = uuid.uuid4().hex
+        with self._lock:
+            self._stats["trimmed_messages"] += dropped
+            # Saved without a get (scripts, migrations): written unconditionally
+            expected = self._read_etags.pop(session_id, _NOT_READ)
+            queued = self._pending.get(session_id)
+            if queued is not None:
+                # Replaces a save not written yet: same check, same waiters
+                expected, future = queued[4], queued[5]
+            else:
+                future = Future()
+            self._pending[session_id] = (data, etag, time.time(), summary, expected, future)
+            self._cache.pop(session_id, None)
+            self._wake.set()
+        if self._stopped.is_set():
+            self.flush()
+        future.result()
+        with self._lock:
+            if session_id not in self._pending:
+                self._remember(session_id, session, etag)
+
+    def flush(self) -> int:
+        """Write all queued sessions in one transaction; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+            conn = self._conn()
+            conflicts = set()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for sid, (_, _, _, _, expected, _) in batch.items():
+                    if expected is _NOT_READ:
+                        continue
+                    row = conn.execute("SELECT etag FROM chat_sessions WHERE session_id = ?", (sid,)).fetchone()
+                    if (row[0] if row else None) != expected:
+                        conflicts.add(sid)
+                conn.executemany(
+                    """
+                    INSERT INTO chat_sessions (session_id, data, etag, last_updated, summary)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        data = excluded.data, etag = excluded.etag,
+                        last_updated = excluded.last_updated, summary = excluded.summary
+                    """,
+                    [
+                        (sid, data, etag, ts, summary)
+                        for sid, (data, etag, ts, summary, _, _) in batch.items()
+                        if sid not in conflicts
+                    ],
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                for entry in batch.values():
+                    entry[5].set_exception(e)
+                raise
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["flushed_rows"] += len(batch) - len(conflicts)
+                self._stats["conflicts"] += len(conflicts)
+            for sid, entry in batch.items():
+                if sid in conflicts:
+                    entry[5].set_exception(SessionConflict(f"Session {sid} was updated by another worker"))
+                else:
+                    entry[5].set_result(len(batch))
+            return len(batch) - len(conflicts)
+
+    def _flush_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # Let concurrent saves join this transaction
+            if self.flush_interval and len(self._pending) < self.flush_batch:
+                time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Session flush failed: {e}")
+
+    def delete(self, session_id: str) -> bool:
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending.pop(session_id, None)
+                self._cache.pop(session_id, None)
+                self._read_etags.pop(session_id, None)
+            if pending is not None:
+                pending[5].set_result(0)
+            conn = self._conn()
+            with conn:
+                deleted = conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,)).rowcount
+        return pending is not None or deleted > 0
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        self.flush()
+        rows = self._conn().execute("SELECT session_id, data FROM chat_sessions ORDER BY last_updated").fetchall()
+        return ((sid, loads_session(data)) for sid, data in rows)
+
+    def list_sessions(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        updated_after: Optional[float] = None,
+        updated_before: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Keyset pagination on the (last_updated, session_id) index; reads only the summary column"""
+        self.flush()
+        where, params = [], []
+        if updated_after is not None:
+            where.append("last_updated >= ?")
+            params.append(updated_after)
+        if updated_before is not None:
+            where.append("last_updated < ?")
+            params.append(updated_before)
+        conn = self._conn()
+        total = conn.execute(
+            "SELECT COUNT(*) FROM chat_sessions" + (" WHERE " + " AND ".join(where) if where else ""), params
+        ).fetchone()[0]
+        if cursor:
+            where.append("(last_updated, session_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        rows = conn.execute(
+            "SELECT session_id, last_updated, summary, CASE WHEN summary IS NULL THEN data END FROM chat_sessions"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY last_updated DESC, session_id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        page = rows[:limit]
+        sessions = [
+            {"session_id": sid, **(json.loads(summary) if summary else session_summary(loads_session(data)))}
+            for sid, _, summary, data in page
+        ]
+        return {
+            "sessions": sessions,
+            "next_cursor": encode_cursor(page[-1][1], page[-1][0]) if len(rows) > limit else None,
+            "total": total,
+        }
+
+    def evict_expired(self) -> int:
+        if not self.ttl_secs:
+            return 0
+        self.flush()
+        deadline = time.time() - self.ttl_secs
+        with self._flush_lock:
+            conn = self._conn()
+            with conn:
+                expired = [
+                    r[0] for r in conn.execute(
+                        "SELECT session_id FROM chat_sessions WHERE last_updated < ?", (deadline,)
+                    ).fetchall()
+                ]
+                conn.execute("DELETE FROM chat_sessions WHERE last_updated < ?", (deadline,))
+            with self._lock:
+                for sid in expired:
+                    self._cache.pop(sid, None)
+                    self._read_etags.pop(sid, None)
+                self._stats["evicted_ttl"] += len(expired)
+        return len(expired)
+
+    def metrics(self) -> Dict[str, Any]:
+        count, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(data AS BLOB))), 0) FROM chat_sessions"
+        ).fetchone()
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "resident_sessions": count,
+                "resident_bytes": size,
+                "cached_sessions": len(self._cache),
+                "pending_writes": len(self._pending),
+                "ttl_secs": self.ttl_secs,
+                "max_messages": self.max_messages,
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+
+    def __len__(self) -> int:
+        self.flush()
+        return self._conn().execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+
+
+class SessionLocks:
+    """
+    One lock per session id, so turns of the same session run one at a time
+    (get -> mutate -> save) while different sessions run in parallel.
+
+    A lock only exists while a turn holds or waits for it, so the registry
+    stays as small as the number of in-flight sessions. Locks are per process:
+    across sqlite workers, concurrent turns surface as SessionConflict.
+
+    Async callers (the chat router) queue on ``hold_async`` before entering the
+    threadpool, so waiting turns cost a coroutine rather than a pool thread;
+    ``hold`` stays the lock for threaded callers (and is uncontended behind it).
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, List[Any]] = {}  # session_id -> [lock, holders + waiters]
+        self._async_locks: Dict[str, List[Any]] = {}  # same, asyncio.Lock (event loop only)
+        self._guard = threading.Lock()
+        self.stats = {"acquired": 0, "contended": 0, "queued_async": 0}
+
+    @contextmanager
+    def hold(self, session_id: str) -> Iterator[None]:
+        with self._guard:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        lock = entry[0]
+        if not lock.acquire(blocking=False):
+            with self._guard:
+                self.stats["contended"] += 1
+            lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+            with self._guard:
+                self.stats["acquired"] += 1
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    @contextmanager
+    def try_hold(self, session_id: str) -> Iterator[bool]:
+        """Non-blocking ``hold``: yields False (without waiting) if a turn holds the session"""
+        with self._guard:
+            busy = session_id in self._locks
+            if not busy:
+                lock = threading.Lock()
+                lock.acquire()
+                self._locks[session_id] = [lock, 1]
+        if busy:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            lock.release()
+            with self._guard:
+                entry = self._locks[session_id]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    @asynccontextmanager
+    async def hold_async(self, session_id: str) -> AsyncIterator[None]:
+        """Event-loop side of ``hold``: waits as a coroutine, never in a threadpool thread"""
+        entry = self._async_locks.get(session_id)
+        if entry is None:
+            entry = self._async_locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                with self._guard:
+                    self.stats["queued_async"] += 1
+            async with entry[0]:
+                yield
+        finally:
+            # Also runs when a waiter is cancelled (client gone before its turn)
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._async_locks[session_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._guard:
+            return {"in_flight": len(self._locks), "in_flight_async": len(self._async_locks), **self.stats}
+
+
+def create_session_store() -> SessionStore:
+    """Session store configured from the environment (CHAT_SESSION_BACKEND)"""
+    if CHAT_SESSION_BACKEND == "sqlite":
+        return SqliteSessionStore()
+    if CHAT_SESSION_BACKEND != "memory":
+        raise ValueError(f"Unknown CHAT_SESSION_BACKEND '{CHAT_SESSION_BACKEND}' (expected memory | sqlite)")
+    return InMemorySessionStore()
+
+
+async def run_eviction_loop(
+    store: SessionStore,
+    interval: float = CHAT_EVICT_INTERVAL_SECS,
+    locks: Optional[SessionLocks] = None,
+) -> None:
+    """Background task: periodically evict expired and freeze idle sessions (started from the app lifespan)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = await asyncio.to_thread(store.evict_expired)
+            if evicted:
+                print(f"🧹 Evicted {evicted} idle chat sessions")
+            frozen = await asyncio.to_thread(store.freeze_idle, locks)
+            if frozen:
+                print(f"🧊 Moved {frozen} idle chat sessions to cold storage")
+        except Exception as e:
+            print(f"⚠️ Session eviction failed: {e}")
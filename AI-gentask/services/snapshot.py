@@ -0,0 +1,135 @@
+"""
+KB Snapshots - portable, precomputed embeddings for fast cold starts
+
+A snapshot directory contains:
+    manifest.json           model, backend, dimension, count, shard list (+ sha256),
+                            per-doc content hashes from the ingest manifest
+    embeddings-NNNNN.npy    float32, L2-normalized, ``shard_size`` rows per shard
+    records.json            {"ids": [...], "metadatas": [...], "documents": [...]}
+
+The retriever opens it directly with VECTOR_BACKEND=numpy VECTOR_INDEX_DIR=<snapshot>
+(shards are memory-mapped read-only), or it can be imported back into Chroma
+without loading the embedding model (``scripts/kb_snapshot.py import``).
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from services.vector_index import RECORDS_FILE, SNAPSHOT_MANIFEST, load_snapshot_manifest, _normalize
+
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_SHARD_SIZE = int(os.getenv("SNAPSHOT_SHARD_SIZE", "4096"))
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def export_snapshot(
+    collection: Any,
+    out_dir: str,
+    info: Dict[str, Any],
+    doc_hashes: Optional[Dict[str, str]] = None,
+    shard_size: int = SNAPSHOT_SHARD_SIZE,
+) -> Dict[str, Any]:
+    """
+    Page through ``collection`` shard by shard and write a snapshot to ``out_dir``.
+
+    The snapshot is built in a temporary directory and moved into place at the
+    end, so readers never see a half-written snapshot.
+    """
+    tmp_dir = f"{out_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    ids: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    documents: List[str] = []
+    shards: List[Dict[str, Any]] = []
+    dimension = int(info.get("dimension") or 0)
+
+    offset = 0
+    while True:
+        page = collection.get(
+            limit=shard_size, offset=offset, include=["embeddings", "metadatas", "documents"]
+        )
+        if not page["ids"]:
+            break
+        embs = _normalize(np.asarray(page["embeddings"], dtype=np.float32))
+        dimension = int(embs.shape[1])
+        name = f"embeddings-{len(shards):05d}.npy"
+        path = os.path.join(tmp_dir, name)
+        np.save(path, embs)
+        shards.append({"file": name, "rows": len(page["ids"]), "sha256": _file_sha256(path)})
+        ids.extend(page["ids"])
+        metadatas.extend(m or {} for m in page["metadatas"])
+        documents.extend(page["documents"] or [""] * len(page["ids"]))
+        offset += len(page["ids"])
+
+    with open(os.path.join(tmp_dir, RECORDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "metadatas": metadatas, "documents": documents}, f, ensure_ascii=False, separators=(",", ":"))
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": info.get("model"),
+        "backend": info.get("backend"),
+        "dimension": dimension,
+        "count": len(ids),
+        "shards": shards,
+        "doc_hashes": {d: (doc_hashes or {}).get(d, "") for d in ids},
+    }
+    with open(os.path.join(tmp_dir, SNAPSHOT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # Swap into place
+    old_dir = None
+    if os.path.exists(out_dir):
+        old_dir = f"{out_dir.rstrip(os.sep)}.old-{os.getpid()}"
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_snapshot(src_dir: str, verify: bool = True) -> Tuple[Dict[str, Any], Iterator[Tuple[List[str], np.ndarray, List[Dict[str, Any]], List[str]]]]:
+    """
+    Open a snapshot: returns its manifest and an iterator of
+    (ids, embeddings, metadatas, documents) per shard.
+    """
+    manifest = load_snapshot_manifest(src_dir)
+    if not manifest:
+        raise ValueError(f"'{src_dir}' is not a KB snapshot (missing {SNAPSHOT_MANIFEST})")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    with open(os.path.join(src_dir, RECORDS_FILE), "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    def shards():
+        start = 0
+        for shard in manifest["shards"]:
+            path = os.path.join(src_dir, shard["file"])
+            if verify and shard.get("sha256") and _file_sha256(path) != shard["sha256"]:
+                raise ValueError(f"Snapshot shard {shard['file']} is corrupted (sha256 mismatch)")
+            end = start + shard["rows"]
+            yield (
+                records["ids"][start:end],
+                np.load(path, mmap_mode="r"),
+                records["metadatas"][start:end],
+                (records.get("documents") or [""] * end)[start:end],
+            )
+            start = end
+
+    return manifest, shards()
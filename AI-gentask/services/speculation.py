@@ -0,0 +1,112 @@
+"""
+Speculation - precompute early WBS pipeline stages while the user is still chatting
+As soon as a partial event has the inputs of an early stage (venue tier, RAG
+context, risk catalog; see services/pipeline.early_stages), the stage is
+submitted to a small background executor. The turn that completes the event
+collects the finished (or in-flight) results and passes them to
+``run_pipeline(..., precomputed=...)``, which only runs what is missing.
+
+Results are keyed by stage inputs, so a changed field simply misses, and
+identical inputs from different sessions share one computation.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from services.pipeline import early_stages
+
+
+SPECULATIVE_PIPELINE = os.getenv("SPECULATIVE_PIPELINE", "1") == "1"
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "2"))
+SPECULATIVE_CACHE_SIZE = int(os.getenv("SPECULATIVE_CACHE_SIZE", "512"))
+# How long the final turn waits for a stage still running before computing it itself
+SPECULATIVE_WAIT_SECS = float(os.getenv("SPECULATIVE_WAIT_SECS", "2"))
+
+# Event fields a stage needs before speculating on it is worthwhile
+STAGE_INPUTS = {
+    "venue": ("venue",),
+    "rag": ("event_type", "venue", "headcount_total", "departments"),
+    "risks": ("event_type", "venue", "departments"),
+}
+
+
+class StageSpeculator:
+    """Bounded cache of stage futures keyed by stage inputs"""
+
+    def __init__(
+        self,
+        workers: int = SPECULATIVE_WORKERS,
+        max_entries: int = SPECULATIVE_CACHE_SIZE,
+        wait_secs: float = SPECULATIVE_WAIT_SECS,
+    ):
+        self.max_entries = max_entries
+        self.wait_secs = wait_secs
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="wbs-speculate")
+        self._futures: "OrderedDict[Tuple, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"submitted": 0, "hits": 0, "misses": 0, "waited": 0, "failed": 0}
+
+    def speculate(self, fields: Mapping[str, Any]) -> int:
+        """Submit every early stage whose inputs ``fields`` already has; returns how many were new"""
+        submitted = 0
+        for name, (key, fn, args) in early_stages(fields).items():
+            if not all(fields.get(f) for f in STAGE_INPUTS[name]):
+                continue
+            with self._lock:
+                if self._closed or key in self._futures:
+                    continue
+                self._futures[key] = self._executor.submit(fn, *args)
+                while len(self._futures) > self.max_entries:
+                    self._futures.popitem(last=False)
+                self.stats["submitted"] += 1
+            submitted += 1
+        return submitted
+
+    def collect(self, fields: Mapping[str, Any]) -> Dict[Tuple, Any]:
+        """Results for the stages of ``fields`` that were speculated (waiting briefly for running ones)"""
+        results: Dict[Tuple, Any] = {}
+        for key, _, _ in early_stages(fields).values():
+            with self._lock:
+                future = self._futures.get(key)
+                if future is not None:
+                    self._futures.move_to_end(key)
+                else:
+                    self.stats["misses"] += 1
+                    continue
+                if not future.done():
+                    self.stats["waited"] += 1
+            try:
+                result = future.result(timeout=self.wait_secs)
+            except FutureTimeout:
+                with self._lock:
+                    self.stats["misses"] += 1
+                continue
+            except Exception:
+                # The final run recomputes it (and surfaces the error there)
+                with self._lock:
+                    self.stats["failed"] += 1
+                    self._futures.pop(key, None)
+                continue
+            results[key] = result
+            with self._lock:
+                self.stats["hits"] += 1
+        return results
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._futures), **self.stats}
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_speculator() -> Optional[StageSpeculator]:
+    """Speculator from env settings, or None when SPECULATIVE_PIPELINE=0"""
+    return StageSpeculator() if SPECULATIVE_PIPELINE else None
@@ -0,0 +1,377 @@
+"""
+Vector Index - backends behind retrieve_docs
+Selected with VECTOR_BACKEND:
+- chroma : chromadb.PersistentClient collection (default)
+- numpy  : in-memory brute force over a memory-mapped .npy matrix (exact)
+- hnsw   : hnswlib graph over the same vectors (approximate, needs hnswlib)
+
+Every backend answers ``query`` with the same Chroma-shaped dict
+(ids / metadatas / documents / distances, one list per query) and accepts the
+same ``where`` filters, so retrieve_docs does not care which one is active.
+
+The numpy and hnsw backends read an index directory built from the Chroma
+collection with ``scripts/build_vector_index.py``:
+    embeddings.npy  float32, L2-normalized, one row per doc
+    records.json    {"ids": [...], "metadatas": [...], "documents": [...]}
+    hnsw.bin        hnswlib index (hnsw backend only)
+The numpy backend also opens KB snapshots (``scripts/kb_snapshot.py``): a
+``manifest.json`` listing sharded ``embeddings-NNNNN.npy`` files, each
+memory-mapped read-only so processes share them through the page cache.
+
+Index generations: ingestion bumps ``index_generation.json`` in the Chroma
+dir, and for numpy/hnsw publishes each rebuild into ``gen-NNNNNN/`` with a
+``CURRENT`` pointer file, so running workers can detect the change and swap
+to the new index without restarting.
+"""
+
+import os
+import json
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./vector_index")
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Filters keeping fewer rows than this fraction are answered by exact search on those rows
+HNSW_EXACT_FILTER_RATIO = float(os.getenv("HNSW_EXACT_FILTER_RATIO", "0.2"))
+
+BACKENDS = ("chroma", "numpy", "hnsw")
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+HNSW_FILE = "hnsw.bin"
+SNAPSHOT_MANIFEST = "manifest.json"
+GENERATION_FILE = "index_generation.json"
+CURRENT_FILE = "CURRENT"
+KEEP_GENERATIONS = 2
+
+
+# ====== Metadata filters (subset of Chroma's where syntax) ======
+def match_where(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Chroma-style where clause ($and/$or, $eq/$ne/$in/$nin) against one metadata dict"""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, operand in cond.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op not in ("$eq", "$ne", "$in", "$nin"):
+                    raise ValueError(f"Unsupported where operator '{op}'")
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _empty_result(n_queries: int, include: Sequence[str]) -> Dict[str, Any]:
+    res: Dict[str, Any] = {"ids": [[] for _ in range(n_queries)]}
+    for field in ("metadatas", "documents", "distances"):
+        res[field] = [[] for _ in range(n_queries)] if field in include else None
+    return res
+
+
+# ====== Backends ======
+class VectorIndex:
+    """Common interface of all vector index backends"""
+
+    name = "base"
+
+    def query(
+        self,
+        query_embeddings: Any,
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaIndex(VectorIndex):
+    name = "chroma"
+
+    def __init__(self, collection: Any):
+        self.collection = collection
+
+    def query(self, query_embeddings, n_results, where=None, include=("metadatas", "documents", "distances")):
+        return self.collection.query(
+            query_embeddings=query_embeddings, n_results=n_results, where=where, include=list(include)
+        )
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+class NumpyIndex(VectorIndex):
+    """Exact cosine search: one matrix product against all (filtered) rows"""
+
+    name = "numpy"
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR, mmap: bool = True):
+        self.index_dir = index_dir
+        mode = "r" if mmap else None
+        self.manifest = load_snapshot_manifest(index_dir)
+        if self.manifest:
+            self.shards = [np.load(os.path.join(index_dir, s["file"]), mmap_mode=mode) for s in self.manifest["shards"]]
+        else:
+            self.shards = [np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode=mode)]
+        self.offsets = np.cumsum([0] + [len(s) for s in self.shards])[:-1].tolist()
+        self.dimension = int(self.shards[0].shape[1]) if self.shards and self.shards[0].ndim == 2 else 0
+        with open(os.path.join(index_dir, RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids: List[str] = records["ids"]
+        self.metadatas: List[Dict[str, Any]] = records["metadatas"]
+        self.documents: List[str] = records.get("documents") or [""] * len(self.ids)
+        self._mask_cache: Dict[str, np.ndarray] = {}
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = np.fromiter((match_where(m or {}, where) for m in self.metadatas), dtype=bool, count=len(self.ids))
+            if len(self._mask_cache) >= 256:
+                self._mask_cache.clear()
+            self._mask_cache[key] = mask
+        return mask
+
+    def _rows(self, hits: List[List[int]], dists: List[List[float]], include: Sequence[str]) -> Dict[str, Any]:
+        return {
+            "ids": [[self.ids[i] for i in row] for row in hits],
+            "metadatas": [[dict(self.metadatas[i] or {}) for i in row] for row in hits] if "metadatas" in include else None,
+            "documents": [[self.documents[i] for i in row] for row in hits] if "documents" in include else None,
+            "distances": dists if "distances" in include else None,
+        }
+
+    def _exact(self, q: np.ndarray, n_results: int, mask: Optional[np.ndarray]):
+        # Score shard by shard (only the allowed rows), then pick the global top-k
+        if n_results <= 0:
+            return [[] for _ in range(len(q))], [[] for _ in range(len(q))]
+        parts, rows = [], []
+        for start, shard in zip(self.offsets, self.shards):
+            if not len(shard):
+                continue  # empty index (np.zeros((0, 0)) before the first ingest)
+            if mask is None:
+                local = None
+                parts.append(q @ np.asarray(shard).T)
+                rows.append(np.arange(start, start + len(shard)))
+            else:
+                local = np.flatnonzero(mask[start:start + len(shard)])
+                if len(local):
+                    parts.append(q @ np.asarray(shard[local]).T)
+                    rows.append(local + start)
+        if not parts:
+            return [[] for _ in range(len(q))], [[] for _ in range(len(q))]
+        sims = parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1)
+        row_ids = rows[0] if len(rows) == 1 else np.concatenate(rows)
+        k = min(n_results, sims.shape[1])
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        hits, dists = [], []
+        for qi in range(len(q)):
+            order = top[qi][np.argsort(-sims[qi, top[qi]])]
+            hits.append([int(r) for r in row_ids[order]])
+            dists.append([float(1.0 - sims[qi, o]) for o in order])
+        return hits, dists
+
+    def query(self, query_embeddings, n_results, where=None, include=("metadatas", "documents", "distances")):
+        q = _normalize(query_embeddings)
+        hits, dists = self._exact(q, n_results, self._mask(where))
+        return self._rows(hits, dists, include)
+
+
+class HnswIndex(NumpyIndex):
+    """Approximate search with hnswlib; filtered queries use hnswlib's label filter"""
+
+    name = "hnsw"
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR, ef_search: int = HNSW_EF_SEARCH):
+        super().__init__(index_dir)
+        import hnswlib  # optional dependency
+
+        self.index = hnswlib.Index(space="cosine", dim=self.dimension)
+        self.index.load_index(os.path.join(index_dir, HNSW_FILE), max_elements=len(self.ids))
+        self.ef_search = ef_search
+
+    def query(self, query_embeddings, n_results, where=None, include=("metadatas", "documents", "distances")):
+        q = _normalize(query_embeddings)
+        mask = self._mask(where)
+        allowed = len(self.ids) if mask is None else int(mask.sum())
+        k = min(n_results, allowed)
+        if k == 0:
+            return _empty_result(len(q), include)
+        if mask is not None and allowed < HNSW_EXACT_FILTER_RATIO * len(self.ids):
+            hits, dists = self._exact(q, k, mask)
+            return self._rows(hits, dists, include)
+        self.index.set_ef(max(self.ef_search, k))
+        try:
+            labels, distances = self.index.knn_query(
+                q, k=k, filter=(lambda label: bool(mask[label])) if mask is not None else None
+            )
+        except RuntimeError:
+            # Graph could not reach k allowed nodes (very selective filter): exact search instead
+            hits, dists = self._exact(q, k, mask)
+            return self._rows(hits, dists, include)
+        hits = [[int(label) for label in row] for row in labels]
+        dists = [[float(d) for d in row] for row in distances]
+        return self._rows(hits, dists, include)
+
+
+def load_snapshot_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(index_dir, SNAPSHOT_MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ====== Build ======
+def build_index_dir(
+    index_dir: str,
+    ids: List[str],
+    embeddings: Any,
+    metadatas: List[Dict[str, Any]],
+    documents: Optional[List[str]] = None,
+    hnsw: bool = True,
+    hnsw_m: int = 16,
+    hnsw_ef_construction: int = 200,
+) -> Dict[str, Any]:
+    """Write embeddings.npy + records.json (+ hnsw.bin when hnswlib is installed)"""
+    os.makedirs(index_dir, exist_ok=True)
+    matrix = _normalize(embeddings) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+    np.save(os.path.join(index_dir, EMBEDDINGS_FILE), matrix)
+    with open(os.path.join(index_dir, RECORDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "metadatas": metadatas, "documents": documents}, f, ensure_ascii=False)
+
+    built = {"count": len(ids), "dimension": int(matrix.shape[1]) if len(ids) else 0, "hnsw": False}
+    if hnsw and len(ids):
+        try:
+            import hnswlib
+        except ImportError:
+            print("hnswlib not installed, skipping hnsw.bin")
+            return built
+        index = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        index.init_index(max_elements=len(ids), ef_construction=hnsw_ef_construction, M=hnsw_m)
+        index.add_items(matrix, np.arange(len(ids)))
+        index.save_index(os.path.join(index_dir, HNSW_FILE))
+        built["hnsw"] = True
+    return built
+
+
+def export_collection(collection: Any, index_dir: str, hnsw: bool = True) -> Dict[str, Any]:
+    """Dump a Chroma collection into an index directory for the numpy/hnsw backends"""
+    data = collection.get(include=["embeddings", "metadatas", "documents"])
+    return build_index_dir(
+        index_dir,
+        ids=list(data["ids"]),
+        embeddings=np.asarray(data["embeddings"], dtype=np.float32),
+        metadatas=[m or {} for m in data["metadatas"]],
+        documents=list(data["documents"]) if data.get("documents") is not None else None,
+        hnsw=hnsw,
+    )
+
+
+# ====== Generations ======
+def _write_atomic(path: str, content: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def read_generation(store_dir: str) -> int:
+    try:
+        with open(os.path.join(store_dir, GENERATION_FILE), "r", encoding="utf-8") as f:
+            return int(json.load(f).get("generation", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_generation(store_dir: str) -> int:
+    """Mark the vector store as changed; running retrievers reload on the next check"""
+    generation = read_generation(store_dir) + 1
+    _write_atomic(
+        os.path.join(store_dir, GENERATION_FILE),
+        json.dumps({"generation": generation, "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}),
+    )
+    return generation
+
+
+def resolve_index_dir(index_dir: str) -> str:
+    """Follow the CURRENT pointer of a generational index dir (plain dirs are returned as-is)"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        return os.path.join(index_dir, name) if name else index_dir
+    except OSError:
+        return index_dir
+
+
+def publish_generation(collection: Any, index_dir: str, generation: int, hnsw: bool = True) -> str:
+    """Export ``collection`` into gen-NNNNNN/, then atomically repoint CURRENT to it"""
+    os.makedirs(index_dir, exist_ok=True)
+    name = f"gen-{generation:06d}"
+    export_collection(collection, os.path.join(index_dir, name), hnsw=hnsw)
+    _write_atomic(os.path.join(index_dir, CURRENT_FILE), name)
+    # Older generations may still be memory-mapped by workers that have not reloaded yet
+    old = sorted(d for d in os.listdir(index_dir) if d.startswith("gen-") and d != name)
+    for stale in old[:-KEEP_GENERATIONS] if len(old) > KEEP_GENERATIONS else []:
+        shutil.rmtree(os.path.join(index_dir, stale), ignore_errors=True)
+    return name
+
+
+def generation_marker(backend: str, chroma_dir: str, index_dir: str = VECTOR_INDEX_DIR) -> str:
+    """File whose change means a new index generation for ``backend``"""
+    if backend == "chroma":
+        return os.path.join(chroma_dir, GENERATION_FILE)
+    return os.path.join(index_dir, CURRENT_FILE)
+
+
+def marker_signature(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+
+def open_index(backend: str, collection_factory=None, index_dir: str = VECTOR_INDEX_DIR) -> VectorIndex:
+    """Open the index for ``backend``; chroma needs ``collection_factory`` to get its collection"""
+    if backend == "chroma":
+        return ChromaIndex(collection_factory())
+    if backend == "numpy":
+        return NumpyIndex(resolve_index_dir(index_dir))
+    if backend == "hnsw":
+        return HnswIndex(resolve_index_dir(index_dir))
+    raise ValueError(f"Unknown VECTOR_BACKEND '{backend}', expected one of {BACKENDS}")
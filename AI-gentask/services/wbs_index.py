@@ -0,0 +1,236 @@
+"""
+WBS Query Index - per-event lookup structures for chat questions
+Built once when a WBS is stored, so questions about an event ("deadline gần
+nhất", "tasks của ban Marketing", "rủi ro critical", free text) are answered
+from prebuilt views instead of rescanning / re-serializing the whole WBS:
+- tasks by department, by priority, by deadline (sorted)
+- risks by level (department + overall)
+- BM25 over task text, plus a lazily built embedding matrix of task names
+
+``relevant`` picks the rows a question is about; ChatProcessor answers from
+them directly or passes only those rows to the LLM.
+"""
+
+import os
+import re
+import bisect
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.lexical_index import BM25Index
+from utils.department_normalizer import DEPARTMENT_KEYWORDS, STANDARD_DEPARTMENTS
+from utils.text_normalize import fold_accents
+
+
+WBS_INDEX_CACHE_SIZE = int(os.getenv("WBS_INDEX_CACHE_SIZE", "256"))
+# Embed task names for free-text questions (falls back to BM25 if no embedder)
+WBS_INDEX_SEMANTIC = os.getenv("WBS_INDEX_SEMANTIC", "1") == "1"
+
+LEVELS = ("critical", "high", "medium", "low")
+_LEVEL_RANK = {level: i for i, level in enumerate(LEVELS)}
+
+# ====== Question patterns (accent-folded text) ======
+_DEPARTMENT_RES = {
+    bucket: re.compile(r"\b(?:" + "|".join(re.escape(fold_accents(k)) for k in keywords) + r")\b")
+    for bucket, keywords in DEPARTMENT_KEYWORDS.items()
+}
+# "cao"/"thap" alone are too ambiguous ("bao cao"), so levels only count
+# when the question is about priority or risk
+_LEVEL_CONTEXT_RE = re.compile(r"\b(?:uu tien|priority|muc|level|rui ro|risk|quan trong|nghiem trong)\b")
+_LEVEL_RES = {
+    "critical": re.compile(r"\b(?:critical|nghiem trong|khan cap|cuc cao)\b"),
+    "high": re.compile(r"\b(?:high|cao|quan trong)\b"),
+    "medium": re.compile(r"\b(?:medium|trung binh)\b"),
+    "low": re.compile(r"\b(?:low|thap)\b"),
+}
+_RISK_RE = re.compile(r"\b(?:rui ro|risks?)\b")
+_DEADLINE_RE = re.compile(r"\b(?:deadline|han chot|thoi han|gan nhat|sap den|sap toi|truoc tien|timeline)\b")
+_TASK_RE = re.compile(r"\b(?:tasks?|cong viec|nhiem vu|viec)\b")
+_COUNT_RE = re.compile(r"\b(?:bao nhieu|so luong|tong|tong quan|tien do|count|list)\b")
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+class WBSQueryIndex:
+    """Read-only views over one WBS; rows are the WBS's own task / risk dicts"""
+
+    def __init__(self, wbs: Dict[str, Any]):
+        self.departments: Dict[str, List[Dict[str, Any]]] = {
+            dept: list(tasks) for dept, tasks in (wbs.get("departments") or {}).items()
+        }
+        self.tasks: List[Dict[str, Any]] = [t for tasks in self.departments.values() for t in tasks]
+        self.task_department: Dict[str, str] = {
+            t.get("task_id", ""): dept for dept, tasks in self.departments.items() for t in tasks
+        }
+
+        self.by_priority: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for task in self.tasks:
+            self.by_priority[task.get("priority", "medium")].append(task)
+
+        # Sorted once: (deadline, priority rank) -> bisect for "from today on"
+        dated = [(d, t) for t in self.tasks for d in [_parse_date(t.get("deadline"))] if d is not None]
+        dated.sort(key=lambda dt: (dt[0], _LEVEL_RANK.get(dt[1].get("priority"), len(LEVELS))))
+        self.deadline_keys: List[datetime] = [d for d, _ in dated]
+        self.by_deadline: List[Dict[str, Any]] = [t for _, t in dated]
+
+        risks = wbs.get("risks") or {}
+        self.risks: List[Dict[str, Any]] = [
+            r for dept_risks in (risks.get("by_department") or {}).values() for r in dept_risks
+        ] + list(risks.get("overall") or [])
+        self.risks.sort(key=lambda r: _LEVEL_RANK.get(r.get("level"), len(LEVELS)))
+        self.risks_by_level: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for risk in self.risks:
+            self.risks_by_level[risk.get("level", "medium")].append(risk)
+
+        self.task_text = BM25Index.build(
+            {t["task_id"]: f"{t.get('name', '')} {t.get('category', '')} {t.get('description', '')}" for t in self.tasks if t.get("task_id")}
+        )
+        self._task_by_id = {t.get("task_id"): t for t in self.tasks}
+        self._embeddings: Optional[np.ndarray] = None
+        self._embeddings_failed = not WBS_INDEX_SEMANTIC
+        self._lock = threading.Lock()
+
+    # ====== Views ======
+    def counts(self) -> Dict[str, Any]:
+        return {
+            "tasks": len(self.tasks),
+            "by_department": {dept: len(tasks) for dept, tasks in self.departments.items() if tasks},
+            "by_priority": {p: len(self.by_priority[p]) for p in LEVELS if self.by_priority.get(p)},
+            "risks_by_level": {lv: len(self.risks_by_level[lv]) for lv in LEVELS if self.risks_by_level.get(lv)},
+        }
+
+    def tasks_for_department(self, department: str) -> List[Dict[str, Any]]:
+        return self.departments.get(department, [])
+
+    def upcoming_deadlines(self, limit: int = 10, today: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Tasks ordered by deadline, starting from ``today`` (all of them if every deadline has passed)"""
+        start = bisect.bisect_left(self.deadline_keys, today) if today is not None else 0
+        if start >= len(self.by_deadline):
+            start = 0
+        return self.by_deadline[start:start + limit]
+
+    def risks_at(self, levels: List[str]) -> List[Dict[str, Any]]:
+        return [r for level in levels for r in self.risks_by_level.get(level, [])]
+
+    # ====== Free-text lookup ======
+    def _task_embeddings(self) -> Optional[np.ndarray]:
+        if self._embeddings is not None or self._embeddings_failed:
+            return self._embeddings
+        with self._lock:
+            if self._embeddings is None and not self._embeddings_failed:
+                try:
+                    from services.retriever import encode_texts
+
+                    matrix = np.asarray(encode_texts([t.get("name", "") for t in self.tasks]), dtype=np.float32)
+                    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+                    self._embeddings = matrix
+                except Exception as e:
+                    print(f"⚠️ Task embeddings unavailable ({e}), using keyword search")
+                    self._embeddings_failed = True
+        return self._embeddings
+
+    def search_tasks(self, query: str, top_k: int = 8) -> List[Dict[str, Any]]:
+        """
+        Keyword hits first; task-name embeddings when no keyword matches, only
+        if the retriever's embedder is already loaded (never loads a model on
+        the request path)
+        """
+        hits = self.task_text.search(query, top_k=top_k)
+        if hits:
+            return [self._task_by_id[doc_id] for doc_id, _ in hits]
+        from services.retriever import embedder_loaded, encode_texts
+
+        if not embedder_loaded():
+            return []
+        matrix = self._task_embeddings()
+        if matrix is None or not len(matrix):
+            return []
+
+        q = np.asarray(encode_texts([query]), dtype=np.float32)[0]
+        scores = matrix @ (q / (np.linalg.norm(q) + 1e-12))
+        top = np.argsort(-scores)[:top_k]
+        return [self.tasks[i] for i in top]
+
+    # ====== Question -> rows ======
+    def relevant(self, question: str, limit: int = 10, today: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Rows a question is about.
+
+        Returns ``{"kind", "department", "levels", "tasks", "risks", "total"}``
+        where kind is one of department, deadline, priority, risk, search,
+        overview; ``total`` counts all matching rows before ``limit``.
+        """
+        text = fold_accents(question)
+        department = next((b for b, pattern in _DEPARTMENT_RES.items() if pattern.search(text)), None)
+        levels = [lv for lv, pattern in _LEVEL_RES.items() if pattern.search(text)] if _LEVEL_CONTEXT_RE.search(text) else []
+        wants_risk = _RISK_RE.search(text) is not None
+        result: Dict[str, Any] = {"kind": "overview", "department": department, "levels": levels, "tasks": [], "risks": [], "total": 0}
+
+        if wants_risk:
+            risks = self.risks_at(levels) if levels else self.risks
+            if department:
+                risks = [r for r in risks if r.get("owner") == department]
+            result.update(kind="risk", risks=risks[:limit], total=len(risks))
+        elif _DEADLINE_RE.search(text):
+            tasks = self.upcoming_deadlines(len(self.by_deadline), today=today)
+            if department:
+                tasks = [t for t in tasks if self.task_department.get(t.get("task_id")) == department]
+            result.update(kind="deadline", tasks=tasks[:limit], total=len(tasks))
+        elif department:
+            tasks = self.tasks_for_department(department)
+            if levels:
+                tasks = [t for t in tasks if t.get("priority") in levels]
+            result.update(kind="department", tasks=tasks[:limit], total=len(tasks))
+        elif levels:
+            tasks = [t for lv in levels for t in self.by_priority.get(lv, [])]
+            result.update(kind="priority", tasks=tasks[:limit], total=len(tasks))
+        elif not (_TASK_RE.search(text) or _COUNT_RE.search(text)):
+            tasks = self.search_tasks(question, top_k=limit)
+            if tasks:
+                result.update(kind="search", tasks=tasks, total=len(tasks))
+        return result
+
+    @staticmethod
+    def department_label(department: Optional[str]) -> str:
+        return STANDARD_DEPARTMENTS.get(department or "", department or "")
+
+
+# ====== Per-event cache ======
+_indexes: "OrderedDict[str, WBSQueryIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def build_wbs_index(key: str, wbs: Dict[str, Any]) -> WBSQueryIndex:
+    """Build and cache the index of a freshly stored WBS"""
+    index = WBSQueryIndex(wbs)
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > WBS_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_wbs_index(key: Optional[str], wbs: Dict[str, Any]) -> WBSQueryIndex:
+    """
+    Cached index for ``key``; rebuilt from ``wbs`` on a miss (evicted, another
+    worker stored it, session restored from SQLite).
+    """
+    if key:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is not None:
+                _indexes.move_to_end(key)
+                return index
+        return build_wbs_index(key, wbs)
+    return WBSQueryIndex(wbs)
+
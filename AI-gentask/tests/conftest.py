@@ -0,0 +1,11 @@
+"""
+Shared pytest setup: run from AI-gentask/ (``python -m pytest -q``)
+The suite only touches in-process stores and pure helpers: no OpenAI key,
+Chroma store or embedding model is needed.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "")
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from services.cold_storage import ColdTier
+from services.session_store import InMemorySessionStore, SessionLocks, new_session
+
+
+def _session(turns: int = 1, event: str = "EVT-1"):
+    session = new_session()
+    for i in range(turns):
+        session["messages"].append({"role": "user", "content": f"q{i}", "timestamp": datetime.now().isoformat()})
+    session["current_event"] = event
+    session["events"][event] = {"event_name": "Concert Khai Giảng", "event_date": "2026-12-25", "headcount_total": 80}
+    session["artifacts"][event] = {"version": 1, "etag": "abc", "wbs": {"departments": {"Hậu cần": [{"title": "Thuê âm thanh"}]}}}
+    return session
+
+
+@pytest.mark.parametrize("directory", [False, True])
+def test_cold_tier_round_trip(tmp_path, directory):
+    tier = ColdTier(codec="zlib", directory=str(tmp_path) if directory else "")
+    session = _session(turns=3)
+    blob = tier.encode(session)
+    tier.put("s1", blob, live_size=1000)
+    assert "s1" in tier and tier.metrics()["cold_bytes"] == len(blob)
+    assert tier.peek("s1") == session
+    restored = tier.take("s1")
+    assert restored == session
+    assert isinstance(restored["created_at"], datetime)
+    assert "s1" not in tier and tier.blob_bytes == 0
+    tier.close()
+
+
+def test_store_freezes_idle_sessions_and_rehydrates_on_get():
+    store = InMemorySessionStore(max_sessions=0, ttl_secs=0, cold_after_secs=0.001, cold=ColdTier())
+    sessions = {f"s{i}": _session(turns=i + 1) for i in range(3)}
+    for sid, session in sessions.items():
+        store.save(sid, session)
+    listed = store.list_sessions()
+    time.sleep(0.01)
+
+    assert store.freeze_idle() == 3
+    metrics = store.metrics()
+    assert metrics["resident_sessions"] == 0 and metrics["cold_sessions"] == 3
+    assert len(store) == 3 and "s1" in store
+    # Listing and items() read frozen sessions without rehydrating them
+    assert store.list_sessions() == listed
+    assert dict(store.items()) == sessions
+    assert store.metrics()["cold_sessions"] == 3
+
+    restored = store.get("s1")
+    assert restored == sessions["s1"]
+    assert store.metrics()["resident_sessions"] == 1 and store.metrics()["rehydrated"] == 1
+    # Saving the rehydrated session keeps a single copy
+    restored["messages"].append({"role": "assistant", "content": "a"})
+    store.save("s1", restored)
+    assert len(store) == 3 and store.get("s1")["messages"][-1]["content"] == "a"
+    assert store.delete("s0") and "s0" not in store and len(store) == 2
+    store.close()
+
+
+def test_freeze_skips_sessions_with_a_turn_in_flight():
+    store = InMemorySessionStore(max_sessions=0, ttl_secs=0, cold_after_secs=0.001, cold=ColdTier())
+    locks = SessionLocks()
+    store.save("busy", _session())
+    store.save("idle", _session())
+    time.sleep(0.01)
+    with locks.hold("busy"):
+        assert store.freeze_idle(locks) == 1
+    assert store.metrics()["freeze_skipped"] == 1
+    assert store.freeze_idle(locks) == 1
+    assert store.metrics()["cold_sessions"] == 2
+    store.close()
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from services.history import fold_history, page_history, total_messages
+from services.session_store import new_session, trim_messages
+
+
+def _session(turns: int):
+    session = new_session()
+    start = datetime(2026, 1, 1, 9, 0)
+    for i in range(turns):
+        at = (start + timedelta(minutes=i)).isoformat()
+        session["messages"].append({"role": "user", "content": f"q{i}", "timestamp": at})
+        session["messages"].append({"role": "assistant", "content": f"a{i}", "intent": "general_chat", "timestamp": at})
+    return session
+
+
+def _contents(page):
+    return {m["seq"]: m["content"] for m in page["history"]}
+
+
+def test_page_latest_then_older():
+    session = _session(10)
+    first = page_history(session, limit=6)
+    assert [m["seq"] for m in first["history"]] == list(range(14, 20))
+    assert first["next_before"] == 14 and first["has_more"]
+    second = page_history(session, before=first["next_before"], limit=6)
+    assert [m["seq"] for m in second["history"]] == list(range(8, 14))
+
+
+def test_seq_stable_across_fold():
+    session = _session(30)  # 60 messages
+    before = _contents(page_history(session, limit=20))
+
+    folded = fold_history(session, window=20, fold=10)
+    assert folded == 40
+    assert total_messages(session) == 60
+    after = page_history(session, limit=20)
+    assert _contents(after) == before
+    assert after["total_messages"] == 60
+    assert after["summary"]["messages"] == 40 and after["summary"]["turns"] == 20
+
+
+def test_paging_stops_at_the_fold():
+    session = _session(30)
+    fold_history(session, window=20, fold=10)
+    page = page_history(session, before=45, limit=10)
+    assert [m["seq"] for m in page["history"]] == list(range(40, 45))
+    assert page["next_before"] is None and not page["has_more"]
+    # Folded turns are only in the summary
+    assert page_history(session, before=30, limit=10)["history"] == []
+
+
+def test_page_requested_before_a_fold_continues_after_it():
+    session = _session(30)
+    first = page_history(session, limit=10)
+    # New turns arrive and the oldest ones are folded between two page requests
+    for i in range(30, 40):
+        session["messages"].append({"role": "user", "content": f"q{i}", "timestamp": "2026-01-02T00:00:00"})
+        session["messages"].append({"role": "assistant", "content": f"a{i}", "timestamp": "2026-01-02T00:00:00"})
+    fold_history(session, window=40, fold=10)
+    second = page_history(session, before=first["next_before"], limit=10)
+    assert [m["seq"] for m in second["history"]] == list(range(40, 50))
+    assert [m["content"] for m in second["history"]][:2] == ["q20", "a20"]
+
+
+def test_fold_cuts_on_a_user_message():
+    session = _session(30)
+    fold_history(session, window=21, fold=10)
+    assert session["messages"][0]["role"] == "user"
+    assert total_messages(session) == 60
+
+
+def test_trim_messages_folds_the_excess():
+    session = _session(130)  # 260 messages
+    assert trim_messages(session, 200) == 60
+    assert len(session["messages"]) == 200
+    assert total_messages(session) == 260
+    page = page_history(session, limit=5)
+    assert [m["seq"] for m in page["history"]] == list(range(255, 260))
+
+
+def test_summary_of_messages_without_timestamps():
+    session = new_session()
+    for i in range(10):
+        session["messages"].append({"role": "user", "content": f"q{i}"})
+        session["messages"].append({"role": "assistant", "content": f"a{i}"})
+    assert fold_history(session, window=4, fold=2) == 16
+    summary = session["history_summary"]
+    assert summary["from"] is None
+    assert summary["text"].startswith("8 lượt trước.")
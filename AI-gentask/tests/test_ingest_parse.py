@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import scripts.ingest_global_chroma as ingest_script
+
+
+class RecordingPool:
+    """In-process stand-in for ProcessPoolExecutor that tracks unconsumed tasks"""
+
+    def __init__(self, max_workers):
+        self.pending = 0
+        self.peak = 0
+        self.shutdowns = []
+
+    def submit(self, fn, *args):
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        return _Task(self, fn(*args))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdowns.append(cancel_futures)
+
+
+class _Task:
+    def __init__(self, pool, value):
+        self.pool, self.value = pool, value
+
+    def result(self):
+        self.pool.pending -= 1
+        return self.value
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    created = []
+
+    def make(max_workers):
+        created.append(RecordingPool(max_workers))
+        return created[-1]
+
+    monkeypatch.setattr(ingest_script, "ProcessPoolExecutor", make)
+    return created
+
+
+def _write_kb(data_dir, n):
+    for i in range(n):
+        doc = {"doc_id": f"doc-{i:03d}", "baseline_tasks": [{"name": f"Task {i}", "owner_department": "Hậu cần"}]}
+        (data_dir / f"{i:03d}.json").write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+
+
+def test_parallel_parse_keeps_order_with_a_bounded_window(tmp_path, monkeypatch, pools):
+    _write_kb(tmp_path, 200)
+    monkeypatch.setattr(ingest_script, "DATA_DIR", str(tmp_path))
+
+    docs = list(ingest_script.iter_kb_docs(workers=2))
+
+    assert [d[0] for d in docs] == [f"doc-{i:03d}" for i in range(200)]
+    assert docs == [ingest_script.parse_kb_file(f"{i:03d}.json") for i in range(200)]
+    assert pools[0].peak == 4  # 2 × workers chunks in flight, not every file
+    assert pools[0].shutdowns == [True]
+
+
+def test_abandoned_parse_cancels_queued_work(tmp_path, monkeypatch, pools):
+    _write_kb(tmp_path, 200)
+    monkeypatch.setattr(ingest_script, "DATA_DIR", str(tmp_path))
+
+    docs = ingest_script.iter_kb_docs(workers=2)
+    next(docs)
+    docs.close()
+    assert pools[0].shutdowns == [True]
+
+
+def test_parallel_parse_with_real_processes(tmp_path, monkeypatch):
+    _write_kb(tmp_path, 150)
+    monkeypatch.setattr(ingest_script, "DATA_DIR", str(tmp_path))
+    docs = list(ingest_script.iter_kb_docs(workers=2))
+    assert [d[0] for d in docs] == [f"doc-{i:03d}" for i in range(150)]
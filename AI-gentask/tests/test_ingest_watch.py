@@ -0,0 +1,75 @@
+import json
+import sys
+
+import pytest
+
+import scripts.ingest_global_chroma as ingest_script
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    data_dir, chroma_dir = tmp_path / "kb", tmp_path / "chroma"
+    data_dir.mkdir()
+    chroma_dir.mkdir()
+    monkeypatch.setattr(ingest_script, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(ingest_script, "CHROMA_DIR", str(chroma_dir))
+    monkeypatch.setitem(sys.modules, "watchfiles", None)  # polling path
+    return data_dir, chroma_dir
+
+
+def test_parse_error_names_the_file(kb):
+    data_dir, _ = kb
+    (data_dir / "half.json").write_text('{"doc_id": "a", "baseline', encoding="utf-8")
+    with pytest.raises(ValueError, match="half.json"):
+        ingest_script.parse_kb_file("half.json")
+
+
+def test_watch_survives_a_bad_file_and_retries(kb, monkeypatch):
+    data_dir, chroma_dir = kb
+    (data_dir / "half.json").write_text('{"doc_id": "a", "baseline', encoding="utf-8")
+    manifest = {"docs": {"old": {"hash": "h", "source": "old.json"}}, "updated_at": "2026-01-01T00:00:00"}
+    (chroma_dir / ingest_script.MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+
+    calls, ticks = [], []
+    real_ingest = ingest_script.ingest
+
+    def spy(**kwargs):
+        calls.append(kwargs)
+        return real_ingest(**kwargs)
+
+    def tick(_):
+        ticks.append(1)
+        if len(ticks) > 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(ingest_script, "ingest", spy)
+    monkeypatch.setattr(ingest_script.time, "sleep", tick)
+    ingest_script.watch(interval=0.01, workers=1)
+
+    # First pass + one retry per tick, nothing written by the failed passes
+    assert len(calls) == 3
+    assert json.loads((chroma_dir / ingest_script.MANIFEST_FILE).read_text(encoding="utf-8")) == manifest
+    assert not (chroma_dir / ingest_script.BM25_FILE).exists()
+
+
+def test_watch_stops_retrying_once_a_pass_succeeds(kb, monkeypatch):
+    outcomes = [ValueError("half.json: truncated"), None]
+    calls, ticks = [], []
+
+    def fake_ingest(**kwargs):
+        calls.append(kwargs)
+        outcome = outcomes.pop(0) if outcomes else None
+        if outcome:
+            raise outcome
+
+    def tick(_):
+        ticks.append(1)
+        if len(ticks) > 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(ingest_script, "ingest", fake_ingest)
+    monkeypatch.setattr(ingest_script.time, "sleep", tick)
+    ingest_script.watch(interval=0.01, workers=1)
+
+    assert len(calls) == 2  # failed start, retried on the first tick, then no change
+    assert all(c["checkpoint_secs"] == float("inf") for c in calls)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+
+from services.intent_classifier import IntentClassifier, build_models
+
+
+MESSAGES = [
+    "xin chào", "hello bạn", "chào buổi sáng", "hi there",
+    "tổ chức concert ngày 25/12", "lên kế hoạch hội nghị 200 người", "festival ẩm thực tại sảnh", "workshop AI tháng 3",
+    "xem task của sự kiện", "deadline ban hậu cần", "rủi ro của concert", "tiến độ công việc",
+]
+
+
+def _check(intents, event_types):
+    models = build_models(MESSAGES, intents, event_types)
+    clf = IntentClassifier(models, threshold=0.5)
+    probe = MESSAGES + ["", "zzzz", "concert xin chào"]
+    X = models["vectorizer"].transform(probe)
+    intent_proba, type_proba = clf._probabilities(probe)
+    np.testing.assert_allclose(intent_proba, models["intent"].predict_proba(X), atol=1e-12)
+    if models["event_type"] is not None:
+        np.testing.assert_allclose(type_proba, models["event_type"].predict_proba(X), atol=1e-12)
+    # The one-message path gives the same rows as the batch
+    for i, message in enumerate(probe):
+        np.testing.assert_allclose(clf._probabilities([message])[0][0], intent_proba[i], atol=1e-12)
+    np.testing.assert_allclose(intent_proba.sum(axis=1), 1.0)
+    return clf.predict(probe)
+
+
+def test_multiclass_heads_match_predict_proba():
+    intents = ["greeting"] * 4 + ["event_planning"] * 4 + ["event_query"] * 4
+    types = [""] * 4 + ["concert_opening", "conference", "food_festival", "conference"] + [""] * 4
+    _check(intents, types)
+
+
+def test_binary_heads_match_predict_proba():
+    intents = ["greeting"] * 4 + ["event_planning"] * 8
+    types = [""] * 4 + ["concert_opening", "conference", "concert_opening", "conference"] + [""] * 4
+    results = _check(intents, types)
+    assert {r["event_type"] for r in results} <= {"concert_opening", "conference"}
+
+
+def test_single_event_type_has_no_type_head():
+    intents = ["greeting"] * 4 + ["event_planning"] * 8
+    types = [""] * 4 + ["conference"] * 4 + [""] * 4
+    models = build_models(MESSAGES, intents, types)
+    assert models["event_type"] is None
+    result = IntentClassifier(models).predict_one("hội nghị 100 người")
+    assert result["event_type"] is None and result["event_type_confidence"] == 0.0
@@ -0,0 +1,36 @@
+import json
+
+from services.lexical_index import BM25_FILE, BM25Index, BM25Writer
+
+
+DOCS = {
+    "a": "Xin giấy phép công an cho sự kiện ngoài trời",
+    "b": "Technical rider: âm thanh, ánh sáng\nsân khấu",
+    "c": 'Ký hợp đồng "nhà tài trợ" \\ VIP',
+}
+METAS = {"a": {"tag_outdoor": True}, "b": {"event_id": "EVT-1"}, "c": {}}
+
+
+def test_writer_saves_the_same_index_as_build(tmp_path):
+    built, streamed = tmp_path / "built", tmp_path / "streamed"
+    built.mkdir()
+    streamed.mkdir()
+    BM25Index.build(DOCS, METAS).save(str(built))
+    with BM25Writer(spool_dir=str(tmp_path)) as writer:
+        for doc_id, text in DOCS.items():
+            writer.add(doc_id, text, METAS[doc_id])
+        assert len(writer) == 3
+        writer.save(str(streamed))
+
+    expected = json.loads((built / BM25_FILE).read_text(encoding="utf-8"))
+    assert json.loads((streamed / BM25_FILE).read_text(encoding="utf-8")) == expected
+    index = BM25Index.load(str(streamed))
+    assert index.documents == list(DOCS.values())
+    assert index.search("giay phep cong an", top_k=1)[0][0] == "a"
+
+
+def test_empty_writer_saves_a_loadable_index(tmp_path):
+    with BM25Writer() as writer:
+        writer.save(str(tmp_path))
+    index = BM25Index.load(str(tmp_path))
+    assert index is not None and len(index) == 0 and index.search("vip") == []
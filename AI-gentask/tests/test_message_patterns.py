@@ -0,0 +1,159 @@
+"""scan_message against the per-pattern loops it replaced (re.search / ``kw in text`` one by one), plus accent folding"""
+
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime
+
+import pytest
+
+from services.message_patterns import EVENT_TYPE_KEYWORDS, PLANNING_KEYWORDS, scan_message
+from utils.text_normalize import fold_accents
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "kb", "chat", "messages.jsonl")
+
+# Before folding, unaccented spellings were listed next to the accented ones
+LEGACY_DEPARTMENT_KEYWORDS = {
+    "Hậu cần": ["hậu cần", "hau can", "logistics"],
+    "Marketing": ["marketing", "maketing", "media", "truyền thông", "truyen thong"],
+    "Chuyên môn": ["chuyên môn", "chuyen mon", "technical", "kỹ thuật", "ky thuat"],
+    "Tài chính": ["tài chính", "tai chinh", "finance"],
+}
+
+
+def legacy_signals(message: str):
+    text = message.lower().strip()
+    has_date = any(re.search(p, text) for p in (r"\d{1,2}/\d{1,2}/\d{4}", r"\d{4}-\d{2}-\d{2}", r"ngày \d{1,2}"))
+    has_query = any(
+        re.search(p, text)
+        for p in (
+            r"\b(task|công việc|deadline|tiến độ|rủi ro|risk)\b",
+            r"\b(của|trong|sự kiện|event)\b",
+            r"\b(show|xem|hiển thị|list)\b",
+        )
+    )
+    has_switch = re.search(r"\b(chuyển sang|switch to|đổi sang|sang sự kiện)\b", text) is not None
+
+    event_type = next((t for t, kws in EVENT_TYPE_KEYWORDS.items() if any(kw in text for kw in kws)), None)
+
+    event_date = None
+    for pattern, date_format in (
+        (r"(\d{1,2})/(\d{1,2})/(\d{4})", "dmy"),
+        (r"(\d{4})-(\d{2})-(\d{2})", "ymd"),
+        (r"ngày\s+(\d{1,2})[/ ](\d{1,2})[/ ](\d{4})", "dmy"),
+    ):
+        match = re.search(pattern, text)
+        if match:
+            if date_format == "dmy":
+                day, month, year = match.groups()
+                try:
+                    event_date = datetime(int(year), int(month), int(day)).strftime("%Y-%m-%d")
+                    break
+                except ValueError:
+                    continue
+            event_date = match.group(0)
+            break
+
+    headcount = None
+    for pattern in (r"(\d+)\s*người", r"với\s+(\d+)", r"headcount[::\s]+(\d+)"):
+        match = re.search(pattern, text)
+        if match:
+            headcount = int(match.group(1))
+            break
+
+    return {
+        "planning_keyword_count": sum(1 for kw in PLANNING_KEYWORDS if kw in text),
+        "has_date": has_date,
+        "has_query": has_query,
+        "has_switch": has_switch,
+        "event_type": event_type,
+        "event_date": event_date,
+        "headcount_total": headcount,
+        "departments": [d for d, kws in LEGACY_DEPARTMENT_KEYWORDS.items() if any(kw in text for kw in kws)],
+    }
+
+
+def _corpus():
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+EDGE_CASES = [
+    "",
+    "Xin chào!",
+    "tổ chức concert ngày 25/12/2026 với 80 người, ban hậu cần và marketing",
+    "Hội nghị 2026-03-01 headcount: 120, venue: sảnh tòa học",
+    "ngày 31/02/2026 rồi 2026-02-01",  # invalid DD/MM/YYYY falls through to the next format
+    "31/02/2026 và 01/03/2026",  # only the leftmost DD/MM/YYYY counts, not "1/02/2026"
+    "với 25/12/2024",  # overlapping fields
+    "chuyển sang sự kiện khác",
+    "switch to event 2",
+    "show tasks của sự kiện",
+    "ngày hội việc làm cho sinh viên, 300 người",
+    "bạn có thể tổ chức festival ẩm thực không",
+    "HẬU CẦN, Truyền Thông, kỹ thuật, TÀI CHÍNH",
+    "talkshow hướng nghiệp 50người",
+]
+
+
+@pytest.mark.parametrize("message", EDGE_CASES + _corpus())
+def test_scan_matches_per_pattern_loops(message):
+    signals = scan_message(message)
+    assert {k: signals[k] for k in legacy_signals(message)} == legacy_signals(message)
+
+
+def test_scan_is_cached_and_greeting_only_for_short_messages():
+    assert scan_message("Hello!") is scan_message("Hello!")
+    assert scan_message("Hello!")["is_greeting"]
+    assert not scan_message("hello, tôi muốn tổ chức concert ngày 25/12/2026")["is_greeting"]
+
+
+# (typed without accents, same message with accents)
+UNACCENTED = [
+    ("to chuc concert ngay 25/12/2026 voi 80 nguoi, ban hau can", "tổ chức concert ngày 25/12/2026 với 80 người, ban hậu cần"),
+    ("HAU CAN, truyen thong, ky thuat, tai chinh", "hậu cần, truyền thông, kỹ thuật, tài chính"),
+    ("hoi nghi 2026-03-01 headcount: 120, venue: sanh toa hoc", "hội nghị 2026-03-01 headcount: 120, venue: sảnh tòa học"),
+    ("chuyen sang su kien khac", "chuyển sang sự kiện khác"),
+    ("xem tien do rui ro", "xem tiến độ rủi ro"),
+    ("hậu can va truyen thông", "hậu cần và truyền thông"),  # partly accented
+]
+
+
+@pytest.mark.parametrize("plain, accented", UNACCENTED)
+def test_unaccented_spellings_match_through_folding(plain, accented):
+    keys = ("planning_keyword_count", "has_date", "has_query", "has_switch", "event_type", "event_date",
+            "headcount_total", "departments")
+    assert {k: scan_message(plain)[k] for k in keys} == {k: scan_message(accented)[k] for k in keys}
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "bạn có thể giúp gì",  # "bạn" is not "ban" (department)
+        "làm ngay đi, xong thang trước",  # plain "ngay" / "thang" are other words
+        "tăng thêm một tầng",  # wrong accents: "tăng" is not "tầng"...
+        "giai đoạn cua dự án",
+        "nhac lại giúp mình",
+    ],
+)
+def test_wrong_or_ambiguous_spellings_do_not_count(message):
+    signals = scan_message(message)
+    expected_planning = 1 if "tầng" in message else 0  # ...the real "tầng" still counts
+    assert signals["planning_keyword_count"] == expected_planning
+    assert signals["event_type"] is None and signals["departments"] == [] and not signals["has_query"]
+
+
+def test_accent_stripped_corpus_keeps_fields():
+    for message in _corpus():
+        signals, plain = scan_message(message), scan_message(fold_accents(message))
+        for key in ("has_date", "event_date", "headcount_total", "departments"):
+            assert plain[key] == signals[key], (message, key)
+
+
+def test_decomposed_input_scans_like_composed():
+    message = "Tổ chức hội nghị ngày 25/12/2026 với 80 người, ban Hậu cần"
+    decomposed = unicodedata.normalize("NFD", message)
+    assert decomposed != message
+    assert scan_message(decomposed) == scan_message(message)
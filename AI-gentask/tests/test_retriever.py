@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from services import retriever
+
+
+class StubEmbedder:
+    """Records encode calls; tells the index which texts the vectors stand for"""
+
+    def __init__(self, index):
+        self.index = index
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        self.index.queries = list(texts)
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+
+class StubIndex:
+    """Canned rows per query text: [(doc_id, event_id, distance)]"""
+
+    def __init__(self, rows_by_query):
+        self.rows_by_query = rows_by_query
+        self.calls = []
+        self.queries = []
+
+    def query(self, query_embeddings, n_results, where=None, include=()):
+        self.calls.append({"count": len(query_embeddings), "n_results": n_results, "where": where, "include": list(include)})
+        rows = [self.rows_by_query[q][:n_results] for q in self.queries]
+        return {
+            "ids": [[doc for doc, _, _ in r] for r in rows],
+            "metadatas": [[{"event_id": ev} for _, ev, _ in r] for r in rows],
+            "documents": [[f"text {doc}" for doc, _, _ in r] for r in rows] if "documents" in include else None,
+            "distances": [[dist for _, _, dist in r] for r in rows],
+        }
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    index = StubIndex({
+        "concert": [("c1", "EVT-2", 0.1), ("c2", "EVT-1", 0.2), ("c3", "EVT-1", 0.3), ("c4", None, 0.4)],
+        "hội nghị": [("h1", None, 0.1), ("h2", "EVT-3", 0.2)],
+        "festival": [("f1", None, 0.1), ("f2", None, 0.2), ("f3", None, 0.3)],
+    })
+    embedder = StubEmbedder(index)
+    monkeypatch.setattr(retriever, "_get_embedder", lambda: embedder)
+    monkeypatch.setattr(retriever, "_get_index", lambda: index)
+    return embedder, index
+
+
+def _ids(rows):
+    return [r["doc_id"] for r in rows]
+
+
+def test_one_encode_and_one_query_for_the_batch(stubs):
+    embedder, index = stubs
+    results = retriever.retrieve_docs_batch(
+        [{"query": "concert"}, {"query": "hội nghị"}, {"query": "festival"}], top_k=2, mode="vector"
+    )
+    assert embedder.calls == [["concert", "hội nghị", "festival"]]
+    assert len(index.calls) == 1 and index.calls[0]["count"] == 3 and index.calls[0]["n_results"] == 2
+    # Split back per input, in input order
+    assert [_ids(r) for r in results] == [["c1", "c2"], ["h1", "h2"], ["f1", "f2"]]
+    assert results[0][0] == {"doc_id": "c1", "metadata": {"event_id": "EVT-2", "doc_id": "c1"}, "text": "text c1", "distance": 0.1}
+
+
+def test_event_id_is_a_soft_preference(stubs):
+    _, index = stubs
+    results = retriever.retrieve_docs_batch(
+        [{"query": "concert", "event_id": "EVT-1"}, {"query": "festival", "event_id": "EVT-9"}], top_k=2, mode="vector"
+    )
+    # Over-fetched in the same call: matching docs first, unfiltered top_k as fallback
+    assert index.calls[0]["n_results"] == 2 * retriever.RETRIEVE_OVERFETCH
+    assert _ids(results[0]) == ["c2", "c3"]
+    assert _ids(results[1]) == ["f1", "f2"]
+
+
+def test_inputs_without_query_get_empty_lists(stubs):
+    embedder, index = stubs
+    results = retriever.retrieve_docs_batch([{}, {"query": "festival"}, {"event_name": " "}], top_k=1, mode="vector")
+    assert results == [[], [{"doc_id": "f1", "metadata": {"event_id": None, "doc_id": "f1"}, "text": "text f1", "distance": 0.1}], []]
+    assert embedder.calls == [["festival"]]
+
+
+def test_empty_batch_and_zero_results_touch_nothing(stubs):
+    embedder, index = stubs
+    assert retriever.retrieve_docs_batch([], mode="vector") == []
+    assert retriever.retrieve_docs_batch([{"query": "concert"}, {"query": "festival"}], top_k=0, mode="vector") == [[], []]
+    assert embedder.calls == [] and index.calls == []
+
+
+def test_filters_and_documents_are_passed_to_the_index(stubs):
+    _, index = stubs
+    results = retriever.retrieve_docs_batch(
+        [{"query": "concert"}], top_k=1, filters={"event_type_primary": "concert_opening", "tag_vip": True},
+        include_documents=False, mode="vector",
+    )
+    assert index.calls[0]["where"] == {"$and": [{"event_type_primary": "concert_opening"}, {"tag_vip": True}]}
+    assert index.calls[0]["include"] == ["metadatas", "distances"]
+    assert "text" not in results[0][0]
+
+
+def test_retrieve_docs_is_a_batch_of_one(stubs):
+    embedder, _ = stubs
+    assert _ids(retriever.retrieve_docs({"event_name": "concert", "event_id": "EVT-1"}, top_k=1, mode="vector")) == ["c2"]
+    assert len(embedder.calls) == 1
+
+
+def test_unknown_filter_or_mode_raises(stubs):
+    with pytest.raises(ValueError):
+        retriever.retrieve_docs_batch([{"query": "concert"}], filters={"venue": "x"}, mode="vector")
+    with pytest.raises(ValueError):
+        retriever.retrieve_docs_batch([{"query": "concert"}], mode="semantic")
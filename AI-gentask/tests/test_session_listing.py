@@ -0,0 +1,99 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from services.session_store import InMemorySessionStore, SqliteSessionStore, new_session
+
+
+def _session(turns: int = 1, event: str = "EVT-1"):
+    session = new_session()
+    for i in range(turns):
+        session["messages"].append({"role": "user", "content": f"q{i}", "timestamp": datetime.now().isoformat()})
+    session["current_event"] = event
+    session["events"][event] = {"event_name": "Concert Khai Giảng", "event_date": "2026-12-25", "headcount_total": 80}
+    session["artifacts"][event] = {"version": 1, "etag": "abc", "wbs": {"departments": {"Hậu cần": [{"title": "Thuê âm thanh"}]}}}
+    return session
+
+
+def _walk(store, limit, **filters):
+    """Every listing page until next_cursor is None"""
+    seen, cursor, totals = [], None, set()
+    while True:
+        page = store.list_sessions(limit=limit, cursor=cursor, **filters)
+        assert len(page["sessions"]) <= limit
+        seen.extend(s["session_id"] for s in page["sessions"])
+        totals.add(page["total"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen, totals
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = InMemorySessionStore(max_sessions=0, ttl_secs=0, cold_after_secs=0)
+    else:
+        store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl_secs=0, flush_ms=0)
+    yield store
+    store.close()
+
+
+def test_cursor_walks_every_session_once(store):
+    ids = [f"s{i:02d}" for i in range(11)]
+    for sid in ids:
+        store.save(sid, _session())
+    seen, totals = _walk(store, limit=4)
+    assert seen == ids[::-1]  # most recently active first, no duplicates
+    assert totals == {11}
+
+
+def test_cursor_page_size_divides_total(store):
+    for i in range(6):
+        store.save(f"s{i}", _session())
+    page = store.list_sessions(limit=3)
+    page = store.list_sessions(limit=3, cursor=page["next_cursor"])
+    assert [s["session_id"] for s in page["sessions"]] == ["s2", "s1", "s0"]
+    assert page["next_cursor"] is None
+
+
+def test_cursor_is_stable_when_sessions_are_updated(store):
+    for i in range(6):
+        store.save(f"s{i}", _session())
+    first = store.list_sessions(limit=3)
+    assert [s["session_id"] for s in first["sessions"]] == ["s5", "s4", "s3"]
+    # s1 becomes the most recent: the next page continues after s3 without repeating it
+    store.save("s1", _session(turns=2))
+    second = store.list_sessions(limit=3, cursor=first["next_cursor"])
+    assert [s["session_id"] for s in second["sessions"]] == ["s2", "s0"]
+    assert store.list_sessions(limit=1)["sessions"][0]["message_count"] == 2
+
+
+def test_listing_filters_by_activity(store):
+    for i in range(3):
+        store.save(f"old{i}", _session())
+    time.sleep(0.02)
+    cut = time.time()
+    for i in range(4):
+        store.save(f"new{i}", _session())
+    seen, totals = _walk(store, limit=3, updated_after=cut)
+    assert seen == [f"new{i}" for i in range(3, -1, -1)] and totals == {4}
+    seen, totals = _walk(store, limit=2, updated_before=cut)
+    assert seen == ["old2", "old1", "old0"] and totals == {3}
+
+
+def test_invalid_cursor(store):
+    store.save("s0", _session())
+    with pytest.raises(ValueError):
+        store.list_sessions(cursor="not-a-cursor")
+
+
+def test_capacity_evictions_keep_the_listing_consistent():
+    store = InMemorySessionStore(max_sessions=5, ttl_secs=0, cold_after_secs=0)
+    for i in range(12):
+        store.save(f"s{i:02d}", _session())
+    store.save("s08", _session(turns=2))  # re-saved from the middle of the index
+    seen, totals = _walk(store, limit=2)
+    assert seen == ["s08", "s11", "s10", "s09", "s07"] and totals == {5}
+    assert len(store) == 5 and store.metrics()["evicted_lru"] == 7
+    assert store.metrics()["total_messages"] == 6
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from services.session_store import SessionLocks
+
+
+def test_queued_async_turns_take_one_pool_thread_at_a_time():
+    locks = SessionLocks()
+    active, peak, guard = [0], [0], threading.Lock()
+
+    def turn(i):
+        with locks.hold("s1"):  # what process_message takes inside the threadpool
+            with guard:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.005)
+            with guard:
+                active[0] -= 1
+            return i
+
+    async def locked_turn(i):
+        async with locks.hold_async("s1"):
+            return await run_in_threadpool(turn, i)
+
+    async def main():
+        return await asyncio.gather(*(locked_turn(i) for i in range(20)))
+
+    assert asyncio.run(main()) == list(range(20))
+    assert peak[0] == 1
+    metrics = locks.metrics()
+    assert metrics["queued_async"] == 19
+    assert metrics["contended"] == 0  # nobody waited inside the threadpool
+    assert metrics["in_flight"] == metrics["in_flight_async"] == 0
+
+
+def test_other_sessions_are_not_queued():
+    locks = SessionLocks()
+
+    async def main():
+        async with locks.hold_async("a"):
+            async with locks.hold_async("b"):
+                return locks.metrics()
+
+    metrics = asyncio.run(main())
+    assert metrics["in_flight_async"] == 2 and metrics["queued_async"] == 0
+
+
+def test_cancelled_waiter_releases_its_slot():
+    locks = SessionLocks()
+
+    async def main():
+        async with locks.hold_async("s1"):
+            waiter = asyncio.ensure_future(locks.hold_async("s1").__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        async with locks.hold_async("s1"):  # free again
+            pass
+
+    asyncio.run(main())
+    assert locks.metrics()["in_flight_async"] == 0
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from services.vector_index import NumpyIndex, build_index_dir
+
+
+def _index(tmp_path, n=6, dim=4):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    metadatas = [{"event_id": f"EVT-{i % 2}"} for i in range(n)]
+    build_index_dir(str(tmp_path), [f"d{i}" for i in range(n)], vectors, metadatas, documents=[f"doc {i}" for i in range(n)], hnsw=False)
+    return NumpyIndex(str(tmp_path)), vectors
+
+
+def test_exact_top_k_matches_brute_force(tmp_path):
+    index, vectors = _index(tmp_path)
+    query = vectors[[2, 5]] + 0.01
+    res = index.query(query, n_results=3)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for row, q in zip(res["ids"], query):
+        expected = np.argsort(-(unit @ (q / np.linalg.norm(q))))[:3]
+        assert row == [f"d{i}" for i in expected]
+    assert res["ids"][0][0] == "d2" and res["distances"][0] == sorted(res["distances"][0])
+
+
+def test_where_filters_rows(tmp_path):
+    index, vectors = _index(tmp_path)
+    res = index.query(vectors[:1], n_results=10, where={"event_id": "EVT-1"})
+    assert sorted(res["ids"][0]) == ["d1", "d3", "d5"]
+    assert index.query(vectors[:1], n_results=3, where={"event_id": "EVT-9"})["ids"] == [[]]
+
+
+@pytest.mark.parametrize("n_results", [0, -1])
+def test_no_results_requested(tmp_path, n_results):
+    index, vectors = _index(tmp_path)
+    res = index.query(vectors[:2], n_results=n_results)
+    assert res["ids"] == [[], []] and res["distances"] == [[], []]
+
+
+def test_empty_index_returns_empty_hits(tmp_path):
+    build_index_dir(str(tmp_path), [], [], [], hnsw=False)
+    index = NumpyIndex(str(tmp_path))
+    assert index.count() == 0
+    res = index.query(np.ones((2, 4), dtype=np.float32), n_results=5)
+    assert res == {"ids": [[], []], "metadatas": [[], []], "documents": [[], []], "distances": [[], []]}
+    assert index.query(np.ones((1, 4)), n_results=5, where={"event_id": "EVT-1"})["ids"] == [[]]
@@ -0,0 +1,42 @@
+"""
+Text Normalize - accent folding and tokenization for Vietnamese text
+"giấy phép công an" and "giay phep cong an" normalize to the same tokens
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List
+
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# đ/Đ are base letters, not combining marks, so NFD does not strip them
+_EXTRA_FOLD = str.maketrans({"đ": "d", "Đ": "d"})
+
+
+@lru_cache(maxsize=4096)
+def _fold_word(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text.translate(_EXTRA_FOLD))
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def fold_accents(text: str) -> str:
+    """
+    Lowercase and strip Vietnamese diacritics
+
+    Examples:
+        >>> fold_accents("Hậu Cần")
+        "hau can"
+        >>> fold_accents("Đối ngoại")
+        "doi ngoai"
+    """
+    text = (text or "").lower()
+    if text.isascii():
+        return text
+    return " ".join(_fold_word(w) if not w.isascii() else w for w in text.split(" "))
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded word tokens"""
+    return _TOKEN_RE.findall(fold_accents(text))